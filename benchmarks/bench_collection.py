@@ -0,0 +1,183 @@
+# Сквозной замер сбора на локальной замене API: get_vacancies_by_parts (и параллельный сбор) + clear_data.
+# Печатает запросы в секунду, вакансии в секунду и пиковое потребление памяти каждого сценария.
+# Запуск из корня репозитория: python -m benchmarks.bench_collection --days 10 --error-rate 0.02
+import argparse
+import datetime
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from benchmarks import mock_hh_server
+
+SCENARIOS = ["by_parts", "concurrent"]
+
+
+def free_port():
+    """
+    Свободный порт на localhost.
+    :return: Номер порта.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_result(worker, results, timeout):
+    """
+    Ждет результат сценария, пока процесс сценария жив, но не дольше timeout.
+    :param worker: Процесс сценария.
+    :param results: Очередь результатов.
+    :param timeout: Сколько ждать в секундах.
+    :return: Словарь результата или None, если процесс упал или не уложился во время.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if not worker.is_alive():
+                break
+    # процесс мог успеть положить результат прямо перед выходом
+    try:
+        return results.get(timeout=1)
+    except queue.Empty:
+        return None
+
+
+def wait_for_port(port, timeout=10.0):
+    """
+    Ждет, пока сервер начнет принимать соединения.
+    :param port: Порт.
+    :param timeout: Сколько ждать в секундах.
+    :return: Ничего
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Сервер на порту {port} не запустился")
+
+
+def peak_rss_mb():
+    """
+    Пиковое потребление памяти текущим процессом.
+    :return: Мегабайты или nan, если модуля resource нет (Windows).
+    """
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # в macOS ru_maxrss в байтах, в Linux - в килобайтах
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def run_scenario(scenario, api_url, args, results):
+    """
+    Выполняет один сценарий в отдельном процессе, чтобы пиковая память не смешивалась между сценариями.
+    :param scenario: "by_parts" - последовательный get_vacancies_by_parts по отраслям,
+    "concurrent" - get_vacancies_by_parts_concurrently.
+    :param api_url: Адрес локального сервера.
+    :param args: Аргументы командной строки.
+    :param results: Очередь для результата.
+    :return: Ничего
+    """
+    # модули сборщика читают HH_API_URL при импорте, поэтому импортируются только после его установки
+    os.environ["HH_API_URL"] = api_url
+    import parser
+    from python_modules import http_client
+
+    parser.PAGE_DELAY = (0, 0)
+    until_date = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    from_date = until_date - datetime.timedelta(days=args.days)
+    # у отраслей с большими номерами больше всего вакансий
+    industry_ids = [str(args.mock_industries - i) for i in range(args.industries)]
+
+    start = time.perf_counter()
+    if scenario == "by_parts":
+        vacancies = []
+        for industry_id in industry_ids:
+            vacancies.extend(parser.get_vacancies_by_parts(args.area, industry_id, from_date, until_date,
+                                                           args.parts))
+    else:
+        collected = parser.get_vacancies_by_parts_concurrently(args.area, industry_ids, from_date, until_date,
+                                                               args.parts, args.concurrency,
+                                                               args.requests_per_second)
+        vacancies = [vac for industry_vacancies in collected.values() for vac in industry_vacancies]
+    fetch_time = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cleared = parser.clear_data(vacancies, os.path.join(cache_dir, "employers.sqlite"),
+                                    concurrency=args.concurrency, requests_per_second=args.requests_per_second)
+    total_time = time.perf_counter() - start
+
+    metrics = http_client.get_client().metrics.summary()
+    results.put({
+        "scenario": scenario,
+        "vacancies": len(cleared),
+        "requests": sum(stats["requests"] for stats in metrics.values()),
+        "retries": sum(stats["retries"] for stats in metrics.values()),
+        "errors": sum(stats["errors"] for stats in metrics.values()),
+        "fetch_time": fetch_time,
+        "total_time": total_time,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Сквозной замер сбора вакансий на локальном сервере")
+    arg_parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    arg_parser.add_argument("--area", default="1")
+    arg_parser.add_argument("--industries", type=int, default=3, help="сколько отраслей собирать")
+    arg_parser.add_argument("--days", type=int, default=10)
+    arg_parser.add_argument("--parts", type=int, default=5, help="number_of_parts для get_vacancies_by_parts")
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    arg_parser.add_argument("--requests-per-second", type=float, default=100)
+    arg_parser.add_argument("--mock-industries", type=int, default=mock_hh_server.DEFAULT_CONFIG["industries"])
+    arg_parser.add_argument("--vacancies-per-day", type=int, default=300)
+    arg_parser.add_argument("--employers", type=int, default=500)
+    arg_parser.add_argument("--latency", type=float, default=0.02)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--throttle-rate", type=float, default=0.0)
+    arg_parser.add_argument("--timeout", type=float, default=600, help="сколько ждать один сценарий в секундах")
+    args = arg_parser.parse_args()
+
+    # spawn дает каждому сценарию чистый процесс без памяти родителя
+    context = multiprocessing.get_context("spawn")
+    port = free_port()
+    server = context.Process(target=mock_hh_server.serve, daemon=True, args=(port,), kwargs={
+        "industries": args.mock_industries, "vacancies_per_day": args.vacancies_per_day,
+        "employers": args.employers, "latency": args.latency, "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate})
+    server.start()
+    try:
+        wait_for_port(port)
+        results = context.Queue()
+        for scenario in args.scenarios:
+            worker = context.Process(target=run_scenario, args=(scenario, f"http://127.0.0.1:{port}", args, results))
+            worker.start()
+            result = wait_for_result(worker, results, args.timeout)
+            if result is None:
+                # зависший сценарий не должен блокировать остальные
+                worker.terminate()
+                worker.join()
+                print(f"{scenario}: сценарий не вернул результат, код выхода {worker.exitcode}")
+                continue
+            worker.join()
+            print(f"{result['scenario']}: вакансий {result['vacancies']}, запросов {result['requests']} "
+                  f"(повторов {result['retries']}, ошибок {result['errors']}), "
+                  f"сбор {result['fetch_time']:.2f} с, всего {result['total_time']:.2f} с, "
+                  f"{result['requests'] / result['total_time']:.1f} запросов/с, "
+                  f"{result['vacancies'] / result['total_time']:.1f} вакансий/с, "
+                  f"пик памяти {result['peak_rss_mb']:.1f} МБ")
+    finally:
+        server.terminate()
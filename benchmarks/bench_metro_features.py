@@ -0,0 +1,48 @@
+# Сравнение построчного и пакетного подсчета признаков метро.
+# Запуск из корня репозитория: python -m benchmarks.bench_metro_features
+import time
+
+import numpy as np
+import pandas as pd
+
+from python_modules import preprocess
+
+
+def random_points(n, seed=123):
+    """
+    Случайные точки в прямоугольнике вокруг Москвы.
+    :param n: Количество точек.
+    :param seed: Зерно генератора.
+    :return: DataFrame со столбцами lat и lon.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"lat": rng.uniform(55.1, 56.1, n), "lon": rng.uniform(36.8, 38.2, n)})
+
+
+def bench_scalar(points, stations):
+    start = time.perf_counter()
+    result = points.apply(
+        lambda row: pd.Series(preprocess.get_stations_count_and_distance_to_nearest(row, stations)), axis=1)
+    return time.perf_counter() - start, result
+
+
+def bench_batch(points, stations_index):
+    start = time.perf_counter()
+    result = preprocess.get_stations_features(points["lat"], points["lon"], stations_index=stations_index)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    stations = np.load("src_files/stations.npy")
+    stations_index = preprocess.build_stations_index(stations)
+
+    points = random_points(2000)
+    scalar_time, scalar_result = bench_scalar(points, stations)
+    batch_time, batch_result = bench_batch(points, stations_index)
+    scalar_result = scalar_result.astype(float).to_numpy()
+    same = np.allclose(scalar_result, batch_result.to_numpy(), rtol=0, atol=1e-6, equal_nan=True)
+    print(f"2000 точек: построчно {scalar_time:.3f} с, пакетно {batch_time:.3f} с, результаты совпадают: {same}")
+
+    for n in [10_000, 100_000, 1_000_000, 5_000_000]:
+        batch_time, _ = bench_batch(random_points(n), stations_index)
+        print(f"{n} точек: пакетно {batch_time:.3f} с ({n / batch_time:.0f} точек/с)")
@@ -0,0 +1,66 @@
+# Сравнение отбора гиперпараметров как в ноутбуке (GridSearchCV с cv=5 и n_jobs=-1 для каждой модели по очереди)
+# с model_search.run_search (последовательное деление пополам, общие фолды и один пул процессов).
+# Сетки уменьшены, чтобы замер шел минуты, а не часы.
+# Запуск из корня репозитория: python -m benchmarks.bench_model_search
+import time
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.model_selection import GridSearchCV, train_test_split
+
+from python_modules import model_search
+
+GRIDS = {
+    "random_forest_regressor": {"n_estimators": [10, 30], "max_depth": [None, 10],
+                                "min_samples_leaf": [1, 4], "max_features": [10, "sqrt"]},
+    "random_forest_classifier": {"n_estimators": [10, 30], "max_depth": [None, 10],
+                                 "min_samples_leaf": [1, 4], "max_features": [10, "sqrt"]},
+    "knn_regressor": {"n_neighbors": [5, 10, 50, 100, 250], "weights": ["uniform", "distance"]},
+    "logistic_regression": {"C": [0.01, 0.1, 1, 10], "solver": ["saga"]},
+    "categorical_nb": {"alpha": [0.1, 0.5, 1.0]},
+}
+
+
+def random_features(n=6000, numeric_count=7, categories=(10, 40, 6, 5), seed=123):
+    """
+    Случайная матрица в виде feature_matrix.build_feature_matrix: числовые столбцы и one-hot блоки категорий,
+    зарплата зависит от части признаков.
+    :return: Кортеж (матрица, зарплаты, отрасли).
+    """
+    rng = np.random.default_rng(seed)
+    numeric = rng.normal(size=(n, numeric_count))
+    codes = [rng.integers(0, size, n) for size in categories]
+    blocks = [sp.csr_matrix(numeric)]
+    for size, code in zip(categories, codes):
+        blocks.append(sp.csr_matrix((np.ones(n), (np.arange(n), code)), shape=(n, size)))
+    log_salary = 11 + 0.2 * numeric[:, 0] + 0.05 * codes[0] + 0.01 * codes[1] + rng.normal(0, 0.25, n)
+    return sp.hstack(blocks, format="csr"), np.exp(log_salary), np.array([f"Отрасль {code}" for code in codes[0]])
+
+
+def notebook_search(X, y, numeric_count, spaces):
+    """
+    Модели по очереди, у каждой GridSearchCV(cv=5, n_jobs=-1) на всей обучающей выборке.
+    """
+    for space in spaces.values():
+        target = model_search.make_target(y, space["task"])
+        X_space = model_search.space_matrix(X, space, numeric_count)
+        x_train, _, y_train, _ = train_test_split(X_space, target, test_size=0.2, random_state=123)
+        GridSearchCV(space["estimator"], space["params"], cv=5, n_jobs=-1).fit(x_train, y_train)
+
+
+if __name__ == '__main__':
+    warnings.simplefilter("ignore")
+    numeric_count = 7
+    X, y, industry = random_features(numeric_count=numeric_count)
+    spaces = {name: {**space, "params": GRIDS[name]} for name, space in model_search.SEARCH_SPACES.items()}
+
+    start = time.perf_counter()
+    notebook_search(X, y, numeric_count, spaces)
+    grid_time = time.perf_counter() - start
+
+    result = model_search.run_search(X, y, industry, numeric_count, spaces)
+    fits = len(result["history"])
+    print(f"{X.shape[0]} вакансий, {X.shape[1]} признаков: GridSearchCV по очереди {grid_time:.1f} с, "
+          f"run_search {result['elapsed']:.1f} с ({fits} обучений на фолдах)")
+    print(result["report"].round(3).to_string())
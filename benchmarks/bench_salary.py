@@ -0,0 +1,50 @@
+# Сравнение построчного и векторизованного подсчета зарплаты.
+# Запуск из корня репозитория: python -m benchmarks.bench_salary
+import time
+
+import numpy as np
+import pandas as pd
+
+from python_modules import preprocess
+
+
+def random_salaries(n, seed=123):
+    """
+    Случайный столбец salary в формате API: часть вакансий с одним порогом, часть с двумя.
+    :param n: Количество вакансий.
+    :param seed: Зерно генератора.
+    :return: Series со словарями.
+    """
+    rng = np.random.default_rng(seed)
+    value_from = rng.integers(20, 300, n) * 1000
+    value_to = value_from + rng.integers(0, 100, n) * 1000
+    kind = rng.integers(0, 3, n)
+    gross = rng.integers(0, 2, n).astype(bool)
+    cells = []
+    for i in range(n):
+        cells.append({
+            "from": int(value_from[i]) if kind[i] != 1 else None,
+            "to": int(value_to[i]) if kind[i] != 0 else None,
+            "currency": "RUR",
+            "gross": bool(gross[i]),
+        })
+    return pd.Series(cells)
+
+
+if __name__ == '__main__':
+    for n in [10_000, 100_000, 1_000_000]:
+        salaries = random_salaries(n)
+        start = time.perf_counter()
+        scalar = salaries.apply(preprocess.get_net_salary).astype(float)
+        scalar_time = time.perf_counter() - start
+        start = time.perf_counter()
+        vectorized = preprocess.get_net_salary_vectorized(salaries)
+        vectorized_time = time.perf_counter() - start
+        unpacked = preprocess.unpack_salary(salaries)
+        start = time.perf_counter()
+        flat = preprocess.get_net_salary_vectorized(unpacked)
+        flat_time = time.perf_counter() - start
+        same = np.allclose(scalar.to_numpy(), vectorized.to_numpy(), equal_nan=True) and \
+            np.allclose(scalar.to_numpy(), flat.to_numpy(), equal_nan=True)
+        print(f"{n} вакансий: построчно {scalar_time:.3f} с, векторизованно по словарям {vectorized_time:.3f} с, "
+              f"по плоским столбцам {flat_time:.4f} с, результаты совпадают: {same}")
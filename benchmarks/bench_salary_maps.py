@@ -0,0 +1,81 @@
+# Сравнение прежней отрисовки карт зарплат (проход по датасету на каждый округ, перепроецирование
+# и полноразмерная фигура pyplot на каждую отрасль) с пакетной render_salary_maps.
+# Запуск из корня репозитория: python -m benchmarks.bench_salary_maps
+import os
+import tempfile
+import time
+
+import geopandas as gpd
+import matplotlib
+import numpy as np
+import pandas as pd
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from python_modules import visualization
+
+DISTRICTS_PATH = "src_files/atd/mo.shp"
+
+
+def random_datasets(mo_gdf, industries=6, n=200_000, seed=123):
+    """
+    Случайные датасеты с округами и зарплатами.
+    :param mo_gdf: Таблица районов, из нее берутся названия округов и районов.
+    :param industries: Количество отраслей.
+    :param n: Количество вакансий в отрасли.
+    :param seed: Зерно генератора.
+    :return: Список DataFrame.
+    """
+    rng = np.random.default_rng(seed)
+    rows = mo_gdf[["ABBREV_AO", "NAME"]].to_numpy()
+    datasets = []
+    for i in range(industries):
+        picked = rows[rng.integers(0, len(rows), n)]
+        datasets.append(pd.DataFrame({"industry": f"Отрасль {i}", "AO": picked[:, 0], "district": picked[:, 1],
+                                      "salary": rng.lognormal(11, 0.5, n)}))
+    return datasets
+
+
+def legacy_render(given_datasets, mo_gdf, output_dir):
+    """
+    Прежняя visualize_avg_salary_in_moscow с сохранением каждой карты в файл.
+    """
+    for dataset in given_datasets:
+        avg_salaries = {ao: dataset.loc[dataset["AO"] == ao, "salary"].mean() for ao in mo_gdf["ABBREV_AO"].unique()}
+        df_to_salary = mo_gdf[["ABBREV_AO", "geometry"]].copy()
+        df_to_salary["avg_salary"] = df_to_salary["ABBREV_AO"].map(avg_salaries)
+        salaries = df_to_salary.to_crs(epsg='3857')
+        fig, ax = plt.subplots(figsize=(15, 15))
+        salaries.plot(column='avg_salary', linewidth=0.5, cmap='plasma', legend=True, ax=ax)
+        plt.title(f'Зарплаты по районам Москвы для {dataset["industry"][0]}')
+        fig.savefig(os.path.join(output_dir, f"{dataset['industry'][0]}.png"))
+        plt.close(fig)
+
+
+if __name__ == '__main__':
+    mo_gdf = gpd.read_file(DISTRICTS_PATH)
+    datasets = random_datasets(mo_gdf)
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        legacy_render(datasets, mo_gdf, output_dir)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        visualization.aggregate_salaries(datasets)
+        aggregate_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        visualization.render_salary_maps(datasets, mo_gdf, output_dir, processes=1)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        visualization.render_salary_maps(datasets, mo_gdf, output_dir)
+        pool_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        visualization.render_salary_maps(datasets, mo_gdf, output_dir, by_district=True)
+        district_time = time.perf_counter() - start
+    print(f"{len(datasets)} отраслей по {len(datasets[0])} вакансий: прежняя отрисовка {legacy_time:.2f} с, "
+          f"агрегация {aggregate_time:.3f} с, пакетно в одном процессе {serial_time:.2f} с, "
+          f"в пуле процессов {pool_time:.2f} с, по муниципальным районам в пуле {district_time:.2f} с")
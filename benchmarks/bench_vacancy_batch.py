@@ -0,0 +1,66 @@
+# Память на вакансию: список словарей после clear_data, VacancyBatch и DataFrame из него.
+# Запуск из корня репозитория: python -m benchmarks.bench_vacancy_batch
+import datetime
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import parser
+from benchmarks import mock_hh_server
+from python_modules import employers
+from python_modules import vacancy_batch
+
+
+def generate_cleaned(n, cache_path):
+    """
+    Вакансии в том виде, в котором их возвращает clear_data. Сырые вакансии берутся из данных локального
+    сервера и проходят через json, как ответ API, а работодатели заранее кладутся в кэш, чтобы не было запросов.
+    :param n: Количество вакансий (примерно).
+    :param cache_path: Путь до временного кэша работодателей.
+    :return: Список словарей.
+    """
+    fixtures = mock_hh_server.Fixtures({**mock_hh_server.DEFAULT_CONFIG, "vacancies_per_day": n // 30})
+    until_date = datetime.datetime(2024, 3, 1)
+    found = fixtures.search("1", "10", until_date - datetime.timedelta(days=30), until_date)
+    raw = json.loads(json.dumps([fixtures.vacancy("1", "10", *item) for item in found], ensure_ascii=False))
+    connection = employers.open_cache(cache_path)
+    employer_ids = {vac["employer"]["id"] for vac in raw}
+    employers.write_cached(connection, {emp_id: fixtures.employer(emp_id) for emp_id in employer_ids})
+    connection.close()
+    return parser.clear_data(raw, cache_path)
+
+
+def measure(build):
+    """
+    Память, которую занимает результат build, по tracemalloc.
+    :param build: Функция без аргументов.
+    :return: Кортеж (результат, байты, секунды).
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache_path = os.path.join(cache_dir, "employers.sqlite")
+        for n in [10_000, 100_000]:
+            # словари измеряются через повторный разбор json, чтобы строки не разделялись с генератором
+            dumped = json.dumps(generate_cleaned(n, cache_path), ensure_ascii=False)
+            vacancies, dict_bytes, _ = measure(lambda: json.loads(dumped))
+            count = len(vacancies)
+            batch, batch_bytes, batch_time = measure(lambda: vacancy_batch.VacancyBatch.from_vacancies(vacancies))
+            df, df_bytes, df_time = measure(batch.to_dataframe)
+            print(f"{count} вакансий: словари {dict_bytes / count:.0f} Б/вакансию, "
+                  f"VacancyBatch {batch_bytes / count:.0f} Б/вакансию ({batch_time:.2f} с), "
+                  f"DataFrame {df_bytes / count:.0f} Б/вакансию ({df_time:.3f} с), "
+                  f"в {dict_bytes / batch_bytes:.0f} раз меньше словарей")
+            del vacancies, batch, df
@@ -0,0 +1,333 @@
+# Локальная замена api.hh.ru для замеров и проверки сборщика без обращений к настоящему API.
+# Отдает /industries, /vacancies, /employers/{id} и /metro/{id} из сгенерированных данных.
+# Запуск из корня репозитория: python -m benchmarks.mock_hh_server --port 8000 --latency 0.05
+# после чего сборщик направляется на него переменной окружения HH_API_URL=http://127.0.0.1:8000
+import argparse
+import datetime
+import functools
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+# API отдает не больше 2000 вакансий на один поиск
+MAX_RESULTS = 2000
+MAX_PER_PAGE = 100
+DEFAULT_CONFIG = {
+    # количество отраслей верхнего уровня и подотраслей у каждой
+    "industries": 10,
+    "sub_industries": 3,
+    # среднее количество вакансий отрасли в день, у отраслей оно разное: от rate / industries до rate
+    "vacancies_per_day": 300,
+    "employers": 2000,
+    # задержка ответа в секундах и ее случайная добавка
+    "latency": 0.02,
+    "latency_jitter": 0.01,
+    # доля ответов 503 и доля ответов 403/429 с заголовком Retry-After
+    "error_rate": 0.0,
+    "throttle_rate": 0.0,
+    "retry_after": 0,
+    "seed": 0,
+}
+SALARY_CURRENCIES = ["RUR", "RUR", "RUR", "RUR", "USD", "EUR"]
+SCHEDULES = ["Полный день", "Удаленная работа", "Гибкий график", "Сменный график"]
+EXPERIENCES = ["Нет опыта", "От 1 года до 3 лет", "От 3 до 6 лет", "Более 6 лет"]
+EMPLOYMENTS = ["Полная занятость", "Частичная занятость", "Проектная работа"]
+ROLES = ["Программист, разработчик", "Менеджер по продажам", "Бухгалтер", "Водитель", "Аналитик"]
+
+
+def seed_for(*parts):
+    """
+    Детерминированное зерно генератора по набору значений, одинаковое между запусками.
+    :param parts: Значения, из которых собирается зерно.
+    :return: Целое число.
+    """
+    return zlib.crc32(":".join(map(str, parts)).encode())
+
+
+class Fixtures:
+    """
+    Сгенерированные данные сервера. Все ответы зависят только от настроек и параметров запроса,
+    так что повторный запрос той же страницы возвращает те же вакансии.
+    """
+
+    def __init__(self, config):
+        """
+        :param config: Настройки из DEFAULT_CONFIG.
+        """
+        self.config = config
+        self.industries = []
+        self.weights = {}
+        for i in range(config["industries"]):
+            industry_id = str(i + 1)
+            subs = [{"id": f"{industry_id}.{j + 1}", "name": f"Подотрасль {industry_id}.{j + 1}"}
+                    for j in range(config["sub_industries"])]
+            self.industries.append({"id": industry_id, "name": f"Отрасль {industry_id}", "industries": subs})
+            self.weights[industry_id] = (i + 1) / config["industries"]
+            for j, sub in enumerate(subs):
+                self.weights[sub["id"]] = self.weights[industry_id] / (j + 2)
+        self.industry_index = {industry_id: idx for idx, industry_id in enumerate(self.weights)}
+
+    @functools.lru_cache(maxsize=4096)
+    def day_times(self, area_id, industry_id, day):
+        """
+        Время публикации вакансий отрасли за день.
+        :param area_id: Регион.
+        :param industry_id: Отрасль.
+        :param day: Порядковый номер дня (date.toordinal()).
+        :return: Отсортированный массив секунд от начала дня.
+        """
+        rng = np.random.default_rng(seed_for(self.config["seed"], area_id, industry_id, day))
+        count = rng.poisson(self.config["vacancies_per_day"] * self.weights.get(industry_id, 0))
+        return np.sort(rng.integers(0, 24 * 60 * 60, count))
+
+    def search(self, area_id, industry_id, from_date, until_date):
+        """
+        Вакансии отрасли в промежутке [from_date, until_date).
+        :param area_id: Регион.
+        :param industry_id: Отрасль.
+        :param from_date: Начало промежутка.
+        :param until_date: Конец промежутка.
+        :return: Список кортежей (порядковый номер дня, номер вакансии в дне, секунды от начала дня).
+        """
+        found = []
+        for day in range(from_date.toordinal(), until_date.toordinal() + 1):
+            day_start = datetime.datetime.fromordinal(day)
+            times = self.day_times(area_id, industry_id, day)
+            low = max(0.0, (from_date - day_start).total_seconds())
+            high = min(24 * 60 * 60, (until_date - day_start).total_seconds())
+            if high <= low:
+                continue
+            first, last = np.searchsorted(times, [low, high])
+            found.extend((day, idx, int(times[idx])) for idx in range(first, last))
+        return found
+
+    def vacancy(self, area_id, industry_id, day, idx, seconds):
+        """
+        Вакансия в формате ответа /vacancies.
+        :return: Словарь.
+        """
+        vacancy_id = f"{day}{self.industry_index.get(industry_id, 0):03d}{idx:05d}"
+        rng = random.Random(seed_for(self.config["seed"], area_id, vacancy_id))
+        salary_from = rng.randrange(20, 400) * 1000
+        salary = {"from": salary_from if rng.random() < 0.8 else None,
+                  "to": salary_from + rng.randrange(0, 100) * 1000 if rng.random() < 0.6 else None,
+                  "currency": rng.choice(SALARY_CURRENCIES), "gross": rng.random() < 0.5}
+        if salary["from"] is None and salary["to"] is None:
+            salary["from"] = salary_from
+        published_at = datetime.datetime.fromordinal(day) + datetime.timedelta(seconds=seconds)
+        address = None
+        if rng.random() < 0.7:
+            address = {"lat": 55.75 + rng.gauss(0, 0.1), "lng": 37.62 + rng.gauss(0, 0.15)}
+        contacts = None
+        if rng.random() < 0.3:
+            contacts = {"email": "hr@example.com" if rng.random() < 0.5 else None,
+                        "phones": [{"number": "0000000"}] * rng.randrange(0, 3)}
+        return {
+            "id": vacancy_id,
+            "name": f"Вакансия {vacancy_id}",
+            "area": {"id": str(area_id)},
+            "published_at": published_at.strftime("%Y-%m-%dT%H:%M:%S+0300"),
+            "is_adv_vacancy": False,
+            "employment": {"name": rng.choice(EMPLOYMENTS)},
+            "experience": {"name": rng.choice(EXPERIENCES)},
+            "accept_incomplete_resumes": rng.random() < 0.2,
+            "accept_temporary": rng.random() < 0.2,
+            "working_time_modes": [],
+            "working_time_intervals": [],
+            "working_days": [],
+            "schedule": {"name": rng.choice(SCHEDULES)},
+            "employer": {"id": str(rng.randrange(1, self.config["employers"] + 1)), "trusted": rng.random() < 0.9},
+            "address": address,
+            "salary": salary,
+            "response_letter_required": rng.random() < 0.1,
+            "has_test": rng.random() < 0.1,
+            "department": None,
+            "premium": rng.random() < 0.05,
+            "professional_roles": [{"id": "1", "name": rng.choice(ROLES)}],
+            "contacts": contacts,
+            "type": {"id": "open", "name": "Открытая"},
+            "archived": False,
+            "snippet": {"requirement": "Опыт работы " * 10, "responsibility": "Обязанности " * 10},
+        }
+
+    def employer(self, employer_id):
+        """
+        Работодатель в формате ответа /employers/{id}.
+        :return: Словарь.
+        """
+        rng = random.Random(seed_for(self.config["seed"], "employer", employer_id))
+        return {"id": employer_id, "name": f"Работодатель {employer_id}", "trusted": True,
+                "type": rng.choice(["company", "agency", "private_recruiter"]),
+                "industries": [{"id": industry["id"]} for industry in
+                               rng.sample(self.industries, min(len(self.industries), rng.randrange(1, 4)))],
+                "open_vacancies": rng.randrange(1, 200)}
+
+    def metro(self, city_id):
+        """
+        Линии и станции метро в формате ответа /metro/{city_id}.
+        :return: Словарь.
+        """
+        rng = random.Random(seed_for(self.config["seed"], "metro", city_id))
+        lines = []
+        for line_idx in range(12):
+            angle = rng.uniform(0, 2 * math.pi)
+            stations = [{"id": f"{line_idx + 1}.{station_idx + 1}", "name": f"Станция {line_idx + 1}.{station_idx + 1}",
+                         "lat": 55.75 + math.sin(angle) * 0.012 * (station_idx - 10),
+                         "lng": 37.62 + math.cos(angle) * 0.02 * (station_idx - 10)}
+                        for station_idx in range(20)]
+            lines.append({"id": str(line_idx + 1), "name": f"Линия {line_idx + 1}", "stations": stations})
+        return {"id": str(city_id), "name": "Город", "lines": lines}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик запросов. Данные и настройки берутся у сервера (self.server.fixtures).
+    """
+
+    def log_message(self, format, *args):
+        # журнал запросов только замедлял бы замеры
+        pass
+
+    def send_json(self, body, status=200, headers=None):
+        """
+        Отправляет ответ в формате json.
+        :param body: Тело ответа.
+        :param status: HTTP-статус.
+        :param headers: Дополнительные заголовки.
+        :return: Ничего
+        """
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        """
+        Отвечает на запрос с заданной задержкой, иногда ошибкой, иначе данными из Fixtures.
+        :return: Ничего
+        """
+        fixtures = self.server.fixtures
+        config = fixtures.config
+        self.server.count_request()
+        time.sleep(config["latency"] + random.uniform(0, config["latency_jitter"]))
+        roll = random.random()
+        if roll < config["error_rate"]:
+            return self.send_json({"errors": [{"type": "service_unavailable"}]}, 503)
+        if roll < config["error_rate"] + config["throttle_rate"]:
+            # hh.ru при слишком частых запросах отвечает 403, а иногда 429
+            status = 429 if random.random() < 0.5 else 403
+            return self.send_json({"errors": [{"type": "too_many_requests"}]}, status,
+                                  {"Retry-After": str(config["retry_after"])})
+
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if path == "/industries":
+            return self.send_json(fixtures.industries)
+        if path == "/vacancies":
+            return self.vacancies(fixtures, query)
+        if path.startswith("/employers/"):
+            return self.send_json(fixtures.employer(path.rsplit("/", 1)[1]))
+        if path.startswith("/metro/"):
+            return self.send_json(fixtures.metro(path.rsplit("/", 1)[1]))
+        return self.send_json({"errors": [{"type": "not_found"}]}, 404)
+
+    def vacancies(self, fixtures, query):
+        """
+        Ответ /vacancies: поиск по региону, отрасли и промежутку с постраничной выдачей.
+        :param fixtures: Данные сервера.
+        :param query: Параметры запроса.
+        :return: Ничего
+        """
+        try:
+            page = int(query.get("page", 0))
+            per_page = int(query.get("per_page", 20))
+            from_date = datetime.datetime.fromisoformat(query["date_from"])
+            until_date = datetime.datetime.fromisoformat(query["date_to"])
+        except (KeyError, ValueError):
+            return self.send_json({"errors": [{"type": "bad_argument"}]}, 400)
+        if per_page > MAX_PER_PAGE or page < 0 or per_page < 0:
+            return self.send_json({"errors": [{"type": "bad_argument", "value": "per_page"}]}, 400)
+        # как и настоящее API, дальше первых 2000 результатов листать нельзя
+        if (page + 1) * per_page > MAX_RESULTS:
+            return self.send_json({"errors": [{"type": "bad_argument", "value": "page"}]}, 400)
+        area_id, industry_id = query.get("area", "1"), query.get("industry", "")
+        found = fixtures.search(area_id, industry_id, from_date, until_date)
+        pages = min(math.ceil(len(found) / per_page), MAX_RESULTS // per_page) if per_page else 0
+        items = [fixtures.vacancy(area_id, industry_id, *item)
+                 for item in found[page * per_page:(page + 1) * per_page]] if per_page else []
+        return self.send_json({"items": items, "found": len(found), "pages": pages, "page": page,
+                               "per_page": per_page})
+
+
+class MockHHServer(ThreadingHTTPServer):
+    """
+    Сервер, который можно запустить в фоновом потоке (start) или как отдельную программу.
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, host="127.0.0.1", port=0, **config):
+        """
+        :param host: Адрес.
+        :param port: Порт, 0 - любой свободный.
+        :param config: Настройки, переопределяющие DEFAULT_CONFIG.
+        """
+        super().__init__((host, port), MockHandler)
+        self.fixtures = Fixtures({**DEFAULT_CONFIG, **config})
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        """
+        Адрес сервера.
+        """
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count_request(self):
+        """
+        Учитывает запрос в общем счетчике.
+        """
+        with self.lock:
+            self.requests += 1
+
+    def start(self):
+        """
+        Запускает сервер в фоновом потоке.
+        :return: Адрес сервера для HH_API_URL.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.url
+
+
+def serve(port, **config):
+    """
+    Запускает сервер в текущем потоке, пока процесс не остановят. Удобно как target для multiprocessing.Process.
+    :param port: Порт.
+    :param config: Настройки, переопределяющие DEFAULT_CONFIG.
+    :return: Ничего
+    """
+    MockHHServer(port=port, **config).serve_forever()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Локальная замена api.hh.ru")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    for key, value in DEFAULT_CONFIG.items():
+        arg_parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = vars(arg_parser.parse_args())
+    port = args.pop("port")
+    print(f"Сервер запущен: http://127.0.0.1:{port}")
+    serve(port, **args)
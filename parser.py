@@ -1,90 +1,37 @@
 # import libraries
-import requests
-import json
+import argparse
 import datetime
 import os
 import pathlib
 import tqdm
 import numpy as np
 import time
-from requests import HTTPError
+from python_modules import async_fetcher
+from python_modules import crawl_state
+from python_modules import dataset_store
+from python_modules import employers
+from python_modules import http_client
+from python_modules import industries
+from python_modules import instrumentation
+from python_modules import metro
+from python_modules import partitioner
+
+# пауза между страницами в get_vacancies, секунды (от, до)
+PAGE_DELAY = (0.5, 2)
 
 
 def get_top_k_industries(k, area_id, since_date, until_date):
     """
     Возвращает топ-K отраслей по количеству найденных вакансий.
+    Количество вакансий всех отраслей и подотраслей запрашивается параллельно и кэшируется
+    для региона и промежутка, см. python_modules/industries.py.
     :param k: Количество отраслей для возврата.
     :param area_id: Идентификатор района https://github.com/hhru/api/blob/master/docs/areas.md
     :param since_date: Дата, с которой начать поиск отраслей.
     :param until_date: Дата, до которой вести поиск отраслей.
     :return: Массив из топ-K отраслей в формате [(количество_вакансий, идентификатор_отрасли, название_отрасли)]
     """
-    url_industry = 'https://api.hh.ru/industries'
-    url_vacancies = 'https://api.hh.ru/vacancies'
-    params = {
-    }
-    headers = {
-        'HH-User-Agent': 'my-app/0.0.1'
-    }
-    # получение всех отраслей
-    industries = []
-    retry_count = 5
-    retry_delay = 1  # задержка между повторными запросами
-
-    for _ in range(retry_count):
-        try:
-            industries_response = requests.get(url_industry, params=params, headers=headers)
-            industries_response.raise_for_status()
-            industries_response = industries_response.json()
-            industries = [(element["id"], element["name"]) for element in industries_response]
-            break  # если удачно, то выходим из цикла
-        except requests.exceptions.HTTPError as err:
-            if err.response.status_code in [400, 403]:
-                print(f"Retrying due to HTTP error: {err}")
-                time.sleep(retry_delay)
-            else:
-                print(err)
-                break  # выходим из цикла, если ошибка не может быть обработана
-
-    start_date = since_date
-    top_tier_industries = []
-    # выбор топ K отраслей по количеству найденных вакансий
-    bar = tqdm.tqdm(industries)
-    for industry_id, name in bar:
-        params_for_industry = {
-            'industry_id': industry_id,
-            'date_from': start_date.strftime('%Y-%m-%d'),
-            'date_to': until_date.strftime('%Y-%m-%d'),
-            'area': area_id,
-            'only_with_salary': True,
-            'currency': "RUR",
-            "host": "hh.ru"
-        }
-        header_for_industry = {
-            'HH-User-Agent': 'my-app/0.0.1'
-        }
-        for _ in range(retry_count):
-            try:
-                response_industry = requests.get(url_vacancies, params=params_for_industry, headers=header_for_industry)
-                response_industry.raise_for_status()
-                response_industry = response_industry.json()
-                if len(top_tier_industries) < k:
-                    top_tier_industries.append((response_industry["found"], industry_id, name))
-                else:
-                    found = [i[0] for i in top_tier_industries]
-                    idx_min = np.argmin(found)
-                    if top_tier_industries[idx_min][0] < response_industry["found"]:
-                        top_tier_industries[idx_min] = (response_industry["found"], industry_id, name)
-                time.sleep(np.random.uniform(0.005, 0.01))
-                break  # если удачно, то выходим из цикла
-            except requests.exceptions.HTTPError as err:
-                if err.response.status_code in [400, 403]:
-                    print(f"Retrying due to HTTP error: {err}")
-                    time.sleep(retry_delay)
-                else:
-                    print(err)
-                    break  # выходим из цикла, если ошибка не может быть обработана
-    return top_tier_industries
+    return industries.get_top_k_industries(k, area_id, since_date, until_date)
 
 
 def get_vacancies(area_id, number_of_vacancies, industry_id, from_date, until_date):
@@ -99,13 +46,10 @@ def get_vacancies(area_id, number_of_vacancies, industry_id, from_date, until_da
     :param until_date: Дата, до которой вести поиск вакансий.
     :return: Найденные вакансии по заданным ограничениям.
     """
-    headers = {
-        'HH-User-Agent': 'my-app/0.0.1',
-    }
-    url = 'https://api.hh.ru/vacancies'
+    client = http_client.get_client()
+    url = f'{http_client.API_URL}/vacancies'
     vacancies = None
     start_date = from_date
-    extracted_all = False
     for i in range(number_of_vacancies // 100):
         params = {
             'area': area_id,
@@ -118,36 +62,16 @@ def get_vacancies(area_id, number_of_vacancies, industry_id, from_date, until_da
             'currency': "RUR",
             "host": "hh.ru"
         }
-        retry_count = 5
-        retry_delay = 1  # задержка между повторными попытками
-
-        for _ in range(retry_count):
-            try:
-                response = requests.get(url, headers=headers, params=params)
-                time.sleep(np.random.uniform(0.5, 2))
-                response.raise_for_status()
-                if vacancies is None:
-                    vacancies = response.json()["items"]
-                else:
-                    vacancies.extend(response.json()['items'])
-
-                if response.json()["found"] == 0 or i >= response.json()["pages"] - 1:
-                    extracted_all = True
-                break
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code in [400, 403]:
-                    print(f"Retrying due to HTTP error: {e}")
-                    time.sleep(retry_delay)
-                else:
-                    print(e)
-                    break  # выходим из цикла, если ошибка не может быть обработана
-            except requests.exceptions.ConnectTimeout as e:
-                time.sleep(2)
-                print(f"Retrying due to connect timeout: {e}")
-            except requests.exceptions.ConnectionError as e:
-                print(f"Retrying due to connection error: {e}")
-                time.sleep(20)
-        if extracted_all:
+        # повторы с паузами выполняет общий клиент
+        response = client.get_json(url, params)
+        time.sleep(np.random.uniform(*PAGE_DELAY))
+        if response is None:
+            continue
+        if vacancies is None:
+            vacancies = response["items"]
+        else:
+            vacancies.extend(response['items'])
+        if response["found"] == 0 or i >= response["pages"] - 1:
             break
     # удаление ненужных признаков
     if not vacancies:
@@ -170,70 +94,150 @@ def get_vacancies_by_parts(area_id, industry_id, from_date, until_date, number_o
     until_date_part = from_date_part + datetime.timedelta(days=days_in_part)
     vacancies = []
 
-    def get_vacancies_part(start_date, end_date):
-        try:
-            return get_vacancies(area_id, 2000, industry_id, start_date, end_date)
-        except ConnectionError as e:
-            print(f"ConnectionError occurred: {e}")
-            # ожидание 5 минут для повторного запроса
-            time.sleep(300)
-            return get_vacancies(area_id, 2000, industry_id, start_date, end_date)
-
     for i in tqdm.tqdm(range(number_of_parts)):
         if i == number_of_parts - 1:
             until_date_part = until_date
-        vacancies.extend(get_vacancies_part(from_date_part, until_date_part))
+        vacancies.extend(get_vacancies(area_id, 2000, industry_id, from_date_part, until_date_part))
         from_date_part = until_date_part
         until_date_part = from_date_part + datetime.timedelta(days=days_in_part)
     return vacancies
 
 
+def get_vacancies_by_parts_concurrently(area_id, industry_ids, from_date, until_date, number_of_parts,
+                                        concurrency=8, requests_per_second=10):
+    """
+    То же, что get_vacancies_by_parts, но сразу для нескольких отраслей: страницы всех частей качаются
+    параллельно, а частота запросов ограничивается общим token bucket вместо пауз после каждого запроса.
+    :param area_id: Регион, в котором искать.
+    :param industry_ids: Отрасли вакансий.
+    :param from_date: Начиная с даты.
+    :param until_date: Заканчивая датой.
+    :param number_of_parts: На какое кол-во частей делится временной интервал.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :return: Словарь {идентификатор_отрасли: все вакансии с изначального временного промежутка}.
+    """
+    return async_fetcher.collect_vacancies(area_id, industry_ids, from_date, until_date, number_of_parts,
+                                           concurrency, requests_per_second)
+
+
+def plan_new_windows(area_id, industry_ids, from_date, until_date, state, concurrency=8, requests_per_second=10):
+    """
+    Находит для каждой отрасли промежуток, который еще не собирался, и делит его на части меньше 2000 вакансий.
+    Разбиение сохраняется, чтобы после перезапуска страницы докачивались по тем же частям. Если прошлый сбор
+    отрасли прервался, сначала докачивается его сохраненный промежуток, даже если перезапуск был в другой день,
+    а новые дни собираются следующим запуском.
+    :param area_id: Регион, в котором искать.
+    :param industry_ids: Отрасли вакансий.
+    :param from_date: Самая ранняя дата, с которой вести поиск.
+    :param until_date: Заканчивая датой.
+    :param state: Соединение с хранилищем crawl_state.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :return: Словарь {идентификатор_отрасли: (начало, конец, [(начало части, конец части, найдено)])}
+    для отраслей, по которым есть новые дни и которые удалось разбить на части.
+    """
+    industry_windows = {}
+    for industry_id in industry_ids:
+        unfinished = crawl_state.get_unfinished_windows(state, area_id, industry_id)
+        if unfinished:
+            # остается самый ранний незавершенный промежуток: после его завершения конец последнего
+            # сохраненного промежутка сдвинется, и более поздние дни будут спланированы заново
+            for stale_start, stale_end in unfinished[1:]:
+                crawl_state.discard_window(state, area_id, industry_id, stale_start, stale_end)
+            industry_windows[industry_id] = unfinished[0]
+            continue
+        last_until_date = crawl_state.get_last_until_date(state, area_id, industry_id)
+        start_date = from_date if last_until_date is None else max(from_date, last_until_date)
+        if start_date < until_date:
+            industry_windows[industry_id] = (start_date, until_date)
+    if not industry_windows:
+        return {}
+
+    partitions = {industry_id: crawl_state.load_partition(state, area_id, industry_id, start_date, end_date)
+                  for industry_id, (start_date, end_date) in industry_windows.items()}
+    to_partition = [(industry_id, start_date, end_date)
+                    for industry_id, (start_date, end_date) in industry_windows.items()
+                    if partitions[industry_id] is None]
+    if to_partition:
+        new_partitions = partitioner.partition_windows(area_id, to_partition, concurrency, requests_per_second)
+        for (industry_id, start_date, end_date), parts in zip(to_partition, new_partitions):
+            # промежуток, который не удалось разбить, не сохраняется и планируется заново при следующем запуске
+            if parts is not None:
+                crawl_state.save_partition(state, area_id, industry_id, start_date, end_date, parts)
+            partitions[industry_id] = parts
+    return {industry_id: (start_date, end_date, partitions[industry_id])
+            for industry_id, (start_date, end_date) in industry_windows.items()
+            if partitions[industry_id] is not None}
+
+
+def get_new_vacancies(area_id, industry_ids, from_date, until_date, state, concurrency=8, requests_per_second=10):
+    """
+    Возобновляемый и инкрементальный сбор вакансий. Для каждой отрасли скачиваются только дни после конца
+    последнего сохраненного промежутка, а страницы, скачанные до падения, повторно не запрашиваются.
+    Промежуток адаптивно делится на части так, чтобы в каждой было меньше 2000 вакансий.
+    :param area_id: Регион, в котором искать.
+    :param industry_ids: Отрасли вакансий.
+    :param from_date: Самая ранняя дата, с которой вести поиск.
+    :param until_date: Заканчивая датой.
+    :param state: Соединение с хранилищем crawl_state.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :return: Словарь {идентификатор_отрасли: (начало, конец, части)} для отраслей, по которым были новые дни
+    и все страницы скачались. Вакансии частей лежат в state и читаются через crawl_state.load_items.
+    """
+    plan = plan_new_windows(area_id, industry_ids, from_date, until_date, state, concurrency, requests_per_second)
+    if not plan:
+        return {}
+    windows = [(industry_id, start_part, end_part)
+               for industry_id, (_, _, parts) in plan.items() for start_part, end_part, _ in parts]
+    async_fetcher.collect_windows(area_id, windows, concurrency, requests_per_second, state=state, load_items=False)
+    # отрасли, у которых не все страницы скачались, остаются в хранилище и дозапрашиваются при следующем запуске
+    incomplete = {industry_id for industry_id, start_part, end_part in windows
+                  if not async_fetcher.is_window_complete(state, area_id, industry_id, start_part, end_part)}
+    for industry_id in incomplete:
+        print(f"Не все страницы отрасли {industry_id} скачаны, она будет докачана при следующем запуске")
+    return {industry_id: (start_date, end_date, [(start_part, end_part) for start_part, end_part, _ in parts])
+            for industry_id, (start_date, end_date, parts) in plan.items() if industry_id not in incomplete}
+
+
 def get_metro_stations_in_city(city_id):
     """
     Получить координаты станций метро в определенном городе.
     :param city_id: Идентификатор конкретного города.
     :return: Координаты станций метро в городе, указанном по city_id.
     """
-    url_stations = f'https://api.hh.ru/metro/{city_id}'
-    params = {
-    }
-    headers = {
-        'HH-User-Agent': 'my-app/0.0.1'
-    }
-    stations_response = requests.get(url_stations, params=params, headers=headers)
-    stations_response.raise_for_status()
-    stations_response = stations_response.json()
-    np_stations = np.empty((0, 2))
-    for line in stations_response["lines"]:
-        for station in line["stations"]:
-            np_stations = np.append(np_stations, np.array([station["lat"], station["lng"]], ndmin=2), axis=0)
-    return np_stations
-
-
-def clear_data(vacancies):
+    stations_response = metro.fetch_metro(city_id)
+    # полный набор полей станций собирается в python_modules/metro.py, здесь остаются только координаты
+    return metro.get_coordinates(metro.build_stations(stations_response))
+
+
+def clear_data(vacancies, cache_path=employers.CACHE_PATH, ttl=employers.CACHE_TTL, concurrency=8,
+               requests_per_second=10):
     """
     Очищает данные о вакансиях от лишней информации и обновляет их сведения о работодателе и контактах.
 
     :param vacancies: Список словарей, представляющих данные о вакансиях.
+    :param cache_path: Путь до кэша работодателей.
+    :param ttl: Время жизни записи в кэше работодателей в секундах.
+    :param concurrency: Максимальное количество одновременных запросов работодателей.
+    :param requests_per_second: Бюджет запросов работодателей в секунду.
     :return: Список словарей с обновленными данными о вакансиях.
     """
-    headers = {
-        'HH-User-Agent': 'my-app/0.0.1',
-    }
 
-    def process_vacancy(vac, retry_count):
+    def process_vacancy(vac, employers_info):
         """
         Обрабатывает отдельную вакансию, удаляя лишнюю информацию и обновляя данные о работодателе и контактах.
 
         :param vac: Словарь с данными о вакансии.
-        :param retry_count: Количество попыток для повторной загрузки данных о работодателе.
+        :param employers_info: Словарь {идентификатор_работодателя: данные о работодателе}.
         :return: Обновленные данные о вакансии.
         """
         # Определение ключей, которые нужно оставить
         needed_keys = ["is_adv_vacancy", "employment", "experience", "accept_incomplete_resumes", "accept_temporary",
                        "working_time_modes", "working_time_intervals", "working_days", "schedule", "employer",
                        "address", "salary", "response_letter_required", "has_test", "department", "premium",
-                       "professional_roles", "contacts", "type", "archived"]
+                       "professional_roles", "contacts", "type", "archived", "id"]
         # Удаление лишних ключей из вакансии
         keys_to_remove = set(vac.keys()).difference(set(needed_keys))
         for key in keys_to_remove:
@@ -245,29 +249,9 @@ def clear_data(vacancies):
         # Получение идентификатора работодателя
         emp_id = vac["employer"].get("id")
 
-        # Получение данных о работодателе через API HeadHunter
+        # Данные о работодателе уже загружены заранее, по одному запросу на работодателя
         if emp_id is not None:
-            response = None
-            for _ in range(retry_count):
-                try:
-                    response = requests.get(f'https://api.hh.ru/employers/{emp_id}', headers=headers)
-                    time.sleep(np.random.uniform(0.5, 2))
-                    response.raise_for_status()
-                    response = response.json()
-                    break
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code in [400, 403]:
-                        print(f"Retrying due to HTTP error: {e}")
-                    else:
-                        break
-                except requests.exceptions.ConnectTimeout as e:
-                    time.sleep(2)
-                    print(f"Retrying due to connect timeout: {e}")
-                except requests.exceptions.ConnectionError as e:
-                    print(f"Retrying due to connection error: {e}")
-                    time.sleep(20)
-            else:
-                response = None
+            response = employers_info.get(str(emp_id))
             if response is not None:
                 # Обновление данных вакансии на основе данных о работодателе
                 vac["employer_type"] = response.get("type", "Скрыт")
@@ -305,24 +289,28 @@ def clear_data(vacancies):
         vac["employment"] = vac["employment"]["name"] if vac["employment"] is not None else None
         return vac
 
-    def process_vacancies(vacancies, retry_count):
+    def process_vacancies(vacancies):
         """
-        Обрабатывает вакансии параллельно, используя tqdm для отображения прогресса.
+        Обрабатывает вакансии, используя tqdm для отображения прогресса.
+        Сначала собираются уникальные работодатели, и сведения о каждом из них берутся из кэша
+        или запрашиваются параллельно один раз.
 
         :param vacancies: Список словарей с данными о вакансиях.
-        :param retry_count: Количество попыток для повторной загрузки данных о работодателе.
         :return: Список словарей с обновленными данными о вакансиях.
         """
+        employer_ids = {vac["employer"].get("id") for vac in vacancies}
+        with instrumentation.stage("parser.employers", rows=len(employer_ids)):
+            employers_info = employers.get_employers(employer_ids, cache_path, ttl, concurrency, requests_per_second)
         bar = tqdm.tqdm(total=len(vacancies))
         bar.set_description(f"Очищение {len(vacancies)} вакансий")
         processed_vacancies = []
-        for vac in vacancies:
-            processed_vacancies.append(process_vacancy(vac, retry_count))
-            bar.update(1)
+        with instrumentation.stage("parser.clear_vacancies", rows=len(vacancies)):
+            for vac in vacancies:
+                processed_vacancies.append(process_vacancy(vac, employers_info))
+                bar.update(1)
         return processed_vacancies
 
-    # Вызов функции parallel_process_vacancies с параметром retry_count равным 5
-    return process_vacancies(vacancies, 5)
+    return process_vacancies(vacancies)
 
 
 def clear_directory(directory):
@@ -352,28 +340,56 @@ def clear_directory(directory):
 
 
 if __name__ == '__main__':
-    # очистить каталог datasets, если он существует, а затем создать его заново
-    directory_path = "datasets"
-    clear_directory(directory_path)
+    arg_parser = argparse.ArgumentParser(description="Сбор вакансий hh.ru по Москве")
+    arg_parser.add_argument("--report", help="json-файл для отчета о запуске: время, память и строки по этапам, "
+                                             "запросы по эндпоинтам")
+    arg_parser.add_argument("--profile", choices=["cprofile", "sample"],
+                            help="добавить в отчет профиль: cprofile точнее, sample почти не замедляет сбор")
+    args = arg_parser.parse_args()
+    if args.profile is not None and args.report is None:
+        arg_parser.error("--profile пишется в отчет, укажите --report")
+    if args.report is not None:
+        instrumentation.start_run(args.profile)
+    # каталог datasets не очищается: новые вакансии дописываются к уже собранным
     pathlib.Path('datasets').mkdir(parents=True, exist_ok=True)
+    state = crawl_state.open_state()
     # сохранить вакансии для каждой отрасли в top_industries по количеству найденных вакансий
-    search_from_date = datetime.datetime(2024, 4, 1)
-    search_until_date = datetime.datetime(2024, 5, 26)
+    search_until_date = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    search_from_date = search_until_date - datetime.timedelta(days=55)
     moscow_city_id = 1
     print("Выбираем топ индустрии по количеству вакансий")
     k = 3
-    top_industries = get_top_k_industries(k, moscow_city_id, search_from_date, search_until_date)
+    with instrumentation.stage("parser.industry_probe"):
+        top_industries = get_top_k_industries(k, moscow_city_id, search_from_date, search_until_date)
     print("\nВыбрано!")
 
+    print("\nСобираем вакансии")
+    with instrumentation.stage("parser.paging"):
+        industry_vacancies = get_new_vacancies(moscow_city_id, [ind[1] for ind in top_industries],
+                                               search_from_date, search_until_date, state)
     for i, ind in enumerate(top_industries):
-        with open(f"datasets/industry({ind[2]}).json", "w", encoding='utf-8') as outfile:
-
-            print(f"\nСобираем вакансии{i+1}/{k}")
-            cleared_vacancies = clear_data(
-                get_vacancies_by_parts(moscow_city_id, ind[1], search_from_date, search_until_date,
-                                       (search_until_date - search_from_date).days))
-            json.dump(cleared_vacancies,
-                      outfile, ensure_ascii=False, indent=4)
-    # сохранить координаты (широту и долготу) для каждой станции метро в Москве
+        if ind[1] not in industry_vacancies:
+            print(f"\nНовых дней для {ind[2]} нет")
+            continue
+        start_date, end_date, parts = industry_vacancies[ind[1]]
+        print(f"\nОчищаем вакансии{i+1}/{k}")
+        # вакансии очищаются и записываются по частям, так что в памяти не держится вся отрасль
+        for start_part, end_part in parts:
+            with instrumentation.stage("parser.load_items"):
+                vacancies = crawl_state.load_items(state, moscow_city_id, ind[1], start_part, end_part)
+            cleared = clear_data(vacancies)
+            with instrumentation.stage("parser.write", rows=len(cleared)):
+                dataset_store.write_vacancies(cleared, ind[2])
+        crawl_state.mark_window_finished(state, moscow_city_id, ind[1], start_date, end_date)
+    state.close()
+    # сохранить станции метро Москвы с линиями и названиями, а их координаты (широту и долготу) - в stations.npy
+    with instrumentation.stage("parser.metro"):
+        moscow_stations = metro.get_stations(moscow_city_id)
     if not os.path.exists("src_files/stations.npy"):
-        np.save("src_files/stations.npy", get_metro_stations_in_city(moscow_city_id))
+        np.save("src_files/stations.npy", metro.get_coordinates(moscow_stations))
+    # сводка по запросам: сколько было повторов и ошибок, сколько данных пришло и как быстро
+    for endpoint, stats in http_client.get_client().metrics.summary().items():
+        print(f"{endpoint}: запросов {stats['requests']}, повторов {stats['retries']}, ошибок {stats['errors']}, "
+              f"{stats['bytes'] / 2 ** 20:.1f} МБ, средняя задержка {stats['latency_mean']:.3f} с")
+    # отчет для сравнения запусков: python -m python_modules.instrumentation old.json new.json
+    instrumentation.finish_run(args.report, requests=http_client.get_client().metrics.summary())
@@ -0,0 +1,78 @@
+import argparse
+import os
+
+from python_modules import dataset_store
+from python_modules import feature_matrix
+from python_modules import model_search
+from python_modules import salary_prediction
+
+
+def train(args):
+    """
+    Строит матрицу признаков по хранилищу, отбирает гиперпараметры одной модели и сохраняет лучшую.
+    :param args: Аргументы командной строки.
+    :return: Ничего
+    """
+    X, y, industry, transformer = feature_matrix.build_feature_matrix(args.datasets)
+    space = model_search.SEARCH_SPACES[args.model]
+    result = model_search.run_search(X, y, industry, len(transformer.config["numeric"]), {args.model: space},
+                                     max_candidates=args.max_candidates, time_budget=args.time_budget,
+                                     processes=args.processes)
+    best = result["best"][args.model]
+    directory = os.path.join(args.models, args.model)
+    salary_prediction.save_model(best["model"], transformer, directory, space)
+    print(f"Лучшие параметры {args.model}: {best['params']}, оценка на кросс-валидации {best['cv_score']:.3f}, "
+          f"отбор занял {result['elapsed']:.1f} с")
+    print(result["report"].to_string())
+    print(f"Модель сохранена в {directory}")
+
+
+def predict(args):
+    """
+    Предсказывает зарплату для вакансий хранилища сохраненной моделью.
+    :param args: Аргументы командной строки.
+    :return: Ничего
+    """
+    predictor = salary_prediction.predict_store(os.path.join(args.models, args.model), args.datasets,
+                                                args.output, args.column, args.batch_size, overwrite=args.overwrite)
+    stats = predictor.stats.summary()
+    print(f"Вакансий {stats['vacancies']} в {stats['batches']} батчах за {stats['seconds']:.2f} с, "
+          f"{stats['vacancies_per_second']:.0f} вакансий/с, задержка батча p50 {stats['latency_p50'] * 1000:.1f} мс, "
+          f"p95 {stats['latency_p95'] * 1000:.1f} мс, максимум {stats['latency_max'] * 1000:.1f} мс")
+
+
+def main(argv=None):
+    """
+    Точка входа: python predict.py train --model random_forest_regressor
+    и python predict.py predict --model random_forest_regressor
+    :param argv: Аргументы командной строки, по умолчанию sys.argv.
+    :return: Ничего
+    """
+    arg_parser = argparse.ArgumentParser(description="Обучение и пакетное предсказание зарплат вакансий")
+    arg_parser.add_argument("--datasets", default=dataset_store.DATASETS_PATH, help="корень хранилища вакансий")
+    arg_parser.add_argument("--models", default=salary_prediction.MODELS_PATH, help="директория моделей")
+    arg_parser.add_argument("--model", default="random_forest_regressor", choices=sorted(model_search.SEARCH_SPACES),
+                            help="модель из model_search.SEARCH_SPACES")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="отобрать гиперпараметры и сохранить модель")
+    train_parser.add_argument("--max-candidates", type=int, help="наборов параметров из сетки, по умолчанию все")
+    train_parser.add_argument("--time-budget", type=float, help="ограничение отбора по времени в секундах")
+    train_parser.add_argument("--processes", type=int, help="количество процессов")
+    train_parser.set_defaults(handler=train)
+
+    predict_parser = commands.add_parser("predict", help="записать предсказания столбцом в файлы хранилища")
+    predict_parser.add_argument("--output", help="корень копии хранилища с предсказаниями, по умолчанию на месте")
+    predict_parser.add_argument("--column", default=salary_prediction.PREDICTION_COLUMN,
+                                help="название столбца с предсказанием")
+    predict_parser.add_argument("--batch-size", type=int, default=salary_prediction.BATCH_SIZE,
+                                help="размер микробатча")
+    predict_parser.add_argument("--overwrite", action="store_true", help="пересчитать уже размеченные файлы")
+    predict_parser.set_defaults(handler=predict)
+
+    args = arg_parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
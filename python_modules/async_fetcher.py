@@ -0,0 +1,249 @@
+import asyncio
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from python_modules import crawl_state
+from python_modules import http_client
+
+API_URL = http_client.API_URL
+# API отдает не больше 2000 вакансий на один запрос, то есть 20 страниц по 100
+MAX_PAGES = 20
+PER_PAGE = 100
+
+
+class TokenBucket:
+    """
+    Общий ограничитель частоты запросов (token bucket) для всех корутин сборщика.
+    Заменяет случайные паузы после каждого запроса: запросы идут с частотой не выше rate в секунду,
+    с допустимым всплеском до capacity запросов.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: Количество запросов в секунду.
+        :param capacity: Размер ведра, по умолчанию равен rate.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Дождаться свободного токена и забрать его.
+        :return: Ничего
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def split_date_range(from_date, until_date, number_of_parts):
+    """
+    Делит временной промежуток на number_of_parts частей так же, как get_vacancies_by_parts.
+    :param from_date: Начиная с даты.
+    :param until_date: Заканчивая датой.
+    :param number_of_parts: На какое кол-во частей делится временной интервал.
+    :return: Список пар (начало части, конец части).
+    """
+    days_in_part = (until_date - from_date).days // number_of_parts
+    from_date_part = from_date
+    until_date_part = from_date_part + datetime.timedelta(days=days_in_part)
+    parts = []
+    for i in range(number_of_parts):
+        if i == number_of_parts - 1:
+            until_date_part = until_date
+        parts.append((from_date_part, until_date_part))
+        from_date_part = until_date_part
+        until_date_part = from_date_part + datetime.timedelta(days=days_in_part)
+    return parts
+
+
+def vacancies_params(area_id, industry_id, from_date, until_date, page=0, per_page=PER_PAGE):
+    """
+    Параметры запроса /vacancies для одной страницы промежутка.
+    :param area_id: Регион, в котором искать.
+    :param industry_id: Отрасль вакансий.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :param page: Номер страницы.
+    :param per_page: Количество вакансий на странице, 0 - только узнать количество найденных.
+    :return: Словарь параметров.
+    """
+    return {
+        'area': area_id,
+        'per_page': per_page,
+        'page': page,
+        'date_from': crawl_state.format_date(from_date),
+        'date_to': crawl_state.format_date(until_date),
+        'industry': industry_id,
+        'only_with_salary': True,
+        'currency': "RUR",
+        "host": "hh.ru"
+    }
+
+
+async def fetch_json(client, limiter, executor, url, params):
+    """
+    Выполняет GET-запрос через общий HttpClient в пуле потоков. Каждая попытка, включая повторы,
+    забирает токен из общего ограничителя частоты.
+    :param client: HttpClient.
+    :param limiter: Общий TokenBucket.
+    :param executor: Пул потоков, в котором выполняются блокирующие запросы.
+    :param url: Адрес запроса.
+    :param params: Параметры запроса.
+    :return: Ответ в виде словаря или None, если получить его не удалось.
+    """
+    loop = asyncio.get_running_loop()
+
+    def acquire():
+        asyncio.run_coroutine_threadsafe(limiter.acquire(), loop).result()
+
+    return await loop.run_in_executor(executor, client.get_json, url, params, acquire)
+
+
+async def collect_windows_async(area_id, windows, concurrency=8, requests_per_second=10, api_url=API_URL,
+                                state=None, load_items=True):
+    """
+    Собирает вакансии для списка промежутков (отрасль, начало, конец), обрабатывая единицы работы
+    (отрасль, промежуток, страница) не более чем concurrency запросами одновременно.
+    Сначала для каждого промежутка запрашивается нулевая страница, по ее полю pages в очередь добавляются остальные.
+    :param area_id: Регион, в котором искать.
+    :param windows: Список кортежей (идентификатор_отрасли, начало, конец).
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :param api_url: Адрес API, можно подменить на локальный сервер.
+    :param state: Соединение с хранилищем crawl_state. Если передано, скачанные страницы сохраняются в нем,
+    а уже сохраненные повторно не запрашиваются.
+    :param load_items: Вернуть скачанные вакансии. Если false и передан state, вакансии остаются только в хранилище
+    и их можно читать по частям через crawl_state.load_items.
+    :return: Словарь {идентификатор_отрасли: список вакансий} в порядке промежутков и страниц.
+    Страницы, которые не удалось скачать, пропускаются; с state промежуток остается незавершенным
+    (см. is_window_complete) и дозапрашивается при следующем запуске.
+    """
+    limiter = TokenBucket(requests_per_second)
+    queue = asyncio.Queue()
+    pages = {}
+    # (индекс промежутка, страница), которые не удалось скачать или разобрать
+    failed = []
+    for window_idx, (industry_id, start_date, end_date) in enumerate(windows):
+        finished = {} if state is None else crawl_state.get_finished_pages(state, area_id, industry_id,
+                                                                           start_date, end_date)
+        if 0 not in finished:
+            queue.put_nowait((window_idx, 0))
+            continue
+        # нулевая страница уже скачана, дозапрашиваем только недостающие
+        for page in range(1, min(finished[0], MAX_PAGES)):
+            if page not in finished:
+                queue.put_nowait((window_idx, page))
+
+    async def worker():
+        while True:
+            window_idx, page = await queue.get()
+            industry_id, start_date, end_date = windows[window_idx]
+            params = vacancies_params(area_id, industry_id, start_date, end_date, page)
+            try:
+                response = await fetch_json(client, limiter, executor, f'{api_url}/vacancies', params)
+                if response is not None:
+                    if state is None:
+                        pages[(window_idx, page)] = response["items"]
+                    else:
+                        crawl_state.save_page(state, area_id, industry_id, start_date, end_date, page,
+                                              response["pages"], response["items"])
+                    # по нулевой странице становится известно, сколько еще страниц нужно скачать
+                    if page == 0 and response["found"] > 0:
+                        for next_page in range(1, min(response["pages"], MAX_PAGES)):
+                            queue.put_nowait((window_idx, next_page))
+                else:
+                    failed.append((window_idx, page))
+            except Exception as e:
+                # ошибка одной страницы не должна останавливать обработчик, иначе queue.join() не дождется очереди
+                print(f"Страница {page} отрасли {industry_id} за {start_date} - {end_date} не скачана: {e!r}")
+                failed.append((window_idx, page))
+            finally:
+                queue.task_done()
+
+    client = http_client.get_client()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    if failed:
+        print(f"Не скачано страниц: {len(failed)}")
+
+    vacancies = {industry_id: [] for industry_id, _, _ in windows}
+    if state is not None and not load_items:
+        return vacancies
+    if state is not None:
+        for industry_id, start_date, end_date in windows:
+            vacancies[industry_id].extend(crawl_state.load_items(state, area_id, industry_id, start_date, end_date))
+        return vacancies
+    for window_idx, page in sorted(pages):
+        vacancies[windows[window_idx][0]].extend(pages[(window_idx, page)])
+    return vacancies
+
+
+async def collect_vacancies_async(area_id, industry_ids, from_date, until_date, number_of_parts,
+                                  concurrency=8, requests_per_second=10, api_url=API_URL, state=None):
+    """
+    Собирает вакансии нескольких отраслей, деля временной промежуток на number_of_parts частей.
+    :param area_id: Регион, в котором искать.
+    :param industry_ids: Идентификаторы отраслей.
+    :param from_date: Начиная с даты.
+    :param until_date: Заканчивая датой.
+    :param number_of_parts: На какое кол-во частей делится временной интервал.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :param api_url: Адрес API, можно подменить на локальный сервер.
+    :param state: Соединение с хранилищем crawl_state для возобновляемого сбора.
+    :return: Словарь {идентификатор_отрасли: список вакансий} в порядке частей и страниц.
+    """
+    parts = split_date_range(from_date, until_date, number_of_parts)
+    windows = [(industry_id, start_date, end_date) for start_date, end_date in parts for industry_id in industry_ids]
+    return await collect_windows_async(area_id, windows, concurrency, requests_per_second, api_url, state)
+
+
+def is_window_complete(state, area_id, industry_id, from_date, until_date):
+    """
+    Проверяет, что все страницы промежутка уже сохранены в хранилище crawl_state.
+    :param state: Соединение с хранилищем crawl_state.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :return: true, если промежуток скачан полностью, иначе false.
+    """
+    finished = crawl_state.get_finished_pages(state, area_id, industry_id, from_date, until_date)
+    if 0 not in finished:
+        return False
+    return all(page in finished for page in range(1, min(finished[0], MAX_PAGES)))
+
+
+def collect_windows(area_id, windows, concurrency=8, requests_per_second=10, api_url=API_URL, state=None,
+                    load_items=True):
+    """
+    Синхронная обертка над collect_windows_async.
+    :return: Словарь {идентификатор_отрасли: список вакансий}.
+    """
+    return asyncio.run(collect_windows_async(area_id, windows, concurrency, requests_per_second, api_url, state,
+                                             load_items))
+
+
+def collect_vacancies(area_id, industry_ids, from_date, until_date, number_of_parts,
+                      concurrency=8, requests_per_second=10, api_url=API_URL, state=None):
+    """
+    Синхронная обертка над collect_vacancies_async.
+    :return: Словарь {идентификатор_отрасли: список вакансий}.
+    """
+    return asyncio.run(collect_vacancies_async(area_id, industry_ids, from_date, until_date, number_of_parts,
+                                               concurrency, requests_per_second, api_url, state))
@@ -0,0 +1,213 @@
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+STATE_PATH = 'cache/crawl_state.sqlite'
+DATE_FORMAT = '%Y-%m-%d'
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def open_state(state_path=STATE_PATH):
+    """
+    Открывает (и при необходимости создает) хранилище состояния сбора.
+    В таблице pages лежат уже скачанные страницы (отрасль, часть промежутка, страница),
+    в таблице windows - промежутки, вакансии которых уже сохранены в datasets.
+    :param state_path: Путь до файла состояния.
+    :return: Соединение с базой.
+    """
+    directory = os.path.dirname(state_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # в базу могут одновременно писать несколько процессов планировщика, поэтому ожидание блокировки дольше
+    connection = sqlite3.connect(state_path, timeout=60)
+    connection.execute("CREATE TABLE IF NOT EXISTS pages "
+                       "(area TEXT, industry TEXT, date_from TEXT, date_to TEXT, page INTEGER, pages INTEGER, "
+                       "items TEXT NOT NULL, PRIMARY KEY (area, industry, date_from, date_to, page))")
+    connection.execute("CREATE TABLE IF NOT EXISTS windows "
+                       "(area TEXT, industry TEXT, date_from TEXT, date_to TEXT, finished_at REAL NOT NULL, "
+                       "PRIMARY KEY (area, industry, date_from, date_to))")
+    connection.execute("CREATE TABLE IF NOT EXISTS partitions "
+                       "(area TEXT, industry TEXT, date_from TEXT, date_to TEXT, part_from TEXT, part_to TEXT, "
+                       "found INTEGER, PRIMARY KEY (area, industry, date_from, date_to, part_from))")
+    return connection
+
+
+def format_date(date):
+    """
+    Переводит дату в строку для API и ключей хранилища: полночь записывается только датой,
+    остальное время - датой со временем.
+    :param date: Дата.
+    :return: Строка в формате YYYY-MM-DD или YYYY-MM-DDTHH:MM:SS.
+    """
+    if date.time() == datetime.time():
+        return date.strftime(DATE_FORMAT)
+    return date.strftime(DATETIME_FORMAT)
+
+
+def get_finished_pages(connection, area_id, industry_id, from_date, until_date):
+    """
+    Возвращает уже скачанные страницы части промежутка.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало части.
+    :param until_date: Конец части.
+    :return: Словарь {номер_страницы: количество_страниц_в_ответе}.
+    """
+    rows = connection.execute("SELECT page, pages FROM pages "
+                              "WHERE area = ? AND industry = ? AND date_from = ? AND date_to = ?",
+                              (str(area_id), str(industry_id), format_date(from_date),
+                               format_date(until_date)))
+    return dict(rows.fetchall())
+
+
+def save_page(connection, area_id, industry_id, from_date, until_date, page, pages, items):
+    """
+    Сохраняет скачанную страницу, чтобы после перезапуска не запрашивать ее снова.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало части.
+    :param until_date: Конец части.
+    :param page: Номер страницы.
+    :param pages: Количество страниц из ответа API.
+    :param items: Вакансии со страницы.
+    :return: Ничего
+    """
+    connection.execute("INSERT OR REPLACE INTO pages (area, industry, date_from, date_to, page, pages, items) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (str(area_id), str(industry_id), format_date(from_date),
+                        format_date(until_date), page, pages, json.dumps(items, ensure_ascii=False)))
+    connection.commit()
+
+
+def load_items(connection, area_id, industry_id, from_date, until_date):
+    """
+    Достает вакансии всех скачанных страниц части промежутка в порядке страниц.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало части.
+    :param until_date: Конец части.
+    :return: Список вакансий.
+    """
+    rows = connection.execute("SELECT items FROM pages "
+                              "WHERE area = ? AND industry = ? AND date_from = ? AND date_to = ? ORDER BY page",
+                              (str(area_id), str(industry_id), format_date(from_date),
+                               format_date(until_date)))
+    items = []
+    for (page_items,) in rows:
+        items.extend(json.loads(page_items))
+    return items
+
+
+def mark_window_finished(connection, area_id, industry_id, from_date, until_date):
+    """
+    Отмечает промежуток как полностью сохраненный и удаляет его страницы и разбиение из хранилища.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :return: Ничего
+    """
+    date_from, date_to = format_date(from_date), format_date(until_date)
+    connection.execute("INSERT OR REPLACE INTO windows (area, industry, date_from, date_to, finished_at) "
+                       "VALUES (?, ?, ?, ?, ?)", (str(area_id), str(industry_id), date_from, date_to, time.time()))
+    connection.execute("DELETE FROM pages WHERE area = ? AND industry = ? AND date_from >= ? AND date_to <= ?",
+                       (str(area_id), str(industry_id), date_from, date_to))
+    connection.execute("DELETE FROM partitions WHERE area = ? AND industry = ? AND date_from = ? AND date_to = ?",
+                       (str(area_id), str(industry_id), date_from, date_to))
+    connection.commit()
+
+
+def get_last_until_date(connection, area_id, industry_id):
+    """
+    Возвращает конец последнего сохраненного промежутка для отрасли.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :return: Дата или None, если отрасль еще не собиралась.
+    """
+    row = connection.execute("SELECT MAX(date_to) FROM windows WHERE area = ? AND industry = ?",
+                             (str(area_id), str(industry_id))).fetchone()
+    if row[0] is None:
+        return None
+    return datetime.datetime.fromisoformat(row[0])
+
+
+def get_unfinished_windows(connection, area_id, industry_id):
+    """
+    Возвращает промежутки, которые уже разбиты на части, но не отмечены сохраненными, то есть сбор которых прервался.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :return: Список пар (начало, конец) по возрастанию начала.
+    """
+    rows = connection.execute("SELECT DISTINCT p.date_from, p.date_to FROM partitions p "
+                              "WHERE p.area = ? AND p.industry = ? AND NOT EXISTS (SELECT 1 FROM windows w "
+                              "WHERE w.area = p.area AND w.industry = p.industry AND w.date_from = p.date_from "
+                              "AND w.date_to = p.date_to) ORDER BY p.date_from, p.date_to",
+                              (str(area_id), str(industry_id))).fetchall()
+    return [(datetime.datetime.fromisoformat(start), datetime.datetime.fromisoformat(end)) for start, end in rows]
+
+
+def discard_window(connection, area_id, industry_id, from_date, until_date):
+    """
+    Удаляет страницы и разбиение незавершенного промежутка, не отмечая его сохраненным.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :return: Ничего
+    """
+    date_from, date_to = format_date(from_date), format_date(until_date)
+    connection.execute("DELETE FROM pages WHERE area = ? AND industry = ? AND date_from >= ? AND date_to <= ?",
+                       (str(area_id), str(industry_id), date_from, date_to))
+    connection.execute("DELETE FROM partitions WHERE area = ? AND industry = ? AND date_from = ? AND date_to = ?",
+                       (str(area_id), str(industry_id), date_from, date_to))
+    connection.commit()
+
+
+def save_partition(connection, area_id, industry_id, from_date, until_date, parts):
+    """
+    Сохраняет разбиение промежутка на части, чтобы после перезапуска страницы искались по тем же частям.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :param parts: Список кортежей (начало части, конец части, количество найденных вакансий).
+    :return: Ничего
+    """
+    date_from, date_to = format_date(from_date), format_date(until_date)
+    connection.execute("DELETE FROM partitions WHERE area = ? AND industry = ? AND date_from = ? AND date_to = ?",
+                       (str(area_id), str(industry_id), date_from, date_to))
+    connection.executemany("INSERT INTO partitions (area, industry, date_from, date_to, part_from, part_to, found) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           [(str(area_id), str(industry_id), date_from, date_to, format_date(start), format_date(end),
+                             found) for start, end, found in parts])
+    connection.commit()
+
+
+def load_partition(connection, area_id, industry_id, from_date, until_date):
+    """
+    Достает сохраненное разбиение промежутка.
+    :param connection: Соединение с хранилищем состояния.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :return: Список кортежей (начало части, конец части, количество найденных вакансий) или None.
+    """
+    rows = connection.execute("SELECT part_from, part_to, found FROM partitions "
+                              "WHERE area = ? AND industry = ? AND date_from = ? AND date_to = ? ORDER BY part_from",
+                              (str(area_id), str(industry_id), format_date(from_date),
+                               format_date(until_date))).fetchall()
+    if not rows:
+        return None
+    return [(datetime.datetime.fromisoformat(start), datetime.datetime.fromisoformat(end), found)
+            for start, end, found in rows]
@@ -0,0 +1,188 @@
+import datetime
+import json
+import os
+import time
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DATASETS_PATH = 'datasets'
+# столбцы со словарями и списками хранятся в файлах как json-строки
+NESTED_COLUMNS = ["salary", "professional_roles", "working_time_modes", "working_time_intervals", "working_days",
+                  "department"]
+# поля зарплаты дополнительно хранятся плоскими столбцами salary_<поле>, чтобы считать зарплату без разбора json
+SALARY_FIELDS = ["from", "to", "gross", "currency"]
+
+
+def industry_directory(industry):
+    """
+    Название директории партиции отрасли.
+    :param industry: Название отрасли.
+    :return: Строка вида industry=<отрасль>.
+    """
+    return "industry=" + industry.replace(os.sep, "_").replace("/", "_")
+
+
+def area_directory(area):
+    """
+    Название директории партиции региона.
+    :param area: Идентификатор региона.
+    :return: Строка вида area=<регион>.
+    """
+    return f"area={area}"
+
+
+def partition_path(root, industry, date, area=None):
+    """
+    Путь до партиции industry=<отрасль>/date=<дата>, а для сбора по нескольким регионам -
+    area=<регион>/industry=<отрасль>/date=<дата>.
+    :param root: Корневая директория хранилища.
+    :param industry: Название отрасли.
+    :param date: Дата сбора.
+    :param area: Идентификатор региона или None.
+    :return: Путь до директории партиции.
+    """
+    if area is not None:
+        root = os.path.join(root, area_directory(area))
+    return os.path.join(root, industry_directory(industry), f"date={date.strftime('%Y-%m-%d')}")
+
+
+def encode_nested(vac):
+    """
+    Переводит вложенные значения вакансии в json-строки и добавляет плоские поля зарплаты.
+    :param vac: Словарь с данными о вакансии.
+    :return: Новый словарь, в котором нет словарей и списков.
+    """
+    row = {key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+           for key, value in vac.items()}
+    if "salary" in vac:
+        salary = vac["salary"] if isinstance(vac["salary"], dict) else {}
+        for field in SALARY_FIELDS:
+            row[f"salary_{field}"] = salary.get(field)
+    return row
+
+
+def write_vacancies(vacancies, industry, root=DATASETS_PATH, date=None, file_format=None, area=None):
+    """
+    Дописывает часть очищенных вакансий отрасли в хранилище отдельным файлом, не трогая уже записанные.
+    :param vacancies: Список очищенных вакансий.
+    :param industry: Название отрасли.
+    :param root: Корневая директория хранилища.
+    :param date: Дата сбора, по умолчанию сегодня.
+    :param file_format: "parquet" или "jsonl", по умолчанию parquet, если установлен pyarrow.
+    :param area: Идентификатор региона. Если задан, вакансии пишутся в партицию региона и получают столбец area.
+    :return: Путь до записанного файла или None, если вакансий нет.
+    """
+    if not vacancies:
+        return None
+    if date is None:
+        date = datetime.date.today()
+    if file_format is None:
+        file_format = "parquet" if pa is not None else "jsonl"
+    directory = partition_path(root, industry, date, area)
+    os.makedirs(directory, exist_ok=True)
+    # время в имени файла задает порядок частей: более поздняя версия вакансии перекрывает раннюю
+    path = os.path.join(directory, f"part-{time.time_ns()}.{file_format}")
+    extra = {"industry": industry} if area is None else {"industry": industry, "area": str(area)}
+    rows = [encode_nested({**vac, **extra}) for vac in vacancies]
+    if file_format == "parquet":
+        # DataFrame собирает столбцы со всех вакансий, а не только с первой
+        pq.write_table(pa.Table.from_pandas(pd.DataFrame(rows), preserve_index=False), path)
+    else:
+        with open(path, "w", encoding='utf-8') as outfile:
+            for row in rows:
+                outfile.write(json.dumps(row, ensure_ascii=False))
+                outfile.write("\n")
+    return path
+
+
+def list_parts(root=DATASETS_PATH, industries=None, areas=None):
+    """
+    Находит все файлы хранилища в порядке записи.
+    :param root: Корневая директория хранилища.
+    :param industries: Названия отраслей, которые нужно прочитать, по умолчанию все.
+    :param areas: Идентификаторы регионов, которые нужно прочитать. По умолчанию читаются все регионы
+    и вакансии, записанные без региона.
+    :return: Список путей.
+    """
+    parts = []
+    if not os.path.exists(root):
+        return parts
+    allowed = None if industries is None else {industry_directory(industry) for industry in industries}
+    allowed_areas = None if areas is None else {area_directory(area) for area in areas}
+    roots = [] if areas is not None else [root]
+    for area_dir in os.listdir(root):
+        if area_dir.startswith("area=") and (allowed_areas is None or area_dir in allowed_areas):
+            roots.append(os.path.join(root, area_dir))
+    for industries_root in roots:
+        for industry_dir in os.listdir(industries_root):
+            if not industry_dir.startswith("industry=") or (allowed is not None and industry_dir not in allowed):
+                continue
+            for date_dir in os.listdir(os.path.join(industries_root, industry_dir)):
+                directory = os.path.join(industries_root, industry_dir, date_dir)
+                for file_name in os.listdir(directory):
+                    if file_name.endswith(".parquet") or file_name.endswith(".jsonl"):
+                        parts.append(os.path.join(directory, file_name))
+    return sorted(parts, key=lambda path: os.path.basename(path))
+
+
+def read_part(path, columns=None):
+    """
+    Читает один файл хранилища.
+    :param path: Путь до файла.
+    :param columns: Нужные столбцы, по умолчанию все.
+    :return: DataFrame.
+    """
+    if path.endswith(".parquet"):
+        if columns is not None:
+            available = set(pq.read_schema(path).names)
+            columns = [col for col in columns if col in available]
+        return pq.read_table(path, columns=columns).to_pandas()
+    df = pd.read_json(path, lines=True, dtype=False, encoding='utf-8')
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
+    return df
+
+
+def load_vacancies(root=DATASETS_PATH, columns=None, industries=None, areas=None):
+    """
+    Загружает вакансии из хранилища, читая только нужные столбцы.
+    Повторы одной вакансии отрасли из разных запусков убираются, остается последняя версия.
+    :param root: Корневая директория хранилища.
+    :param columns: Нужные столбцы, по умолчанию все. Столбцы id, industry и area читаются всегда.
+    :param industries: Названия отраслей, которые нужно прочитать, по умолчанию все.
+    :param areas: Идентификаторы регионов, которые нужно прочитать, по умолчанию все.
+    :return: DataFrame с вакансиями всех отраслей.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(["id", "industry", "area", *columns]))
+    frames = [read_part(path, columns) for path in list_parts(root, industries, areas)]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    if "id" in df.columns:
+        subset = ["area", "industry", "id"] if "area" in df.columns else ["industry", "id"]
+        df = df.drop_duplicates(subset=subset, keep="last").reset_index(drop=True)
+    for col in NESTED_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].apply(lambda x: json.loads(x) if isinstance(x, str) else x)
+    return df
+
+
+def load_datasets(root=DATASETS_PATH, columns=None, industries=None, areas=None):
+    """
+    Загружает вакансии в том же виде, что и ноутбук: отдельный DataFrame на каждую отрасль.
+    :param root: Корневая директория хранилища.
+    :param columns: Нужные столбцы, по умолчанию все.
+    :param industries: Названия отраслей, которые нужно прочитать, по умолчанию все.
+    :param areas: Идентификаторы регионов, которые нужно прочитать, по умолчанию все.
+    :return: Список DataFrame, по одному на отрасль.
+    """
+    df = load_vacancies(root, columns, industries, areas)
+    return [group.reset_index(drop=True) for _, group in df.groupby("industry", sort=True)]
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from python_modules import async_fetcher
+from python_modules import http_client
+
+CACHE_PATH = 'cache/employers.sqlite'
+# сведения о работодателе меняются медленно, поэтому по умолчанию кэш живет неделю
+CACHE_TTL = 7 * 24 * 60 * 60
+# поля ответа /employers/{id}, которые используются при очистке вакансий
+EMPLOYER_FIELDS = ["type", "industries", "open_vacancies"]
+
+
+def open_cache(cache_path=CACHE_PATH):
+    """
+    Открывает (и при необходимости создает) SQLite-кэш работодателей.
+    :param cache_path: Путь до файла кэша.
+    :return: Соединение с базой.
+    """
+    directory = os.path.dirname(cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(cache_path, timeout=60)
+    connection.execute("CREATE TABLE IF NOT EXISTS employers "
+                       "(id TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL)")
+    return connection
+
+
+def read_cached(connection, employer_ids, ttl=CACHE_TTL):
+    """
+    Достает из кэша непросроченные записи о работодателях.
+    :param connection: Соединение с кэшем.
+    :param employer_ids: Идентификаторы работодателей.
+    :param ttl: Время жизни записи в секундах.
+    :return: Словарь {идентификатор_работодателя: данные}.
+    """
+    cached = {}
+    min_fetched_at = time.time() - ttl
+    employer_ids = list(employer_ids)
+    # SQLite ограничивает количество параметров в одном запросе
+    for start in range(0, len(employer_ids), 500):
+        chunk = employer_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = connection.execute(f"SELECT id, data FROM employers WHERE fetched_at >= ? AND id IN ({placeholders})",
+                                  [min_fetched_at, *chunk])
+        for emp_id, data in rows:
+            cached[emp_id] = json.loads(data)
+    return cached
+
+
+def write_cached(connection, employers):
+    """
+    Сохраняет сведения о работодателях в кэш.
+    :param connection: Соединение с кэшем.
+    :param employers: Словарь {идентификатор_работодателя: данные}.
+    :return: Ничего
+    """
+    now = time.time()
+    connection.executemany("INSERT OR REPLACE INTO employers (id, data, fetched_at) VALUES (?, ?, ?)",
+                           [(emp_id, json.dumps(data, ensure_ascii=False), now) for emp_id, data in employers.items()])
+    connection.commit()
+
+
+async def fetch_employers_async(employer_ids, concurrency=8, requests_per_second=10, api_url=async_fetcher.API_URL):
+    """
+    Параллельно запрашивает сведения о работодателях, каждого ровно один раз.
+    :param employer_ids: Уникальные идентификаторы работодателей.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :param api_url: Адрес API.
+    :return: Словарь {идентификатор_работодателя: данные}, неудачные запросы в него не попадают.
+    """
+    limiter = async_fetcher.TokenBucket(requests_per_second)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(emp_id):
+        async with semaphore:
+            response = await async_fetcher.fetch_json(client, limiter, executor, f'{api_url}/employers/{emp_id}', {})
+        if response is None:
+            return emp_id, None
+        return emp_id, {field: response.get(field) for field in EMPLOYER_FIELDS if field in response}
+
+    client = http_client.get_client()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = await asyncio.gather(*[fetch_one(emp_id) for emp_id in employer_ids])
+    return {emp_id: data for emp_id, data in results if data is not None}
+
+
+def get_employers(employer_ids, cache_path=CACHE_PATH, ttl=CACHE_TTL, concurrency=8, requests_per_second=10,
+                  api_url=async_fetcher.API_URL):
+    """
+    Возвращает сведения о работодателях, запрашивая у API только тех, кого нет в кэше или чья запись устарела.
+    :param employer_ids: Идентификаторы работодателей, могут повторяться.
+    :param cache_path: Путь до файла кэша.
+    :param ttl: Время жизни записи в кэше в секундах.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :param api_url: Адрес API.
+    :return: Словарь {идентификатор_работодателя: данные} с полями type, industries и open_vacancies.
+    """
+    unique_ids = {str(emp_id) for emp_id in employer_ids if emp_id is not None}
+    connection = open_cache(cache_path)
+    try:
+        employers = read_cached(connection, unique_ids, ttl)
+        missing = sorted(unique_ids.difference(employers))
+        if missing:
+            print(f"Запрашиваем {len(missing)} работодателей из {len(unique_ids)}")
+            fetched = asyncio.run(fetch_employers_async(missing, concurrency, requests_per_second, api_url))
+            write_cached(connection, fetched)
+            employers.update(fetched)
+    finally:
+        connection.close()
+    return employers
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from python_modules import dataset_store
+from python_modules import location_cache
+from python_modules import pipeline
+from python_modules import streaming_stats
+
+CACHE_DIRECTORY = 'cache/features'
+# признаки как в разделе построения модели ноутбука
+DEFAULT_CONFIG = {
+    # этапы pipeline.py, которые выполняются над каждым файлом хранилища перед кодированием
+    # этапы должны сохранять все строки: те же этапы выполняет salary_prediction перед предсказанием
+    "stages": ["net_salary_stage", "professional_role_stage", "location_stage"],
+    # этапы pipeline.py, которые отбрасывают строки, выполняются после stages только при построении матрицы;
+    # как в ноутбуке, границы выбросов считаются уже по отфильтрованным вакансиям
+    "filters": ["moscow_or_remote_stage"],
+    "target": "salary",
+    "numeric": ["industries_count", "vacancies_count", "phones_count", "lat", "lon", "stations_within_km",
+                "distance_to_the_nearest(m)"],
+    "categorical": ["industry", "AO", "schedule", "experience", "employment", "employer_type", "professional_roles"],
+    "boolean": ["accept_incomplete_resumes", "accept_temporary"],
+    # значения, которые остаются как есть, остальные заменяются вторым элементом
+    "collapse": {"employment": ["Полная занятость", "Не полная занятость"],
+                 "employer_type": ["company", "not a company"]},
+    # категории реже этого количества не получают своего столбца
+    "min_frequency": 1,
+    # убирать выбросы зарплаты за полутора межквартильными размахами внутри отрасли
+    "remove_outliers": True,
+}
+
+
+class FeatureTransformer:
+    """
+    Кодирование вакансий в разреженную матрицу: числовые признаки заполняются медианой и масштабируются
+    как в RobustScaler (минус медиана, деленное на межквартильный размах), категориальные заполняются
+    самым частым значением и кодируются one-hot, булевы становятся 0/1.
+    Обучается по частям (partial_fit), медиана и квартили берутся из скетча квантилей, так что память
+    не зависит от количества вакансий. Объект сериализуется pickle.
+    """
+
+    def __init__(self, config=None):
+        """
+        :param config: Настройки из DEFAULT_CONFIG.
+        """
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.sketches = {col: streaming_stats.QuantileSketch(seed=0) for col in self.config["numeric"]}
+        self.counters = {col: Counter() for col in self.config["categorical"] + self.config["boolean"]}
+        self.centers = None
+        self.scales = None
+        self.vocabularies = None
+        self.fill_values = None
+
+    def collapse(self, df):
+        """
+        Объединяет редкие значения по правилам collapse.
+        :param df: DataFrame.
+        :return: DataFrame.
+        """
+        for col, (kept, other) in self.config["collapse"].items():
+            if col in df.columns:
+                df[col] = df[col].where(df[col].isna() | (df[col] == kept), other)
+        return df
+
+    def partial_fit(self, df):
+        """
+        Учитывает часть вакансий.
+        :param df: DataFrame с признаками из настроек.
+        :return: self
+        """
+        df = self.collapse(df.copy())
+        for col, sketch in self.sketches.items():
+            sketch.update(pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float))
+        for col, counter in self.counters.items():
+            counter.update(df[col].dropna().tolist())
+        return self
+
+    def finish_fit(self):
+        """
+        Фиксирует словари категорий, медианы и масштабы после всех partial_fit.
+        :return: self
+        """
+        self.centers = {}
+        self.scales = {}
+        for col, sketch in self.sketches.items():
+            q25, q50, q75 = sketch.quantile([0.25, 0.5, 0.75])
+            self.centers[col] = 0.0 if np.isnan(q50) else q50
+            self.scales[col] = 1.0 if np.isnan(q75 - q25) or q75 == q25 else q75 - q25
+        self.vocabularies = {}
+        self.fill_values = {}
+        for col, counter in self.counters.items():
+            self.fill_values[col] = counter.most_common(1)[0][0] if counter else None
+            if col in self.config["categorical"]:
+                self.vocabularies[col] = sorted(str(value) for value, count in counter.items()
+                                                if count >= self.config["min_frequency"])
+        return self
+
+    def fit(self, frames):
+        """
+        Обучает кодирование на наборе частей.
+        :param frames: Итерируемые DataFrame.
+        :return: self
+        """
+        for df in frames:
+            self.partial_fit(df)
+        return self.finish_fit()
+
+    def feature_names_out(self):
+        """
+        Названия столбцов матрицы в порядке transform.
+        :return: Список строк.
+        """
+        names = list(self.config["numeric"])
+        for col in self.config["categorical"]:
+            names.extend(f"{col}_{value}" for value in self.vocabularies[col])
+        names.extend(self.config["boolean"])
+        return names
+
+    def transform(self, df):
+        """
+        Кодирует вакансии. Категории, которых не было при обучении, дают нулевую строку в своем блоке.
+        :param df: DataFrame с признаками из настроек.
+        :return: scipy.sparse.csr_matrix формы (len(df), len(feature_names_out())).
+        """
+        df = self.collapse(df.copy())
+        n = len(df)
+        rows, cols, data = [], [], []
+        offset = 0
+        for col in self.config["numeric"]:
+            values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+            values = (np.where(np.isnan(values), self.centers[col], values) - self.centers[col]) / self.scales[col]
+            nonzero = np.flatnonzero(values)
+            rows.append(nonzero)
+            cols.append(np.full(nonzero.shape[0], offset))
+            data.append(values[nonzero])
+            offset += 1
+        for col in self.config["categorical"]:
+            values = df[col].where(df[col].notna(), self.fill_values[col]).astype(object)
+            values = values.where(values.isna(), values.astype(str))
+            codes = pd.Categorical(values, categories=self.vocabularies[col]).codes
+            known = np.flatnonzero(codes >= 0)
+            rows.append(known)
+            cols.append(offset + codes[known].astype(np.int64))
+            data.append(np.ones(known.shape[0]))
+            offset += len(self.vocabularies[col])
+        for col in self.config["boolean"]:
+            values = df[col].where(df[col].notna(), self.fill_values[col]).fillna(False).astype(bool).to_numpy()
+            true_rows = np.flatnonzero(values)
+            rows.append(true_rows)
+            cols.append(np.full(true_rows.shape[0], offset))
+            data.append(np.ones(true_rows.shape[0]))
+            offset += 1
+        return sp.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(n, offset))
+
+
+def parts_signature(parts):
+    """
+    Отпечаток файлов хранилища: пути, размеры и время изменения.
+    :param parts: Пути до файлов.
+    :return: Список кортежей.
+    """
+    return [(path.replace(os.sep, "/"), os.path.getsize(path), os.stat(path).st_mtime_ns) for path in parts]
+
+
+def cache_key(parts, config):
+    """
+    Ключ кэша: хэш отпечатка файлов и настроек.
+    :param parts: Пути до файлов хранилища.
+    :param config: Настройки.
+    :return: Строка из 16 шестнадцатеричных символов.
+    """
+    payload = json.dumps({"parts": parts_signature(parts), "config": config}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def read_part(path):
+    """
+    Читает файл хранилища целиком и разбирает вложенные столбцы из json.
+    :param path: Путь до файла.
+    :return: DataFrame.
+    """
+    df = dataset_store.read_part(path)
+    for col in dataset_store.NESTED_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].apply(lambda x: json.loads(x) if isinstance(x, str) else x)
+    return df
+
+
+def prepare_part(path, config):
+    """
+    Читает файл хранилища и выполняет над ним этапы из настроек, затем фильтры.
+    Этапы сохраняют индекс строк файла, поэтому маска строится по индексу оставшихся после фильтров строк.
+    :param path: Путь до файла.
+    :param config: Настройки.
+    :return: Кортеж (подготовленный DataFrame со всеми строками файла, булева маска прошедших фильтры строк).
+    """
+    df = pipeline.run_stages(read_part(path), [getattr(pipeline, name) for name in config["stages"]])
+    passed = pipeline.run_stages(df, [getattr(pipeline, name) for name in config["filters"]])
+    mask = np.zeros(len(df), dtype=bool)
+    mask[df.index.get_indexer(passed.index)] = True
+    return df, mask
+
+
+def spill_parts(parts, config, directory):
+    """
+    Первый проход по хранилищу: каждый файл подготавливается один раз и сохраняется во временную директорию,
+    чтобы обучение и кодирование не выполняли этапы (и location_stage) заново.
+    :param parts: Пути до файлов хранилища в порядке записи.
+    :param config: Настройки.
+    :param directory: Временная директория для подготовленных файлов.
+    :return: Кортеж (пути до подготовленных файлов в порядке parts, DataFrame с ключами и зарплатой всех строк).
+    """
+    spilled, frames = [], []
+    for part_idx, path in enumerate(parts):
+        df, passed = prepare_part(path, config)
+        spilled.append(os.path.join(directory, f"{part_idx}.pkl"))
+        df.to_pickle(spilled[-1])
+        area = df["area"].astype(str) if "area" in df.columns else "None"
+        frames.append(pd.DataFrame({"part": part_idx, "area": area, "industry": df["industry"],
+                                    "id": df["id"].astype(str), "passed": passed,
+                                    "salary": pd.to_numeric(df[config["target"]], errors="coerce")}))
+    index = pd.concat(frames, ignore_index=True) if frames else None
+    return spilled, index
+
+
+def keep_masks(index, part_count, config):
+    """
+    Для каждого файла маска строк, которые остаются после удаления повторов (последняя версия вакансии,
+    как в dataset_store.load_vacancies), фильтров из настроек и, если нужно, выбросов зарплаты внутри отрасли.
+    Границы выбросов, как в ноутбуке, считаются уже по отфильтрованным вакансиям.
+    :param index: DataFrame из spill_parts.
+    :param part_count: Количество файлов.
+    :param config: Настройки.
+    :return: Список булевых масок в порядке файлов.
+    """
+    if index is None:
+        return []
+    keep = ~index.duplicated(subset=["area", "industry", "id"], keep="last").to_numpy()
+    keep &= index["passed"].to_numpy()
+    if config["remove_outliers"]:
+        salary = index["salary"]
+        grouped = salary[keep].groupby(index.loc[keep, "industry"])
+        q25, q75 = grouped.quantile(0.25), grouped.quantile(0.75)
+        cut_off = (q75 - q25) * 1.5
+        lower = index["industry"].map(q25 - cut_off)
+        upper = index["industry"].map(q75 + cut_off)
+        keep &= ((salary >= lower) & (salary <= upper)).to_numpy()
+    return [keep[index["part"].to_numpy() == part_idx] for part_idx in range(part_count)]
+
+
+def prepared_parts(spilled, masks):
+    """
+    Читает подготовленные файлы по одному и оставляет строки по маскам.
+    :param spilled: Пути из spill_parts.
+    :param masks: Маски строк из keep_masks.
+    :return: Генератор DataFrame.
+    """
+    for path, mask in zip(spilled, masks):
+        if not mask.any():
+            continue
+        yield pd.read_pickle(path).loc[mask].reset_index(drop=True)
+
+
+def build_feature_matrix(root=dataset_store.DATASETS_PATH, config=None, cache_directory=CACHE_DIRECTORY,
+                         industries=None, areas=None):
+    """
+    Строит разреженную матрицу признаков по хранилищу вакансий или загружает ее из кэша.
+    Файлы читаются по одному: первый проход выполняет этапы и фильтры и сохраняет подготовленные файлы
+    во временную директорию, после него убираются повторы и выбросы, второй проход обучает FeatureTransformer,
+    третий кодирует; в памяти одновременно только один файл и матрица.
+    Ключ кэша - хэш файлов хранилища и настроек, так что повторные эксперименты загружают готовую матрицу.
+    :param root: Корневая директория хранилища.
+    :param config: Настройки, переопределяющие DEFAULT_CONFIG.
+    :param cache_directory: Директория кэша.
+    :param industries: Названия отраслей, по умолчанию все.
+    :param areas: Идентификаторы регионов, по умолчанию все.
+    :return: Кортеж (матрица csr, массив таргетов, массив отраслей по строкам, FeatureTransformer).
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    parts = dataset_store.list_parts(root, industries, areas)
+    directory = os.path.join(cache_directory, cache_key(parts, config))
+    if os.path.exists(os.path.join(directory, "transformer.pkl")):
+        with open(os.path.join(directory, "transformer.pkl"), "rb") as infile:
+            transformer = pickle.load(infile)
+        return (sp.load_npz(os.path.join(directory, "X.npz")), np.load(os.path.join(directory, "y.npy")),
+                np.load(os.path.join(directory, "industry.npy")), transformer)
+
+    os.makedirs(cache_directory, exist_ok=True)
+    blocks, targets, industry = [], [], []
+    with tempfile.TemporaryDirectory(dir=cache_directory) as spill_directory:
+        spilled, index = spill_parts(parts, config, spill_directory)
+        masks = keep_masks(index, len(parts), config)
+        transformer = FeatureTransformer(config).fit(prepared_parts(spilled, masks))
+        for df in prepared_parts(spilled, masks):
+            blocks.append(transformer.transform(df))
+            targets.append(df[config["target"]].to_numpy(dtype=float))
+            industry.append(df["industry"].astype(str).to_numpy())
+    matrix = sp.vstack(blocks, format="csr") if blocks else \
+        sp.csr_matrix((0, len(transformer.feature_names_out())))
+    y = np.concatenate(targets) if targets else np.empty(0)
+    industry = np.concatenate(industry).astype(str) if industry else np.empty(0, dtype=str)
+    if "location_stage" in config["stages"]:
+        # новые координаты, посчитанные location_stage, сохраняются для следующих запусков
+        pipeline.get_location_cache().save(location_cache.CACHE_PATH, location_cache.sources_version(
+            pipeline.STATIONS_PATH, pipeline.DISTRICTS_PATH))
+
+    os.makedirs(directory, exist_ok=True)
+    sp.save_npz(os.path.join(directory, "X.npz"), matrix)
+    np.save(os.path.join(directory, "y.npy"), y)
+    np.save(os.path.join(directory, "industry.npy"), industry)
+    # трансформер пишется последним: по нему определяется, что кэш записан целиком
+    with open(os.path.join(directory, "transformer.pkl"), "wb") as outfile:
+        pickle.dump(transformer, outfile)
+    return matrix, y, industry, transformer
@@ -0,0 +1,211 @@
+import email.utils
+import functools
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# адрес можно подменить переменной окружения, например чтобы собирать с локального тестового сервера
+API_URL = os.environ.get('HH_API_URL', 'https://api.hh.ru')
+HEADERS = {
+    'HH-User-Agent': 'my-app/0.0.1',
+}
+# 400 и 403 hh.ru отдает при слишком частых запросах, поэтому их тоже повторяем
+RETRY_STATUSES = {400, 403, 429, 500, 502, 503, 504}
+
+
+class ClientMetrics:
+    """
+    Счетчики запросов по эндпоинтам: количество, повторы, ошибки, байты и задержки.
+    Идентификаторы в пути заменяются на {id}, так что /employers/1 и /employers/2 считаются вместе.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    @staticmethod
+    def endpoint(url):
+        """
+        Название эндпоинта по адресу запроса.
+        :param url: Адрес запроса.
+        :return: Путь с идентификаторами, замененными на {id}.
+        """
+        return re.sub(r"/\d+(?=/|$)", "/{id}", urlparse(url).path) or "/"
+
+    def record(self, url, latency=None, size=0, status=None, retry=False, error=False):
+        """
+        Учитывает одну попытку запроса.
+        :param url: Адрес запроса.
+        :param latency: Время ответа в секундах, если ответ получен.
+        :param size: Размер тела ответа в байтах.
+        :param status: HTTP-статус ответа.
+        :param retry: Попытка будет повторена.
+        :param error: Запрос окончательно не удался.
+        :return: Ничего
+        """
+        with self.lock:
+            stats = self.endpoints.setdefault(self.endpoint(url), {
+                "requests": 0, "retries": 0, "errors": 0, "bytes": 0, "latency_total": 0.0, "latency_max": 0.0,
+                "statuses": {},
+            })
+            stats["requests"] += 1
+            stats["retries"] += int(retry)
+            stats["errors"] += int(error)
+            stats["bytes"] += size
+            if latency is not None:
+                stats["latency_total"] += latency
+                stats["latency_max"] = max(stats["latency_max"], latency)
+            if status is not None:
+                stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+
+    def summary(self):
+        """
+        Сводка по эндпоинтам.
+        :return: Словарь {эндпоинт: счетчики и средняя задержка}.
+        """
+        with self.lock:
+            return {endpoint: {**stats, "statuses": dict(stats["statuses"]),
+                               "latency_mean": stats["latency_total"] / stats["requests"] if stats["requests"] else 0.0}
+                    for endpoint, stats in self.endpoints.items()}
+
+
+class RequestBudget:
+    """
+    Общий для нескольких процессов бюджет запросов в секунду. В разделяемой памяти хранится время,
+    когда можно сделать следующий запрос, и каждый запрос сдвигает его на 1 / requests_per_second.
+    Объект передается в процессы при их создании, например через initargs пула.
+    """
+
+    def __init__(self, requests_per_second):
+        """
+        :param requests_per_second: Суммарное количество запросов в секунду для всех процессов.
+        """
+        self.interval = 1.0 / requests_per_second
+        self.next_time = multiprocessing.Value('d', 0.0)
+
+    def acquire(self):
+        """
+        Ждет своей очереди на запрос.
+        :return: Ничего
+        """
+        with self.next_time.get_lock():
+            now = time.time()
+            slot = max(now, self.next_time.value)
+            self.next_time.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HttpClient:
+    """
+    Общий клиент API: одна сессия с пулом keep-alive соединений, экспоненциальные паузы со случайной
+    составляющей между повторами, учет заголовка Retry-After и счетчики по эндпоинтам.
+    Сессия requests потокобезопасна для GET-запросов, поэтому один клиент используется всеми сборщиками.
+    """
+
+    def __init__(self, pool_size=64, retry_count=5, backoff_base=0.5, backoff_max=60.0, timeout=(10, 60)):
+        """
+        :param pool_size: Максимальное количество одновременно открытых соединений.
+        :param retry_count: Количество попыток на один запрос.
+        :param backoff_base: Пауза перед первым повтором в секундах, дальше она удваивается.
+        :param backoff_max: Максимальная пауза между повторами, если сервер не прислал Retry-After.
+        :param timeout: Таймауты подключения и чтения.
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(HEADERS)
+        self.retry_count = retry_count
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.metrics = ClientMetrics()
+        # общий бюджет запросов, если процессов несколько, см. RequestBudget
+        self.budget = None
+
+    def backoff(self, attempt, response=None):
+        """
+        Пауза перед следующей попыткой: значение Retry-After, если сервер его прислал (без ограничения
+        backoff_max, иначе повторы придут раньше, чем разрешил сервер, и снова получат 429/403),
+        иначе случайное время от нуля до min(backoff_max, backoff_base * 2 ** attempt).
+        :param attempt: Номер неудачной попытки, начиная с нуля.
+        :param response: Ответ сервера, если он был.
+        :return: Пауза в секундах.
+        """
+        retry_after = None if response is None else response.headers.get("Retry-After")
+        if retry_after:
+            if retry_after.isdigit():
+                return float(retry_after)
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                return max(0.0, retry_at.timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def get_json(self, url, params=None, acquire=None):
+        """
+        GET-запрос с повторами.
+        :param url: Адрес запроса.
+        :param params: Параметры запроса.
+        :param acquire: Функция, которая вызывается перед каждой попыткой, например для ограничения частоты.
+        :return: Ответ в виде словаря или None, если получить его не удалось.
+        """
+        for attempt in range(self.retry_count):
+            last_attempt = attempt == self.retry_count - 1
+            if acquire is not None:
+                acquire()
+            if self.budget is not None:
+                self.budget.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                # обрыв соединения, таймаут, оборванное или неверно сжатое тело ответа
+                self.metrics.record(url, retry=not last_attempt, error=last_attempt)
+                print(f"Retrying due to request error: {e!r}")
+                if not last_attempt:
+                    time.sleep(self.backoff(attempt))
+                continue
+            latency = time.perf_counter() - start
+            size = len(response.content)
+            if response.ok:
+                try:
+                    data = response.json()
+                except ValueError as e:
+                    # обрезанный ответ или html-страница вместо json повторяются как ошибка сервера
+                    self.metrics.record(url, latency, size, response.status_code, retry=not last_attempt,
+                                        error=last_attempt)
+                    print(f"Retrying due to invalid json for url: {response.url}: {e}")
+                    if not last_attempt:
+                        time.sleep(self.backoff(attempt))
+                    continue
+                self.metrics.record(url, latency, size, response.status_code)
+                return data
+            if response.status_code not in RETRY_STATUSES:
+                self.metrics.record(url, latency, size, response.status_code, error=True)
+                print(f"HTTP error {response.status_code} for url: {response.url}")
+                return None
+            self.metrics.record(url, latency, size, response.status_code, retry=not last_attempt,
+                                error=last_attempt)
+            print(f"Retrying due to HTTP error {response.status_code} for url: {response.url}")
+            if not last_attempt:
+                time.sleep(self.backoff(attempt, response))
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_client():
+    """
+    Общий для всех сборщиков клиент, создается при первом обращении.
+    :return: HttpClient.
+    """
+    return HttpClient()
@@ -0,0 +1,202 @@
+import asyncio
+import heapq
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from python_modules import async_fetcher
+from python_modules import crawl_state
+from python_modules import http_client
+
+CACHE_PATH = 'cache/industry_counts.sqlite'
+# количество вакансий за промежуток, в который входит сегодняшний день, еще растет, поэтому кэш живет сутки
+CACHE_TTL = 24 * 60 * 60
+
+
+def flatten_industries(industries_tree):
+    """
+    Превращает дерево /industries в плоский список отраслей и подотраслей.
+    :param industries_tree: Ответ /industries.
+    :return: Список кортежей (идентификатор, название, идентификатор_родителя или None).
+    """
+    flat = []
+    for industry in industries_tree:
+        flat.append((industry["id"], industry["name"], None))
+        for sub_industry in industry.get("industries", []):
+            flat.append((sub_industry["id"], sub_industry["name"], industry["id"]))
+    return flat
+
+
+def open_cache(cache_path=CACHE_PATH):
+    """
+    Открывает (и при необходимости создает) кэш количества вакансий по отраслям.
+    :param cache_path: Путь до файла кэша.
+    :return: Соединение с базой.
+    """
+    directory = os.path.dirname(cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(cache_path, timeout=60)
+    connection.execute("CREATE TABLE IF NOT EXISTS counts "
+                       "(area TEXT, date_from TEXT, date_to TEXT, industry TEXT, found INTEGER NOT NULL, "
+                       "fetched_at REAL NOT NULL, PRIMARY KEY (area, date_from, date_to, industry))")
+    connection.execute("CREATE TABLE IF NOT EXISTS industries "
+                       "(id TEXT PRIMARY KEY, name TEXT NOT NULL, parent TEXT, fetched_at REAL NOT NULL)")
+    return connection
+
+
+def get_cached_industries(connection, ttl=CACHE_TTL, api_url=async_fetcher.API_URL):
+    """
+    Возвращает плоский список отраслей из кэша, а если он пуст или устарел - запрашивает дерево отраслей.
+    :param connection: Соединение с кэшем.
+    :param ttl: Время жизни записи в секундах.
+    :param api_url: Адрес API.
+    :return: Список кортежей (идентификатор, название, идентификатор_родителя или None).
+    """
+    rows = connection.execute("SELECT id, name, parent FROM industries WHERE fetched_at >= ? ORDER BY rowid",
+                              (time.time() - ttl,)).fetchall()
+    if rows:
+        return rows
+    industries = flatten_industries(fetch_industries_tree(api_url))
+    if industries:
+        now = time.time()
+        connection.execute("DELETE FROM industries")
+        connection.executemany("INSERT INTO industries (id, name, parent, fetched_at) VALUES (?, ?, ?, ?)",
+                               [(*industry, now) for industry in industries])
+        connection.commit()
+    return industries
+
+
+def read_cached_counts(connection, area_id, since_date, until_date, ttl=CACHE_TTL):
+    """
+    Достает из кэша непросроченные количества вакансий для промежутка.
+    :param connection: Соединение с кэшем.
+    :param area_id: Регион.
+    :param since_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :param ttl: Время жизни записи в секундах.
+    :return: Словарь {идентификатор_отрасли: количество_вакансий}.
+    """
+    rows = connection.execute("SELECT industry, found FROM counts "
+                              "WHERE area = ? AND date_from = ? AND date_to = ? AND fetched_at >= ?",
+                              (str(area_id), crawl_state.format_date(since_date), crawl_state.format_date(until_date),
+                               time.time() - ttl))
+    return dict(rows.fetchall())
+
+
+def write_cached_counts(connection, area_id, since_date, until_date, counts):
+    """
+    Сохраняет количества вакансий в кэш.
+    :param connection: Соединение с кэшем.
+    :param area_id: Регион.
+    :param since_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :param counts: Словарь {идентификатор_отрасли: количество_вакансий}.
+    :return: Ничего
+    """
+    now = time.time()
+    date_from, date_to = crawl_state.format_date(since_date), crawl_state.format_date(until_date)
+    connection.executemany("INSERT OR REPLACE INTO counts (area, date_from, date_to, industry, found, fetched_at) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           [(str(area_id), date_from, date_to, industry_id, found, now)
+                            for industry_id, found in counts.items()])
+    connection.commit()
+
+
+async def probe_counts_async(area_id, industry_ids, since_date, until_date, concurrency=8, requests_per_second=10,
+                             api_url=async_fetcher.API_URL):
+    """
+    Параллельно узнает количество вакансий каждой отрасли запросом с per_page=0.
+    :param area_id: Регион.
+    :param industry_ids: Идентификаторы отраслей и подотраслей.
+    :param since_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :param api_url: Адрес API.
+    :return: Словарь {идентификатор_отрасли: количество_вакансий}, неудачные запросы в него не попадают.
+    """
+    limiter = async_fetcher.TokenBucket(requests_per_second)
+
+    async def probe(industry_id):
+        params = async_fetcher.vacancies_params(area_id, industry_id, since_date, until_date, per_page=0)
+        response = await async_fetcher.fetch_json(client, limiter, executor, f'{api_url}/vacancies', params)
+        return industry_id, None if response is None else response["found"]
+
+    client = http_client.get_client()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = await asyncio.gather(*[probe(industry_id) for industry_id in industry_ids])
+    return {industry_id: found for industry_id, found in results if found is not None}
+
+
+def fetch_industries_tree(api_url=async_fetcher.API_URL):
+    """
+    Запрашивает дерево отраслей.
+    :param api_url: Адрес API.
+    :return: Ответ /industries.
+    """
+    return http_client.get_client().get_json(f'{api_url}/industries') or []
+
+
+def top_k(candidates, k):
+    """
+    Выбирает k отраслей с наибольшим количеством вакансий за один проход, держа в куче не больше k элементов.
+    :param candidates: Итерируемые кортежи (количество_вакансий, идентификатор_отрасли, название_отрасли).
+    :param k: Количество отраслей для возврата.
+    :return: Список из k кортежей по убыванию количества вакансий.
+    """
+    heap = []
+    for candidate in candidates:
+        if len(heap) < k:
+            heapq.heappush(heap, candidate)
+        elif heap[0][0] < candidate[0]:
+            heapq.heapreplace(heap, candidate)
+    return sorted(heap, reverse=True)
+
+
+def get_industry_counts(area_id, since_date, until_date, cache_path=CACHE_PATH, ttl=CACHE_TTL, concurrency=8,
+                        requests_per_second=10, api_url=async_fetcher.API_URL):
+    """
+    Возвращает количество вакансий всех отраслей и подотраслей за промежуток.
+    Запрашиваются только отрасли, которых нет в кэше для этого региона и промежутка,
+    дерево отраслей тоже берется из кэша.
+    :param area_id: Регион.
+    :param since_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :param cache_path: Путь до файла кэша.
+    :param ttl: Время жизни записи в кэше в секундах.
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :param api_url: Адрес API.
+    :return: Кортеж (список отраслей из flatten_industries, словарь {идентификатор_отрасли: количество_вакансий}).
+    """
+    connection = open_cache(cache_path)
+    try:
+        industries = get_cached_industries(connection, ttl, api_url)
+        counts = read_cached_counts(connection, area_id, since_date, until_date, ttl)
+        missing = [industry_id for industry_id, _, _ in industries if industry_id not in counts]
+        if missing:
+            fetched = asyncio.run(probe_counts_async(area_id, missing, since_date, until_date, concurrency,
+                                                     requests_per_second, api_url))
+            write_cached_counts(connection, area_id, since_date, until_date, fetched)
+            counts.update(fetched)
+    finally:
+        connection.close()
+    return industries, counts
+
+
+def get_top_k_industries(k, area_id, since_date, until_date, sub_industries=False, **kwargs):
+    """
+    Возвращает топ-K отраслей по количеству найденных вакансий.
+    :param k: Количество отраслей для возврата.
+    :param area_id: Идентификатор района https://github.com/hhru/api/blob/master/docs/areas.md
+    :param since_date: Дата, с которой начать поиск отраслей.
+    :param until_date: Дата, до которой вести поиск отраслей.
+    :param sub_industries: Выбирать среди подотраслей, а не среди отраслей верхнего уровня.
+    :param kwargs: Параметры get_industry_counts.
+    :return: Массив из топ-K отраслей в формате [(количество_вакансий, идентификатор_отрасли, название_отрасли)]
+    """
+    industries, counts = get_industry_counts(area_id, since_date, until_date, **kwargs)
+    return top_k(((counts[industry_id], industry_id, name) for industry_id, name, parent_id in industries
+                  if industry_id in counts and (parent_id is not None) == sub_industries), k)
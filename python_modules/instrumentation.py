@@ -0,0 +1,316 @@
+import argparse
+import collections
+import contextlib
+import cProfile
+import datetime
+import functools
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# текущий запуск; пока он не начат через start_run, замеры выключены и обертки только вызывают функцию.
+# Запуск свой у каждого процесса: этапы, выполненные в пуле процессов (например, в pipeline.run_pipeline),
+# в отчет родительского процесса не попадают
+_run = None
+_lock = threading.Lock()
+# сколько функций профиля попадает в отчет
+PROFILE_TOP = 30
+SAMPLE_INTERVAL = 0.005
+
+
+def peak_rss_mb():
+    """
+    Пиковая резидентная память процесса с его начала.
+    :return: Мегабайты или None, если модуля resource нет (Windows).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+class StackSampler(threading.Thread):
+    """
+    Сэмплирующий профилировщик: раз в interval секунд снимает стеки всех потоков процесса и считает,
+    сколько раз каждая функция была на вершине стека (self) и где-либо в стеке (total).
+    В отличие от cProfile почти не замедляет программу, но показывает доли времени, а не точные вызовы.
+    Снимаются и потоки, которые ждут (например, ответа API в пуле потоков), так что доли - это доли
+    времени жизни потоков, а не процессора.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        """
+        :param interval: Интервал между снимками в секундах.
+        """
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = collections.Counter()
+        self.total_counts = collections.Counter()
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def frame_name(frame):
+        """
+        Название функции кадра стека.
+        :param frame: Кадр.
+        :return: Строка файл:строка(функция).
+        """
+        code = frame.f_code
+        return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                self.samples += 1
+                self.self_counts[self.frame_name(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    seen.add(self.frame_name(frame))
+                    frame = frame.f_back
+                self.total_counts.update(seen)
+
+    def stop(self):
+        """
+        Останавливает сэмплирование.
+        :return: Ничего
+        """
+        self.stopped.set()
+        self.join()
+
+    def top(self, limit=PROFILE_TOP):
+        """
+        Функции с наибольшей долей снимков, в которых они были в стеке.
+        :param limit: Количество функций.
+        :return: Список словарей.
+        """
+        return [{"function": name, "total_share": count / self.samples,
+                 "self_share": self.self_counts[name] / self.samples}
+                for name, count in self.total_counts.most_common(limit)] if self.samples else []
+
+
+class Run:
+    """
+    Замеры одного запуска: время, процессорное время, строки и память по этапам, и, по желанию, профиль.
+    """
+
+    def __init__(self, profile=None, sample_interval=SAMPLE_INTERVAL):
+        """
+        :param profile: None, "cprofile" (точный профиль, заметно замедляет) или "sample" (сэмплирование стеков).
+        :param sample_interval: Интервал сэмплирования в секундах.
+        """
+        if profile not in (None, "cprofile", "sample"):
+            raise ValueError(f"Неизвестный профилировщик: {profile}")
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.stages = {}
+        self.profile = profile
+        self.profiler = None
+        self.sampler = None
+        if profile == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif profile == "sample":
+            self.sampler = StackSampler(sample_interval)
+            self.sampler.start()
+
+    def record(self, name, wall, cpu, rows, rss_before, rss_after):
+        """
+        Учитывает один проход этапа.
+        :param name: Название этапа.
+        :param wall: Время в секундах.
+        :param cpu: Процессорное время процесса в секундах (всех потоков, в том числе фоновых).
+        :param rows: Количество обработанных строк или None.
+        :param rss_before: Пиковая память процесса до этапа.
+        :param rss_after: Пиковая память процесса после этапа.
+        :return: Ничего
+        """
+        with _lock:
+            stats = self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": 0,
+                                                  "wall_max": 0.0, "peak_rss_mb": None, "rss_growth_mb": 0.0})
+            stats["calls"] += 1
+            stats["wall_seconds"] += wall
+            stats["cpu_seconds"] += cpu
+            stats["rows"] += rows or 0
+            stats["wall_max"] = max(stats["wall_max"], wall)
+            if rss_after is not None:
+                stats["peak_rss_mb"] = rss_after
+                # на сколько этап поднял пик памяти процесса
+                stats["rss_growth_mb"] += rss_after - rss_before
+
+    def profile_summary(self):
+        """
+        Останавливает профилировщик и возвращает самые дорогие функции.
+        :return: Словарь с режимом профиля и списком функций или None, если профиль не включен.
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+            stats = pstats.Stats(self.profiler, stream=io.StringIO()).sort_stats("cumulative")
+            top = []
+            for (filename, line, function), (_, calls, total, cumulative, _) in list(stats.stats.items()):
+                # обертки самих замеров в профиль не попадают
+                if filename == __file__:
+                    continue
+                top.append({"function": f"{filename}:{line}({function})", "calls": calls,
+                            "total_seconds": total, "cumulative_seconds": cumulative})
+            top.sort(key=lambda item: item["cumulative_seconds"], reverse=True)
+            return {"mode": "cprofile", "top": top[:PROFILE_TOP]}
+        if self.sampler is not None:
+            self.sampler.stop()
+            return {"mode": "sample", "interval": self.sampler.interval, "samples": self.sampler.samples,
+                    "top": self.sampler.top()}
+        return None
+
+    def report(self, **sections):
+        """
+        Отчет о запуске.
+        :param sections: Дополнительные разделы, например requests=http_client.get_client().metrics.summary().
+        :return: Словарь, который можно сохранить в json.
+        """
+        stages = {}
+        for name, stats in self.stages.items():
+            stages[name] = {**stats, "rows_per_second": stats["rows"] / stats["wall_seconds"]
+                            if stats["rows"] and stats["wall_seconds"] else None}
+        return {"started": self.started, "argv": sys.argv, "wall_seconds": time.perf_counter() - self.wall_start,
+                "cpu_seconds": time.process_time() - self.cpu_start, "peak_rss_mb": peak_rss_mb(),
+                "stages": stages, "profile": self.profile_summary(), **sections}
+
+
+def start_run(profile=None, sample_interval=SAMPLE_INTERVAL):
+    """
+    Включает замеры в текущем процессе. Дочерние процессы пулов замеров не ведут, отчет покрывает
+    только процесс, вызвавший start_run.
+    :param profile: None, "cprofile" или "sample", см. Run.
+    :param sample_interval: Интервал сэмплирования в секундах.
+    :return: Run.
+    """
+    global _run
+    _run = Run(profile, sample_interval)
+    return _run
+
+
+def finish_run(path=None, **sections):
+    """
+    Выключает замеры и собирает отчет. Если профиль cProfile включен, он сохраняется рядом в <path>.prof
+    для snakeviz или pstats.
+    :param path: Путь до json-файла с отчетом или None, чтобы только вернуть отчет.
+    :param sections: Дополнительные разделы отчета.
+    :return: Словарь отчета или None, если замеры не были включены.
+    """
+    global _run
+    run, _run = _run, None
+    if run is None:
+        return None
+    report = run.report(**sections)
+    if path is not None:
+        with open(path, "w", encoding='utf-8') as outfile:
+            json.dump(report, outfile, ensure_ascii=False, indent=2, default=str)
+        if run.profiler is not None:
+            run.profiler.dump_stats(path + ".prof")
+    return report
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """
+    Замер этапа: with instrumentation.stage("parser.write", rows=len(vacancies)): ...
+    Без начатого запуска ничего не делает.
+    :param name: Название этапа.
+    :param rows: Количество строк, которые обрабатывает этап.
+    :return: Контекстный менеджер.
+    """
+    run = _run
+    if run is None:
+        yield
+        return
+    rss_before = peak_rss_mb()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        run.record(name, time.perf_counter() - wall_start, time.process_time() - cpu_start, rows, rss_before,
+                   peak_rss_mb())
+
+
+def timed(name, rows_arg=None):
+    """
+    Декоратор замера функции как этапа.
+    :param name: Название этапа.
+    :param rows_arg: Номер позиционного аргумента, длина которого - количество строк. None - одна строка на вызов.
+    Если аргумент передан по имени, строки не считаются.
+    :return: Декоратор.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _run is None:
+                return func(*args, **kwargs)
+            if rows_arg is None:
+                rows = 1
+            else:
+                # аргумент, переданный по имени, не учитывается
+                rows = len(args[rows_arg]) if rows_arg < len(args) else None
+            with stage(name, rows):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def compare_reports(old, new, threshold=0.2, min_seconds=0.05):
+    """
+    Сравнивает два отчета и находит этапы, которые стали медленнее.
+    :param old: Отчет прошлого запуска (словарь или путь до json).
+    :param new: Отчет нового запуска (словарь или путь до json).
+    :param threshold: Относительное ухудшение, начиная с которого этап считается регрессией.
+    :param min_seconds: Этапы короче этого в обоих отчетах не сравниваются, их время - шум.
+    :return: Список словарей (этап, метрика, было, стало, изменение), сначала самые сильные ухудшения.
+    """
+    reports = []
+    for report in (old, new):
+        if isinstance(report, str):
+            with open(report, encoding='utf-8') as infile:
+                report = json.load(infile)
+        reports.append(report)
+    old, new = reports
+    regressions = []
+    for name in sorted(set(old["stages"]) & set(new["stages"])):
+        before, after = old["stages"][name], new["stages"][name]
+        if max(before["wall_seconds"], after["wall_seconds"]) < min_seconds:
+            continue
+        # при разном объеме данных сравнивается скорость, а не время
+        if before["rows_per_second"] and after["rows_per_second"]:
+            metric, was, now = "rows_per_second", before["rows_per_second"], after["rows_per_second"]
+            change = was / now - 1
+        else:
+            metric, was, now = "wall_seconds", before["wall_seconds"], after["wall_seconds"]
+            change = now / was - 1 if was else float("inf")
+        if change > threshold:
+            regressions.append({"stage": name, "metric": metric, "old": was, "new": now, "change": change})
+    return sorted(regressions, key=lambda item: item["change"], reverse=True)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Сравнение двух отчетов о запуске")
+    arg_parser.add_argument("old", help="отчет прошлого запуска")
+    arg_parser.add_argument("new", help="отчет нового запуска")
+    arg_parser.add_argument("--threshold", type=float, default=0.2, help="допустимое относительное ухудшение")
+    args = arg_parser.parse_args()
+    found = compare_reports(args.old, args.new, args.threshold)
+    for item in found:
+        print(f"{item['stage']}: {item['metric']} {item['old']:.3f} -> {item['new']:.3f} ({item['change']:+.0%})")
+    sys.exit(1 if found else 0)
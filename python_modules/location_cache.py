@@ -0,0 +1,287 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from python_modules import preprocess
+
+CACHE_PATH = 'cache/location_features.npz'
+# 5 знаков после запятой - около метра, адреса hh.ru точнее не бывают
+PRECISION = 5
+# около 200 байт на координату вместе со словарем, миллион координат - примерно 200 МБ
+MAX_SIZE = 1_000_000
+# прямоугольник вокруг Москвы вместе с Новой Москвой: (мин. широта, мин. долгота, макс. широта, макс. долгота)
+MOSCOW_BOUNDS = (55.10, 36.80, 56.05, 38.00)
+FEATURE_COLUMNS = ["stations_within_km", "distance_to_the_nearest(m)", "AO"]
+
+
+def to_float(values):
+    """
+    Приводит широты или долготы к массиву float, нечисловые значения становятся пропусками.
+    :param values: Массив или Series.
+    :return: Массив float.
+    """
+    return pd.to_numeric(pd.Series(np.asarray(values, dtype=object)), errors="coerce").to_numpy(dtype=float)
+
+
+def location_keys(lat, lon, precision=PRECISION):
+    """
+    Ключи координат: широта и долгота, округленные до precision знаков, упакованные в одно число.
+    :param lat: Широты без пропусков.
+    :param lon: Долготы без пропусков.
+    :param precision: Количество знаков после запятой.
+    :return: Массив int64.
+    """
+    scale = 10 ** precision
+    lat_key = np.round((np.asarray(lat) + 90) * scale).astype(np.int64)
+    lon_key = np.round((np.asarray(lon) + 180) * scale).astype(np.int64)
+    return (lat_key << 32) | lon_key
+
+
+def key_coordinates(keys, precision=PRECISION):
+    """
+    Координаты, по которым считаются признаки ключа, - центр ячейки округления.
+    :param keys: Массив ключей из location_keys.
+    :param precision: Количество знаков после запятой.
+    :return: Кортеж (широты, долготы).
+    """
+    scale = 10 ** precision
+    return (keys >> 32) / scale - 90, (keys & 0xFFFFFFFF) / scale - 180
+
+
+def sources_version(*paths):
+    """
+    Версия исходных данных для кэша: если файл станций или районов поменялся, сохраненный кэш не используется.
+    :param paths: Пути до файлов, от которых зависят признаки.
+    :return: Строка.
+    """
+    return ";".join(f"{path}:{os.path.getmtime(path)}:{os.path.getsize(path)}" if os.path.exists(path)
+                    else f"{path}:missing" for path in paths)
+
+
+class LocationCache:
+    """
+    Кэш признаков местоположения: количество станций метро в радиусе километра, расстояние до ближайшей
+    и административный округ. Признаки считаются только для координат, которых еще нет в кэше,
+    так что обработка датасета стоит O(уникальных адресов), а не O(строк).
+    Значения лежат в массивах numpy, а OrderedDict хранит ключ -> номер ячейки в порядке использования;
+    при переполнении вытесняется давно не использованный ключ.
+    """
+
+    def __init__(self, stations_index, mo_gdf, districts_index=None, max_size=MAX_SIZE, precision=PRECISION):
+        """
+        :param stations_index: Индекс станций из preprocess.build_stations_index.
+        :param mo_gdf: Геофрейм административных округов.
+        :param districts_index: Индекс из preprocess.build_districts_index, по умолчанию строится по mo_gdf.
+        :param max_size: Максимальное количество координат в кэше.
+        :param precision: Количество знаков после запятой при округлении координат.
+        """
+        self.stations_index = stations_index
+        self.mo_gdf = mo_gdf
+        self.districts_index = districts_index if districts_index is not None \
+            else preprocess.build_districts_index(mo_gdf)
+        self.max_size = max_size
+        self.precision = precision
+        self.slots = OrderedDict()
+        self.counts = np.empty(max_size, dtype=np.float64)
+        self.distances = np.empty(max_size, dtype=np.float64)
+        self.ao_codes = np.empty(max_size, dtype=np.int32)
+        self.ao_names = []
+        self.ao_index = {}
+        self.grid = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def ao_code(self, name):
+        """
+        Код названия округа.
+        :param name: Название.
+        :return: Номер в self.ao_names.
+        """
+        code = self.ao_index.get(name)
+        if code is None:
+            code = self.ao_index[name] = len(self.ao_names)
+            self.ao_names.append(name)
+        return code
+
+    def compute(self, lat, lon):
+        """
+        Считает признаки заново.
+        :param lat: Широты.
+        :param lon: Долготы.
+        :return: Кортеж массивов (количество станций, расстояние до ближайшей, коды округов).
+        """
+        features = preprocess.get_stations_features(lat, lon, stations_index=self.stations_index)
+        ao = preprocess.find_AO_vectorized(lat, lon, self.mo_gdf, self.districts_index)
+        return (features["stations_within_km"].to_numpy(), features["distance_to_the_nearest(m)"].to_numpy(),
+                np.array([self.ao_code(name) for name in ao], dtype=np.int32))
+
+    def store(self, keys, counts, distances, ao_codes):
+        """
+        Кладет посчитанные признаки в кэш, вытесняя давно не использованные.
+        Если новых ключей больше max_size, остаются последние из них.
+        :return: Ничего
+        """
+        for i in range(max(0, len(keys) - self.max_size), len(keys)):
+            slot = self.slots.get(keys[i])
+            if slot is not None:
+                self.slots.move_to_end(keys[i])
+            elif len(self.slots) < self.max_size:
+                slot = len(self.slots)
+            else:
+                _, slot = self.slots.popitem(last=False)
+            self.slots[keys[i]] = slot
+            self.counts[slot], self.distances[slot], self.ao_codes[slot] = counts[i], distances[i], ao_codes[i]
+
+    def lookup_keys(self, keys):
+        """
+        Признаки для уникальных ключей: из кэша или посчитанные заново.
+        :param keys: Массив уникальных ключей.
+        :return: Кортеж массивов (количество станций, расстояние до ближайшей, коды округов).
+        """
+        counts = np.empty(len(keys))
+        distances = np.empty(len(keys))
+        ao_codes = np.empty(len(keys), dtype=np.int32)
+        missing = []
+        for i, key in enumerate(keys.tolist()):
+            slot = self.slots.get(key)
+            if slot is None:
+                missing.append(i)
+                continue
+            self.slots.move_to_end(key)
+            counts[i], distances[i], ao_codes[i] = self.counts[slot], self.distances[slot], self.ao_codes[slot]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            missing = np.array(missing)
+            new_counts, new_distances, new_codes = self.compute(*key_coordinates(keys[missing], self.precision))
+            counts[missing], distances[missing], ao_codes[missing] = new_counts, new_distances, new_codes
+            self.store(keys[missing].tolist(), new_counts, new_distances, new_codes)
+        return counts, distances, ao_codes
+
+    def lookup(self, lat, lon):
+        """
+        Признаки местоположения для всех точек. Точки внутри плотной сетки (build_grid) берутся из нее
+        по индексу массива, остальные - из кэша по округленным координатам.
+        :param lat: Широты точек (массив или Series, пропуски допустимы).
+        :param lon: Долготы точек.
+        :return: DataFrame со столбцами stations_within_km, distance_to_the_nearest(m) и AO.
+        """
+        index = lat.index if isinstance(lat, pd.Series) else None
+        lat, lon = to_float(lat), to_float(lon)
+        counts = np.full(lat.shape[0], np.nan)
+        distances = np.full(lat.shape[0], np.nan)
+        ao_codes = np.full(lat.shape[0], self.ao_code(preprocess.NOT_IN_MOSCOW), dtype=np.int32)
+
+        rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        if self.grid is not None and rows.shape[0]:
+            in_grid, cells = self.grid.cells(lat[rows], lon[rows])
+            grid_rows = rows[in_grid]
+            counts[grid_rows] = self.grid.counts[cells[in_grid]]
+            distances[grid_rows] = self.grid.distances[cells[in_grid]]
+            ao_codes[grid_rows] = self.grid.ao_codes[cells[in_grid]]
+            rows = rows[~in_grid]
+        if rows.shape[0]:
+            unique_keys, inverse = np.unique(location_keys(lat[rows], lon[rows], self.precision),
+                                             return_inverse=True)
+            unique_counts, unique_distances, unique_codes = self.lookup_keys(unique_keys)
+            counts[rows] = unique_counts[inverse]
+            distances[rows] = unique_distances[inverse]
+            ao_codes[rows] = unique_codes[inverse]
+        return pd.DataFrame({"stations_within_km": counts, "distance_to_the_nearest(m)": distances,
+                             "AO": np.array(self.ao_names, dtype=object)[ao_codes]}, index=index)
+
+    def build_grid(self, bounds=MOSCOW_BOUNDS, step=0.001):
+        """
+        Заранее считает признаки в центрах ячеек сетки, после чего поиск точки внутри сетки - это индекс массива.
+        Признаки становятся приближенными: точка получает значения центра своей ячейки, при шаге 0.001 градуса
+        это до 55 метров по широте и 30 по долготе.
+        :param bounds: Границы сетки (мин. широта, мин. долгота, макс. широта, макс. долгота).
+        :param step: Шаг сетки в градусах.
+        :return: Ничего
+        """
+        self.grid = LocationGrid(bounds, step)
+        lat, lon = self.grid.centers()
+        self.grid.counts, self.grid.distances, self.grid.ao_codes = self.compute(lat, lon)
+
+    def save(self, path=CACHE_PATH, version=""):
+        """
+        Сохраняет кэш на диск в порядке использования, плотная сетка не сохраняется.
+        :param path: Путь до npz-файла.
+        :param version: Версия исходных данных из sources_version.
+        :return: Ничего
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        keys = np.fromiter(self.slots.keys(), dtype=np.int64, count=len(self.slots))
+        slots = np.fromiter(self.slots.values(), dtype=np.int64, count=len(self.slots))
+        # файл пишется целиком во временный и подменяется, чтобы прерванная запись не портила кэш
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, keys=keys, counts=self.counts[slots], distances=self.distances[slots],
+                 ao_codes=self.ao_codes[slots], ao_names=np.array(self.ao_names, dtype=str),
+                 version=np.array(version), precision=np.array(self.precision))
+        os.replace(tmp_path, path)
+
+    def load(self, path=CACHE_PATH, version=""):
+        """
+        Загружает сохраненный кэш, если он есть и посчитан по тем же исходным данным и округлению.
+        :param path: Путь до npz-файла.
+        :param version: Версия исходных данных из sources_version.
+        :return: true, если кэш загружен, иначе false.
+        """
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if str(data["version"]) != version or int(data["precision"]) != self.precision:
+                return False
+            codes = np.array([self.ao_code(name) for name in data["ao_names"].tolist()], dtype=np.int32)
+            ao_codes = codes[data["ao_codes"]] if codes.shape[0] else data["ao_codes"]
+            self.store(data["keys"].tolist(), data["counts"], data["distances"], ao_codes)
+        return True
+
+
+class LocationGrid:
+    """
+    Плотная сетка признаков над прямоугольником: номер ячейки точки считается арифметикой,
+    значения лежат в плоских массивах.
+    """
+
+    def __init__(self, bounds=MOSCOW_BOUNDS, step=0.001):
+        """
+        :param bounds: Границы сетки (мин. широта, мин. долгота, макс. широта, макс. долгота).
+        :param step: Шаг сетки в градусах.
+        """
+        self.min_lat, self.min_lon, max_lat, max_lon = bounds
+        self.step = step
+        self.rows = int(np.ceil((max_lat - self.min_lat) / step))
+        self.cols = int(np.ceil((max_lon - self.min_lon) / step))
+        self.counts = None
+        self.distances = None
+        self.ao_codes = None
+
+    def centers(self):
+        """
+        Центры всех ячеек построчно.
+        :return: Кортеж (широты, долготы).
+        """
+        lat = self.min_lat + (np.arange(self.rows) + 0.5) * self.step
+        lon = self.min_lon + (np.arange(self.cols) + 0.5) * self.step
+        lat_grid, lon_grid = np.meshgrid(lat, lon, indexing="ij")
+        return lat_grid.ravel(), lon_grid.ravel()
+
+    def cells(self, lat, lon):
+        """
+        Номера ячеек точек.
+        :param lat: Широты без пропусков.
+        :param lon: Долготы без пропусков.
+        :return: Кортеж (маска точек внутри сетки, номера ячеек).
+        """
+        row = np.floor((lat - self.min_lat) / self.step).astype(np.int64)
+        col = np.floor((lon - self.min_lon) / self.step).astype(np.int64)
+        inside = (row >= 0) & (row < self.rows) & (col >= 0) & (col < self.cols)
+        return inside, row * self.cols + col
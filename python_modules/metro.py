@@ -0,0 +1,103 @@
+import functools
+import os
+
+import numpy as np
+import requests
+
+from python_modules import http_client
+from python_modules import preprocess
+
+METRO_DIRECTORY = "src_files"
+STATION_DTYPE = np.dtype([
+    ("lat", "f8"),
+    ("lon", "f8"),
+    ("line_id", "U16"),
+    ("station_id", "U16"),
+    ("line_name", "U64"),
+    ("station_name", "U64"),
+])
+
+
+def build_stations(metro_response):
+    """
+    Собирает станции из ответа /metro/{city_id} в структурированный массив.
+    Сначала считается количество станций, затем массив выделяется один раз и заполняется.
+    :param metro_response: Ответ API в виде словаря с ключом lines.
+    :return: Массив с полями lat, lon, line_id, station_id, line_name, station_name.
+    """
+    lines = metro_response["lines"]
+    stations = np.empty(sum(len(line["stations"]) for line in lines), dtype=STATION_DTYPE)
+    idx = 0
+    for line in lines:
+        for station in line["stations"]:
+            stations[idx] = (
+                np.nan if station.get("lat") is None else station["lat"],
+                np.nan if station.get("lng") is None else station["lng"],
+                line["id"],
+                station["id"],
+                line["name"],
+                station["name"],
+            )
+            idx += 1
+    return stations
+
+
+def fetch_metro(city_id):
+    """
+    Запрашивает линии и станции метро города.
+    :param city_id: Идентификатор конкретного города.
+    :return: Ответ API в виде словаря.
+    """
+    response = http_client.get_client().get_json(f'{http_client.API_URL}/metro/{city_id}')
+    if response is None:
+        raise requests.exceptions.HTTPError(f"Не удалось получить станции метро города {city_id}")
+    return response
+
+
+def stations_path(city_id, directory=METRO_DIRECTORY):
+    """
+    Путь до файла со станциями города.
+    :param city_id: Идентификатор конкретного города.
+    :param directory: Директория, в которой хранятся станции.
+    :return: Путь вида src_files/stations_<city_id>.npy.
+    """
+    return os.path.join(directory, f"stations_{city_id}.npy")
+
+
+def get_stations(city_id, directory=METRO_DIRECTORY, refresh=False):
+    """
+    Возвращает станции метро города. Файл создается при первом обращении, дальше он отображается в память
+    и не читается целиком.
+    :param city_id: Идентификатор конкретного города.
+    :param directory: Директория, в которой хранятся станции.
+    :param refresh: Заново скачать станции, даже если файл уже есть.
+    :return: Структурированный массив станций (memmap).
+    """
+    path = stations_path(city_id, directory)
+    if refresh or not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        np.save(path, build_stations(fetch_metro(city_id)))
+        get_stations_index.cache_clear()
+    return np.load(path, mmap_mode="r")
+
+
+def get_coordinates(stations):
+    """
+    Координаты станций в формате src_files/stations.npy: массив (n, 2) из широты и долготы.
+    Станции без координат пропускаются.
+    :param stations: Структурированный массив станций.
+    :return: Массив координат.
+    """
+    coordinates = np.column_stack([stations["lat"], stations["lon"]])
+    return coordinates[~np.isnan(coordinates).any(axis=1)]
+
+
+@functools.lru_cache(maxsize=None)
+def get_stations_index(city_id, directory=METRO_DIRECTORY):
+    """
+    Индекс станций города для preprocess.get_stations_features. Строится один раз на процесс.
+    :param city_id: Идентификатор конкретного города.
+    :param directory: Директория, в которой хранятся станции.
+    :return: Индекс из preprocess.build_stations_index.
+    """
+    return preprocess.build_stations_index(get_coordinates(get_stations(city_id, directory)))
@@ -0,0 +1,322 @@
+import itertools
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import KFold, StratifiedKFold, train_test_split
+from sklearn.naive_bayes import CategoricalNB
+from sklearn.neighbors import KNeighborsRegressor
+
+# ширина интервала зарплаты в задаче классификации, как в ноутбуке: [1, 50000] -> 1
+SALARY_BIN = 50000
+RANDOM_STATE = 123
+# модели и сетки из раздела построения модели ноутбука. task - регрессия по зарплате или классификация
+# по интервалу, numeric - использовать ли числовые признаки (классификаторы в ноутбуке учились только
+# на закодированных категориях), dense - модель не принимает разреженную матрицу
+SEARCH_SPACES = {
+    "random_forest_regressor": {
+        "estimator": RandomForestRegressor(random_state=RANDOM_STATE),
+        "task": "regression",
+        "params": {"n_estimators": [100, 200, 300], "max_depth": [None, 10, 20, 30],
+                   "min_samples_split": [2, 5, 10], "min_samples_leaf": [1, 2, 4],
+                   "max_features": [1, 10, 22, 44, 66, "sqrt"]},
+    },
+    "random_forest_classifier": {
+        "estimator": RandomForestClassifier(random_state=RANDOM_STATE),
+        "task": "classification",
+        "numeric": False,
+        "params": {"n_estimators": [100, 200, 300], "max_depth": [None, 10, 20, 30],
+                   "min_samples_split": [2, 5, 10], "min_samples_leaf": [1, 2, 4],
+                   "max_features": [1, 10, 22, 44, 66, "sqrt"]},
+    },
+    "knn_regressor": {
+        "estimator": KNeighborsRegressor(),
+        "task": "regression",
+        "params": {"n_neighbors": [5, 10, 50, 100, 250], "weights": ["uniform", "distance"]},
+    },
+    "logistic_regression": {
+        "estimator": LogisticRegression(max_iter=10000),
+        "task": "classification",
+        "numeric": False,
+        "params": {"penalty": ["l1", "l2"], "C": [0.001, 0.01, 0.1, 1, 10, 100], "solver": ["liblinear", "saga"]},
+    },
+    "categorical_nb": {
+        "estimator": CategoricalNB(min_categories=2),
+        "task": "classification",
+        "numeric": False,
+        "dense": True,
+        "params": {"alpha": [0.1, 0.5, 1.0]},
+    },
+}
+
+
+def make_target(y, task):
+    """
+    Таргет для задачи: зарплата для регрессии, номер интервала по SALARY_BIN для классификации.
+    :param y: Массив зарплат.
+    :param task: regression или classification.
+    :return: Массив таргетов.
+    """
+    return np.ceil(y / SALARY_BIN) if task == "classification" else y
+
+
+def space_matrix(X, space, numeric_count):
+    """
+    Матрица признаков в том виде, в котором ее принимает модель пространства.
+    :param X: Разреженная матрица из feature_matrix.build_feature_matrix.
+    :param space: Описание модели из SEARCH_SPACES.
+    :param numeric_count: Количество числовых столбцов в начале матрицы.
+    :return: Матрица.
+    """
+    if not space.get("numeric", True):
+        X = X[:, numeric_count:]
+    return X.toarray() if space.get("dense", False) else X
+
+
+def candidates(space, max_candidates=None, seed=RANDOM_STATE):
+    """
+    Наборы гиперпараметров пространства: вся сетка или случайные max_candidates из нее.
+    :param space: Описание модели из SEARCH_SPACES.
+    :param max_candidates: Ограничение на количество наборов.
+    :param seed: Зерно выбора.
+    :return: Список словарей параметров.
+    """
+    names = sorted(space["params"])
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space["params"][name] for name in names))]
+    if max_candidates is not None and len(grid) > max_candidates:
+        picked = np.random.default_rng(seed).choice(len(grid), max_candidates, replace=False)
+        grid = [grid[idx] for idx in sorted(picked)]
+    return grid
+
+
+def shared_splits(y, n_splits=5, test_size=0.2, seed=RANDOM_STATE):
+    """
+    Одно разбиение на обучение и тест и одни фолды кросс-валидации для всех моделей.
+    Стратификация по интервалам зарплаты, как в ноутбуке; интервалы, где меньше двух вакансий на фолд,
+    объединяются с соседним, чтобы стратификация была возможна.
+    :param y: Массив зарплат.
+    :param n_splits: Количество фолдов.
+    :param test_size: Доля тестовой выборки.
+    :param seed: Зерно разбиения.
+    :return: Кортеж (индексы обучения, индексы теста, список пар индексов (обучение, проверка) внутри обучения).
+    Индексы фолдов отсчитываются от начала обучающей выборки, а обучающие индексы фолда перемешаны, так что
+    их начало - случайная подвыборка для ранних раундов отбора.
+    """
+    classes = make_target(y, "classification")
+    values, counts = np.unique(classes, return_counts=True)
+    rare = values[counts < 2 * n_splits]
+    if len(rare):
+        # редкие интервалы (обычно самые большие зарплаты) объединяются в один
+        classes = np.where(np.isin(classes, rare), rare.min(), classes)
+    stratify = classes if np.unique(classes, return_counts=True)[1].min() >= 2 * n_splits else None
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=test_size, random_state=seed,
+                                           stratify=stratify)
+    splitter = StratifiedKFold(n_splits, shuffle=True, random_state=seed) if stratify is not None else \
+        KFold(n_splits, shuffle=True, random_state=seed)
+    rng = np.random.default_rng(seed)
+    folds = [(rng.permutation(fit_idx), val_idx) for fit_idx, val_idx in
+             splitter.split(train_idx, None if stratify is None else stratify[train_idx])]
+    return train_idx, test_idx, folds
+
+
+_worker_data = None
+
+
+def _init_search_worker(data):
+    """
+    Передает матрицы обучающей выборки, таргеты и фолды в процесс пула один раз, а не с каждой задачей.
+    :param data: Словарь из prepare_search_data.
+    :return: Ничего
+    """
+    global _worker_data
+    _worker_data = data
+
+
+def prepare_search_data(X, y, train_idx, folds, spaces, numeric_count):
+    """
+    Данные, которые нужны задачам отбора: матрица обучающей выборки в виде каждой модели и таргеты задач.
+    Матрица одного вида строится один раз и используется всеми моделями, которые ее принимают.
+    :return: Словарь.
+    """
+    matrices = {}
+    for space in spaces.values():
+        key = (space.get("numeric", True), space.get("dense", False))
+        if key not in matrices:
+            matrices[key] = space_matrix(X[train_idx], space, numeric_count)
+    targets = {task: make_target(y[train_idx], task) for task in ("regression", "classification")}
+    return {"matrices": matrices, "targets": targets, "folds": folds, "spaces": spaces}
+
+
+def evaluate_candidate(space_name, params, fold, n_resources, data=None):
+    """
+    Задача отбора: обучить модель с параметрами на первых n_resources строках обучающей части фолда
+    и оценить на проверочной части.
+    :param space_name: Название модели.
+    :param params: Гиперпараметры.
+    :param fold: Номер фолда.
+    :param n_resources: Количество обучающих строк.
+    :param data: Словарь из prepare_search_data, в процессе пула берется переданный при его создании.
+    :return: Словарь с оценкой, временем обучения и оценки.
+    """
+    if data is None:
+        data = _worker_data
+    space = data["spaces"][space_name]
+    X = data["matrices"][(space.get("numeric", True), space.get("dense", False))]
+    y = data["targets"][space["task"]]
+    fit_idx, val_idx = data["folds"][fold]
+    fit_idx = fit_idx[:n_resources]
+    estimator = clone(space["estimator"]).set_params(**params)
+    start = time.perf_counter()
+    fit_time = None
+    try:
+        estimator.fit(X[fit_idx], y[fit_idx])
+        fit_time = time.perf_counter() - start
+        start = time.perf_counter()
+        score = estimator.score(X[val_idx], y[val_idx])
+    except ValueError as e:
+        # недопустимое сочетание параметров (например, max_features больше числа признаков или n_neighbors
+        # больше числа обучающих строк, что всплывает только при оценке) получает nan, как error_score
+        # в GridSearchCV, и выбывает из отбора
+        elapsed = time.perf_counter() - start
+        return {"model": space_name, "params": params, "fold": fold, "n_resources": len(fit_idx),
+                "score": np.nan, "fit_time": elapsed if fit_time is None else fit_time,
+                "score_time": 0.0 if fit_time is None else elapsed, "error": str(e)}
+    return {"model": space_name, "params": params, "fold": fold, "n_resources": len(fit_idx), "score": score,
+            "fit_time": fit_time, "score_time": time.perf_counter() - start, "error": None}
+
+
+def refit_best(space_name, params, data=None):
+    """
+    Задача: обучить лучшую модель на всей обучающей выборке.
+    :param space_name: Название модели.
+    :param params: Гиперпараметры.
+    :param data: Словарь из prepare_search_data, в процессе пула берется переданный при его создании.
+    :return: Кортеж (название модели, обученная модель, время обучения).
+    """
+    if data is None:
+        data = _worker_data
+    space = data["spaces"][space_name]
+    X = data["matrices"][(space.get("numeric", True), space.get("dense", False))]
+    estimator = clone(space["estimator"]).set_params(**params)
+    start = time.perf_counter()
+    estimator.fit(X, data["targets"][space["task"]])
+    return space_name, estimator, time.perf_counter() - start
+
+
+def industry_report(models, X_test, y_test, industry, spaces, numeric_count):
+    """
+    Оценка моделей на тестовой выборке целиком и по каждой отрасли отдельно, как get_accuracy_for_industry
+    в ноутбуке: accuracy для классификаторов и R^2 для регрессоров.
+    :param models: Словарь {название модели: обученная модель}.
+    :param X_test: Тестовая матрица признаков.
+    :param y_test: Тестовые зарплаты.
+    :param industry: Отрасли тестовых строк.
+    :param spaces: Описания моделей.
+    :param numeric_count: Количество числовых столбцов в начале матрицы.
+    :return: DataFrame, строки - отрасли и "Все отрасли", столбцы - модели.
+    """
+    report = {}
+    for name, model in models.items():
+        space = spaces[name]
+        X = space_matrix(X_test, space, numeric_count)
+        y = make_target(y_test, space["task"])
+        scores = {"Все отрасли": model.score(X, y)}
+        for industry_name in np.unique(industry):
+            mask = industry == industry_name
+            scores[industry_name] = model.score(X[mask], y[mask])
+        report[name] = scores
+    return pd.DataFrame(report)
+
+
+def run_search(X, y, industry, numeric_count, spaces=None, n_splits=5, factor=3, min_resources=500,
+               max_candidates=None, time_budget=None, processes=None):
+    """
+    Отбор гиперпараметров всех моделей методом последовательного деления пополам (successive halving):
+    в первом раунде каждый набор параметров учится на min_resources строках каждого фолда, в следующий раунд
+    проходит лучшая 1/factor наборов, а количество строк умножается на factor. Задачи всех моделей одного раунда
+    выполняются в одном общем пуле процессов, модели не делят ядра между собой через n_jobs=-1.
+    Фолды и матрицы передаются процессам пула один раз при создании.
+    :param X: Разреженная матрица из feature_matrix.build_feature_matrix.
+    :param y: Зарплаты.
+    :param industry: Отрасли строк.
+    :param numeric_count: Количество числовых столбцов в начале матрицы (len(transformer.config["numeric"])).
+    :param spaces: Модели и сетки, по умолчанию SEARCH_SPACES.
+    :param n_splits: Количество фолдов.
+    :param factor: Во сколько раз сокращается число наборов и растет число строк от раунда к раунду.
+    :param min_resources: Количество обучающих строк в первом раунде.
+    :param max_candidates: Ограничение на количество наборов параметров каждой модели, по умолчанию вся сетка.
+    :param time_budget: Ограничение по времени в секундах. Проверяется между раундами: после превышения новые
+    раунды не начинаются, и лучшим считается лучший набор последнего завершенного раунда.
+    :param processes: Количество процессов; 0 или 1 - в текущем процессе, None - по числу ядер.
+    :return: Словарь: history - DataFrame всех задач (модель, параметры, раунд, фолд, строки, оценка, время),
+    best - {модель: {"params", "cv_score", "model"}}, report - DataFrame из industry_report, elapsed - секунды.
+    """
+    start = time.perf_counter()
+    spaces = SEARCH_SPACES if spaces is None else spaces
+    train_idx, test_idx, folds = shared_splits(y, n_splits)
+    data = prepare_search_data(X, y, train_idx, folds, spaces, numeric_count)
+    max_resources = min(len(fit_idx) for fit_idx, _ in folds)
+    # модель -> наборы параметров, которые еще участвуют в отборе
+    active = {name: candidates(space, max_candidates) for name, space in spaces.items()}
+    best = {}
+    history = []
+
+    pool = None if processes is not None and processes <= 1 else \
+        ProcessPoolExecutor(max_workers=processes, initializer=_init_search_worker, initargs=(data,))
+    try:
+        n_resources = min(min_resources, max_resources)
+        round_idx = 0
+        while active:
+            tasks = [(name, params, fold, n_resources) for name, grid in active.items()
+                     for params in grid for fold in range(n_splits)]
+            if pool is None:
+                results = [evaluate_candidate(*task, data=data) for task in tasks]
+            else:
+                results = list(pool.map(evaluate_candidate, *zip(*tasks)))
+            for result in results:
+                result["round"] = round_idx
+            history.extend(results)
+
+            scores = pd.DataFrame(results)
+            scores["key"] = scores["params"].apply(lambda params: repr(sorted(params.items())))
+            # набор, который упал хотя бы на одном фолде, в отборе не участвует
+            mean_scores = scores.groupby(["model", "key"], sort=False)["score"].agg(["mean", "count"])
+            mean_scores = mean_scores.loc[mean_scores["count"] == n_splits, "mean"]
+            budget_exceeded = time_budget is not None and time.perf_counter() - start > time_budget
+            for name in list(active):
+                by_key = {repr(sorted(params.items())): params for params in active[name]}
+                if name not in mean_scores.index.get_level_values("model"):
+                    del active[name]
+                    continue
+                ranked = mean_scores.loc[name].sort_values(ascending=False)
+                best[name] = {"params": by_key[ranked.index[0]], "cv_score": ranked.iloc[0],
+                              "n_resources": n_resources}
+                keep = math.ceil(len(ranked) / factor)
+                if keep <= 1 or n_resources >= max_resources or budget_exceeded:
+                    del active[name]
+                else:
+                    active[name] = [by_key[key] for key in ranked.index[:keep]]
+            n_resources = min(n_resources * factor, max_resources)
+            round_idx += 1
+
+        names = list(best)
+        if pool is None:
+            fitted = [refit_best(name, best[name]["params"], data=data) for name in names]
+        else:
+            fitted = list(pool.map(refit_best, names, [best[name]["params"] for name in names]))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for name, estimator, fit_time in fitted:
+        best[name]["model"] = estimator
+        best[name]["refit_time"] = fit_time
+    report = industry_report({name: best[name]["model"] for name in best}, X[test_idx], y[test_idx],
+                             industry[test_idx], spaces, numeric_count)
+    return {"history": pd.DataFrame(history), "best": best, "report": report,
+            "elapsed": time.perf_counter() - start}
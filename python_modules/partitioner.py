@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from python_modules import async_fetcher
+from python_modules import http_client
+
+# API отдает не больше 2000 вакансий на один поиск, небольшой запас нужен на вакансии,
+# появившиеся между подсчетом и скачиванием страниц
+MAX_FOUND = 1900
+# части короче этого промежутка больше не делятся
+MIN_SPAN = datetime.timedelta(minutes=10)
+# сколько раз запрашивать количество вакансий части, каждый раз со всеми повторами HttpClient
+PROBE_ATTEMPTS = 3
+
+
+def split_point(from_date, until_date):
+    """
+    Середина промежутка. Пока промежуток длиннее двух дней, середина округляется до полуночи,
+    то есть сначала промежуток делится по дням и только потом по времени.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :return: Точка деления.
+    """
+    middle = from_date + (until_date - from_date) / 2
+    if until_date - from_date >= datetime.timedelta(days=2):
+        middle = datetime.datetime.combine(middle.date(), datetime.time())
+    return middle.replace(microsecond=0)
+
+
+def merge_parts(parts, max_found=MAX_FOUND):
+    """
+    Объединяет соседние части, пока вместе в них меньше max_found вакансий, чтобы почти пустые части
+    не тратили отдельные запросы.
+    :param parts: Список кортежей (начало, конец, количество найденных вакансий) в порядке времени.
+    :param max_found: Максимальное количество вакансий в одной части.
+    :return: Список объединенных частей.
+    """
+    merged = []
+    for start, end, found in parts:
+        if merged and merged[-1][2] + found <= max_found:
+            merged[-1] = (merged[-1][0], end, merged[-1][2] + found)
+        else:
+            merged.append((start, end, found))
+    return merged
+
+
+async def partition_window_async(client, limiter, executor, area_id, industry_id, from_date, until_date,
+                                 api_url=async_fetcher.API_URL, max_found=MAX_FOUND, min_span=MIN_SPAN):
+    """
+    Делит промежуток пополам, пока в каждой части не окажется меньше max_found вакансий.
+    Количество вакансий узнается запросом с per_page=0. Часть с неизвестным количеством не планируется:
+    API отдает только первые 2000 вакансий поиска, и остальные пропали бы без предупреждения.
+    :param client: HttpClient.
+    :param limiter: Общий TokenBucket.
+    :param executor: Пул потоков для блокирующих запросов.
+    :param area_id: Регион, в котором искать.
+    :param industry_id: Отрасль вакансий.
+    :param from_date: Начало промежутка.
+    :param until_date: Конец промежутка.
+    :param api_url: Адрес API.
+    :param max_found: Максимальное количество вакансий в одной части.
+    :param min_span: Минимальная длина части.
+    :return: Список кортежей (начало, конец, количество найденных вакансий) в порядке времени.
+    :raises requests.exceptions.HTTPError: Если количество вакансий какой-то части так и не удалось узнать.
+    """
+    params = async_fetcher.vacancies_params(area_id, industry_id, from_date, until_date, per_page=0)
+    response = None
+    for _ in range(PROBE_ATTEMPTS):
+        response = await async_fetcher.fetch_json(client, limiter, executor, f'{api_url}/vacancies', params)
+        if response is not None:
+            break
+    if response is None:
+        raise requests.exceptions.HTTPError(f"Не удалось узнать количество вакансий отрасли {industry_id} "
+                                            f"в промежутке {from_date} - {until_date}")
+    found = response["found"]
+    if found <= max_found:
+        return [(from_date, until_date, found)]
+    if until_date - from_date <= min_span:
+        print(f"В промежутке {from_date} - {until_date} отрасли {industry_id} {found} вакансий, "
+              f"будут скачаны только первые {async_fetcher.MAX_PAGES * async_fetcher.PER_PAGE}")
+        return [(from_date, until_date, found)]
+    middle = split_point(from_date, until_date)
+    left, right = await asyncio.gather(
+        partition_window_async(client, limiter, executor, area_id, industry_id, from_date, middle,
+                               api_url, max_found, min_span),
+        partition_window_async(client, limiter, executor, area_id, industry_id, middle, until_date,
+                               api_url, max_found, min_span))
+    return left + right
+
+
+async def partition_window_or_none(client, limiter, executor, area_id, industry_id, from_date, until_date,
+                                   api_url=async_fetcher.API_URL, max_found=MAX_FOUND, min_span=MIN_SPAN):
+    """
+    partition_window_async, которая при ошибке запросов возвращает None, чтобы остальные промежутки
+    разбивались дальше.
+    :return: Список частей или None.
+    """
+    try:
+        return await partition_window_async(client, limiter, executor, area_id, industry_id, from_date, until_date,
+                                            api_url, max_found, min_span)
+    except requests.exceptions.RequestException as e:
+        print(f"{e}, отрасль {industry_id} будет разбита при следующем запуске")
+        return None
+
+
+async def partition_windows_async(area_id, windows, concurrency=8, requests_per_second=10,
+                                  api_url=async_fetcher.API_URL, max_found=MAX_FOUND, min_span=MIN_SPAN):
+    """
+    Адаптивно разбивает несколько промежутков одновременно.
+    :param area_id: Регион, в котором искать.
+    :param windows: Список кортежей (идентификатор_отрасли, начало, конец).
+    :param concurrency: Максимальное количество одновременных запросов.
+    :param requests_per_second: Общий бюджет запросов в секунду.
+    :param api_url: Адрес API.
+    :param max_found: Максимальное количество вакансий в одной части.
+    :param min_span: Минимальная длина части.
+    :return: Список разбиений в порядке windows, каждое - список (начало, конец, количество найденных вакансий)
+    или None, если промежуток разбить не удалось.
+    """
+    limiter = async_fetcher.TokenBucket(requests_per_second)
+    client = http_client.get_client()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        partitions = await asyncio.gather(*[
+            partition_window_or_none(client, limiter, executor, area_id, industry_id, from_date, until_date,
+                                     api_url, max_found, min_span)
+            for industry_id, from_date, until_date in windows])
+    return [None if parts is None else merge_parts(parts, max_found) for parts in partitions]
+
+
+def partition_windows(area_id, windows, concurrency=8, requests_per_second=10, api_url=async_fetcher.API_URL,
+                      max_found=MAX_FOUND, min_span=MIN_SPAN):
+    """
+    Синхронная обертка над partition_windows_async.
+    :return: Список разбиений в порядке windows, None для промежутков, которые разбить не удалось.
+    """
+    return asyncio.run(partition_windows_async(area_id, windows, concurrency, requests_per_second, api_url,
+                                               max_found, min_span))
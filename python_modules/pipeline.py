@@ -0,0 +1,219 @@
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from python_modules import instrumentation
+from python_modules import location_cache
+from python_modules import preprocess
+
+STATIONS_PATH = "src_files/stations.npy"
+DISTRICTS_PATH = "src_files/atd/mo.shp"
+
+
+@functools.lru_cache(maxsize=None)
+def get_stations_index(stations_path=STATIONS_PATH):
+    """
+    Лениво загружает станции метро и строит по ним индекс, один раз на процесс.
+    :param stations_path: Путь до файла со станциями.
+    :return: Индекс из preprocess.build_stations_index.
+    """
+    return preprocess.build_stations_index(np.load(stations_path))
+
+
+@functools.lru_cache(maxsize=None)
+def get_districts(districts_path=DISTRICTS_PATH):
+    """
+    Лениво загружает полигоны районов и строит по ним индекс, один раз на процесс.
+    :param districts_path: Путь до shp-файла с районами.
+    :return: Кортеж (геофрейм районов, индекс из preprocess.build_districts_index).
+    """
+    mo_gdf = gpd.read_file(districts_path)
+    return mo_gdf, preprocess.build_districts_index(mo_gdf)
+
+
+@functools.lru_cache(maxsize=None)
+def get_location_cache(cache_path=location_cache.CACHE_PATH):
+    """
+    Лениво создает кэш признаков местоположения, один раз на процесс, и загружает в него сохраненные значения.
+    :param cache_path: Путь до файла кэша.
+    :return: location_cache.LocationCache.
+    """
+    mo_gdf, districts_index = get_districts()
+    cache = location_cache.LocationCache(get_stations_index(), mo_gdf, districts_index)
+    cache.load(cache_path, location_cache.sources_version(STATIONS_PATH, DISTRICTS_PATH))
+    return cache
+
+
+def net_salary_stage(df):
+    """
+    Этап: зарплата на руки вместо словаря с вилкой.
+    Если в части есть плоские столбцы зарплаты из dataset_store, словари не разбираются.
+    :param df: Часть датасета.
+    :return: Часть датасета с числовым столбцом salary.
+    """
+    salary_columns = ["salary_from", "salary_to", "salary_gross", "salary_currency"]
+    if all(col in df.columns for col in salary_columns):
+        df["salary"] = preprocess.get_net_salary_vectorized(df[salary_columns])
+        return df.drop(columns=salary_columns)
+    df["salary"] = preprocess.get_net_salary_vectorized(df["salary"])
+    return df
+
+
+def professional_role_stage(df):
+    """
+    Этап: оставить только название первой профессиональной роли.
+    :param df: Часть датасета.
+    :return: Часть датасета со строковым столбцом professional_roles.
+    """
+    df["professional_roles"] = df["professional_roles"].apply(lambda x: x[0]["name"])
+    return df
+
+
+def metro_stage(df):
+    """
+    Этап: количество станций метро в радиусе километра и расстояние до ближайшей.
+    :param df: Часть датасета.
+    :return: Часть датасета со столбцами stations_within_km и distance_to_the_nearest(m).
+    """
+    features = preprocess.get_stations_features(df["lat"], df["lon"], stations_index=get_stations_index())
+    df[["stations_within_km", "distance_to_the_nearest(m)"]] = features
+    return df
+
+
+def district_stage(df):
+    """
+    Этап: административный округ Москвы.
+    :param df: Часть датасета.
+    :return: Часть датасета со столбцом AO.
+    """
+    mo_gdf, districts_index = get_districts()
+    df["AO"] = preprocess.find_AO_vectorized(df["lat"], df["lon"], mo_gdf, districts_index)
+    return df
+
+
+def location_stage(df):
+    """
+    Этап: то же, что metro_stage и district_stage вместе, но через кэш по уникальным координатам.
+    Новые координаты остаются в кэше процесса, на диск кэш сохраняет enrich_locations.
+    :param df: Часть датасета.
+    :return: Часть датасета со столбцами stations_within_km, distance_to_the_nearest(m) и AO.
+    """
+    features = get_location_cache().lookup(df["lat"], df["lon"])
+    df[location_cache.FEATURE_COLUMNS] = features
+    return df
+
+
+def enrich_locations(datasets, cache_path=location_cache.CACHE_PATH, grid=False):
+    """
+    Добавляет признаки местоположения сразу всем датасетам в текущем процессе и сохраняет кэш на диск.
+    Считаются только координаты, которых не было ни в одном из прошлых запусков, поэтому пул процессов не нужен.
+    :param datasets: Список датасетов со столбцами lat и lon, изменяются на месте.
+    :param cache_path: Путь до файла кэша.
+    :param grid: Заранее посчитать плотную сетку над Москвой (признаки внутри нее приближенные).
+    :return: Список тех же датасетов.
+    """
+    cache = get_location_cache(cache_path)
+    if grid and cache.grid is None:
+        cache.build_grid()
+    if not datasets:
+        return datasets
+    lat = pd.concat([dataset["lat"] for dataset in datasets], ignore_index=True)
+    lon = pd.concat([dataset["lon"] for dataset in datasets], ignore_index=True)
+    features = cache.lookup(lat, lon)
+    start = 0
+    for dataset in datasets:
+        part = features.iloc[start:start + len(dataset)]
+        for col in location_cache.FEATURE_COLUMNS:
+            dataset[col] = part[col].to_numpy()
+        start += len(dataset)
+    cache.save(cache_path, location_cache.sources_version(STATIONS_PATH, DISTRICTS_PATH))
+    return datasets
+
+
+def moscow_or_remote_stage(df):
+    """
+    Этап: оставить только вакансии из Москвы или с удаленной работой в графике.
+    :param df: Часть датасета.
+    :return: Отфильтрованная часть датасета.
+    """
+    return df.loc[(df["AO"] != preprocess.NOT_IN_MOSCOW) | (df["schedule"] == "Удаленная работа")]
+
+
+def remove_outliers(df):
+    """
+    Этап для всей отрасли: удалить выбросы зарплаты за полутора межквартильными размахами.
+    Границы считаются по всей отрасли, поэтому этап нельзя выполнять по частям.
+    :param df: Датасет отрасли.
+    :return: Датасет без выбросов.
+    """
+    q25, q75 = np.percentile(df["salary"], 25), np.percentile(df["salary"], 75)
+    cut_off = (q75 - q25) * 1.5
+    lower, upper = q25 - cut_off, q75 + cut_off
+    return df.loc[(df["salary"] <= upper) & (df["salary"] >= lower)]
+
+
+def run_stages(df, stages):
+    """
+    Последовательно применяет этапы к части датасета.
+    :param df: Часть датасета.
+    :param stages: Функции этапов.
+    :return: Обработанная часть.
+    """
+    df = df.copy()
+    for stage in stages:
+        df = stage(df)
+    return df
+
+
+def run_pipeline(datasets, stages, industry_stages=(), chunk_size=20000, processes=None):
+    """
+    Выполняет этапы предобработки над всеми отраслями в пуле процессов.
+    Датасеты делятся на части по chunk_size строк, части всех отраслей обрабатываются параллельно,
+    затем собираются обратно в том же порядке. Станции и полигоны загружаются в каждом процессе лениво.
+    :param datasets: Список датасетов, по одному на отрасль.
+    :param stages: Упорядоченные этапы, которые можно выполнять по частям. Функции должны быть объявлены
+    на уровне модуля, чтобы их можно было передать в другой процесс.
+    :param industry_stages: Этапы, которым нужна вся отрасль целиком (например, remove_outliers),
+    выполняются после сборки частей, тоже в пуле.
+    :param chunk_size: Количество строк в одной части.
+    :param processes: Количество процессов, по умолчанию по числу ядер.
+    :return: Список обработанных датасетов в порядке datasets.
+    """
+    if processes is None:
+        processes = os.cpu_count()
+    # этапы выполняются в других процессах, их собственные замеры туда не передаются, поэтому
+    # в отчет запуска попадает только весь пайплайн целиком
+    with instrumentation.stage("pipeline.run_pipeline", rows=sum(len(dataset) for dataset in datasets)):
+        return _run_pipeline(datasets, stages, industry_stages, chunk_size, processes)
+
+
+def _run_pipeline(datasets, stages, industry_stages, chunk_size, processes):
+    """
+    Делит датасеты на части и выполняет этапы в пуле процессов, см. run_pipeline.
+    :param datasets: Список датасетов, по одному на отрасль.
+    :param stages: Этапы, которые можно выполнять по частям.
+    :param industry_stages: Этапы, которым нужна вся отрасль целиком.
+    :param chunk_size: Количество строк в одной части.
+    :param processes: Количество процессов.
+    :return: Список обработанных датасетов в порядке datasets.
+    """
+    chunks = []
+    owners = []
+    for dataset_idx, dataset in enumerate(datasets):
+        for start in range(0, len(dataset), chunk_size):
+            chunks.append(dataset.iloc[start:start + chunk_size])
+            owners.append(dataset_idx)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        processed_chunks = list(pool.map(run_stages, chunks, [stages] * len(chunks)))
+        results = []
+        for dataset_idx, dataset in enumerate(datasets):
+            parts = [chunk for chunk, owner in zip(processed_chunks, owners) if owner == dataset_idx]
+            results.append(pd.concat(parts, ignore_index=True) if parts else dataset.iloc[0:0].copy())
+        if industry_stages:
+            results = list(pool.map(run_stages, results, [industry_stages] * len(results)))
+    return [result.reset_index(drop=True) for result in results]
@@ -1,7 +1,22 @@
 import math
 import numpy as np
 import pandas as pd
+import shapely
 from shapely.geometry import Point
+from shapely.strtree import STRtree
+from scipy.spatial import cKDTree
+
+from python_modules import instrumentation
+
+# радиус Земли, используемый в distance_in_meters
+EARTH_RADIUS = 6378137.0
+# координаты Красной площади и граничные расстояния из get_stations_count_and_distance_to_nearest
+MOSCOW_CENTER = (55.751426, 37.618879)
+MOSCOW_RADIUS = 79000
+# значение find_AO для точек, которые не попали ни в один район
+NOT_IN_MOSCOW = "Не в Москве"
+MAX_DISTANCE_TO_STATION = 52000
+NEAR_STATION_RADIUS = 1000
 
 
 def get_net_salary(salary_cell):
@@ -23,6 +38,55 @@ def get_net_salary(salary_cell):
     return salary
 
 
+@instrumentation.timed("preprocess.unpack_salary", rows_arg=0)
+def unpack_salary(salary_column, with_currency=True):
+    """
+    Распаковывает столбец со словарями зарплаты в типизированные столбцы.
+    :param salary_column: Столбец со словарями информации о зарплате.
+    :param with_currency: Распаковывать ли валюту.
+    :return: DataFrame со столбцами salary_from, salary_to (float), salary_gross (bool) и salary_currency (category).
+    """
+    index = salary_column.index if isinstance(salary_column, pd.Series) else None
+    empty = {}
+    cells = [cell or empty for cell in salary_column]
+    unpacked = {
+        "salary_from": np.array([cell.get("from") for cell in cells], dtype=float),
+        "salary_to": np.array([cell.get("to") for cell in cells], dtype=float),
+        "salary_gross": np.array([cell.get("gross") is True for cell in cells], dtype=bool),
+    }
+    if with_currency:
+        unpacked["salary_currency"] = pd.Categorical([cell.get("currency", "RUR") for cell in cells])
+    return pd.DataFrame(unpacked, index=index)
+
+
+@instrumentation.timed("preprocess.get_net_salary_vectorized", rows_arg=0)
+def get_net_salary_vectorized(salary, rates=None):
+    """
+    Векторизованная версия get_net_salary.
+    :param salary: Столбец со словарями информации о зарплате или DataFrame со столбцами salary_from, salary_to,
+    salary_gross и salary_currency (так зарплата хранится в dataset_store). Во втором случае все считается в NumPy
+    без обхода словарей.
+    :param rates: Курсы валют в рублях за единицу, например {"RUR": 1, "USD": 90.5}.
+    Если не передан, зарплата не пересчитывается, как и в get_net_salary. Зарплата в валюте,
+    которой нет в rates, становится пропуском.
+    :return: Series с чистой зарплатой.
+    """
+    if not isinstance(salary, pd.DataFrame):
+        salary = unpack_salary(salary, with_currency=rates is not None)
+    value_from = salary["salary_from"].to_numpy(dtype=float, na_value=np.nan)
+    value_to = salary["salary_to"].to_numpy(dtype=float, na_value=np.nan)
+    gross = salary["salary_gross"].to_numpy(dtype=bool, na_value=False)
+
+    # если есть только один порог, берется он, если оба - среднее
+    net_salary = np.where(np.isnan(value_from), value_to,
+                          np.where(np.isnan(value_to), value_from, (value_from + value_to) / 2))
+    net_salary = np.where(gross, net_salary * 0.87, net_salary)
+    if rates is not None:
+        currency = salary["salary_currency"].astype("category")
+        net_salary = net_salary * currency.map(rates).to_numpy(dtype=float, na_value=np.nan)
+    return pd.Series(net_salary, index=salary.index, name="salary")
+
+
 def distance_in_meters(lat1, lon1, lat2, lon2):
     """
     Рассчитать расстояние между двумя точками в метрах.
@@ -66,7 +130,7 @@ def get_stations_count_and_distance_to_nearest(lat_lng, stations):
     if lat_address is None or lon_address is None:
         return None, None
     num_stations = 0
-    nearest = np.Inf
+    nearest = np.inf
     # Самая удаленная точка от Красной площади находится примерно в 79 км от нее,
     # так что за этим радиусом определенно не Москва.
     msc_lat, msc_lng = 55.751426, 37.618879
@@ -83,6 +147,94 @@ def get_stations_count_and_distance_to_nearest(lat_lng, stations):
     return num_stations, nearest
 
 
+def distance_in_meters_vectorized(lat1, lon1, lat2, lon2):
+    """
+    Векторизованная версия distance_in_meters, принимает массивы NumPy с поддержкой broadcasting.
+    :param lat1: Широты первых точек.
+    :param lon1: Долготы первых точек.
+    :param lat2: Широты вторых точек.
+    :param lon2: Долготы вторых точек.
+    :return: Массив расстояний в метрах.
+    """
+    lat1_rad, lon1_rad = np.radians(lat1), np.radians(lon1)
+    lat2_rad, lon2_rad = np.radians(lat2), np.radians(lon2)
+    d_lat = lat2_rad - lat1_rad
+    d_lon = lon2_rad - lon1_rad
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(d_lon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def to_unit_vectors(lat, lon):
+    """
+    Переводит широту и долготу в точки на единичной сфере. Евклидово расстояние (хорда) между такими точками
+    монотонно связано с расстоянием по поверхности, поэтому по ним можно строить обычное KD-дерево.
+    :param lat: Широты точек.
+    :param lon: Долготы точек.
+    :return: Массив формы (n, 3).
+    """
+    lat_rad, lon_rad = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)])
+
+
+@instrumentation.timed("preprocess.build_stations_index", rows_arg=0)
+def build_stations_index(stations):
+    """
+    Строит KD-дерево по станциям метро. Индекс можно построить один раз и переиспользовать для всех датасетов.
+    :param stations: Массив станций формы (n, 2) из широты и долготы.
+    :return: cKDTree по координатам станций на единичной сфере.
+    """
+    stations = np.asarray(stations, dtype=float)
+    return cKDTree(to_unit_vectors(stations[:, 0], stations[:, 1]))
+
+
+@instrumentation.timed("preprocess.get_stations_features", rows_arg=0)
+def get_stations_features(lat, lon, stations=None, stations_index=None, chunk_size=1_000_000):
+    """
+    Пакетная версия get_stations_count_and_distance_to_nearest: считает количество станций метро в радиусе 1 км
+    и расстояние до ближайшей станции сразу для всех точек.
+    Точки дальше 79 км от центра Москвы и точки дальше 52 км от ближайшей станции получают пропуски.
+    :param lat: Широты точек (массив или Series, пропуски допустимы).
+    :param lon: Долготы точек.
+    :param stations: Станции в городе, используются, если не передан stations_index.
+    :param stations_index: Заранее построенный индекс из build_stations_index.
+    :param chunk_size: Сколько точек обрабатывать за раз, ограничивает потребление памяти.
+    :return: DataFrame со столбцами stations_within_km и distance_to_the_nearest(m).
+    """
+    index = lat.index if isinstance(lat, pd.Series) else None
+    lat = pd.to_numeric(pd.Series(np.asarray(lat, dtype=object)), errors="coerce").to_numpy(dtype=float)
+    lon = pd.to_numeric(pd.Series(np.asarray(lon, dtype=object)), errors="coerce").to_numpy(dtype=float)
+    if stations_index is None:
+        stations_index = build_stations_index(stations)
+    # координаты станций восстанавливаются из индекса, чтобы считать расстояние той же формулой
+    stations_xyz = stations_index.data
+    stations_lat = np.degrees(np.arcsin(np.clip(stations_xyz[:, 2], -1, 1)))
+    stations_lon = np.degrees(np.arctan2(stations_xyz[:, 1], stations_xyz[:, 0]))
+    # радиус 1 км по поверхности Земли в виде хорды на единичной сфере
+    near_chord = 2 * np.sin(NEAR_STATION_RADIUS / EARTH_RADIUS / 2)
+
+    stations_count = np.full(lat.shape[0], np.nan)
+    nearest = np.full(lat.shape[0], np.nan)
+    # Самая удаленная точка от Красной площади находится примерно в 79 км от нее,
+    # так что за этим радиусом определенно не Москва.
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    valid[valid] = distance_in_meters_vectorized(lat[valid], lon[valid], *MOSCOW_CENTER) <= MOSCOW_RADIUS
+    valid_idx = np.flatnonzero(valid)
+    for start in range(0, valid_idx.shape[0], chunk_size):
+        rows = valid_idx[start:start + chunk_size]
+        points = to_unit_vectors(lat[rows], lon[rows])
+        stations_count[rows] = stations_index.query_ball_point(points, r=near_chord, return_length=True, workers=-1)
+        _, nearest_idx = stations_index.query(points, k=1, workers=-1)
+        nearest[rows] = distance_in_meters_vectorized(lat[rows], lon[rows], stations_lat[nearest_idx],
+                                                      stations_lon[nearest_idx])
+    # наибольшее расстояние между станцие метро и точкой на карте https://yandex.ru/maps/-/CDbVuT-x
+    too_far = nearest > MAX_DISTANCE_TO_STATION
+    stations_count[too_far] = np.nan
+    nearest[too_far] = np.nan
+    return pd.DataFrame({"stations_within_km": stations_count, "distance_to_the_nearest(m)": nearest}, index=index)
+
+
 def within_a_polygon(lat, lon, polygon):
     """
     Проверяет, находится ли определенная точка внутри полигона.
@@ -106,4 +258,49 @@ def find_AO(lat_lon, mo_gdf):
     for idx in mo_gdf.index:
         if within_a_polygon(lat, lon, mo_gdf.loc[idx, "geometry"]):
             return mo_gdf.loc[idx, "ABBREV_AO"]
-    return "Не в Москве"
\ No newline at end of file
+    return NOT_IN_MOSCOW
+
+
+@instrumentation.timed("preprocess.build_districts_index", rows_arg=0)
+def build_districts_index(mo_gdf):
+    """
+    Строит STRtree по полигонам районов. Индекс строится один раз и переиспользуется для всех датасетов.
+    :param mo_gdf: Геофрейм данных, содержащий информацию о административных округах города.
+    :return: STRtree, порядок геометрий в котором совпадает с порядком строк mo_gdf.
+    """
+    return STRtree(mo_gdf.geometry.values)
+
+
+@instrumentation.timed("preprocess.find_AO_vectorized", rows_arg=0)
+def find_AO_vectorized(lat, lon, mo_gdf, districts_index=None, with_district_name=False):
+    """
+    Пакетная версия find_AO: определяет административный округ сразу для всех точек.
+    Если точка попадает в несколько полигонов, как и в find_AO, берется первый из них по порядку mo_gdf.
+    :param lat: Широты точек (массив или Series, пропуски допустимы).
+    :param lon: Долготы точек.
+    :param mo_gdf: Геофрейм данных, содержащий информацию о административных округах города.
+    :param districts_index: Заранее построенный индекс из build_districts_index.
+    :param with_district_name: Вернуть также название муниципального района (столбец NAME).
+    :return: Series с административными округами или DataFrame со столбцами AO и district.
+    """
+    index = lat.index if isinstance(lat, pd.Series) else None
+    lat = pd.to_numeric(pd.Series(np.asarray(lat, dtype=object)), errors="coerce").to_numpy(dtype=float)
+    lon = pd.to_numeric(pd.Series(np.asarray(lon, dtype=object)), errors="coerce").to_numpy(dtype=float)
+    if districts_index is None:
+        districts_index = build_districts_index(mo_gdf)
+
+    valid_idx = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+    points = shapely.points(lon[valid_idx], lat[valid_idx])
+    point_idx, polygon_idx = districts_index.query(points, predicate="within")
+    # для каждой точки оставляем полигон с наименьшим номером
+    first_polygon = np.full(lat.shape[0], len(mo_gdf))
+    np.minimum.at(first_polygon, valid_idx[point_idx], polygon_idx)
+    found = first_polygon < len(mo_gdf)
+
+    ao = np.full(lat.shape[0], NOT_IN_MOSCOW, dtype=object)
+    ao[found] = mo_gdf["ABBREV_AO"].to_numpy()[first_polygon[found]]
+    if not with_district_name:
+        return pd.Series(ao, index=index, name="AO")
+    district = np.full(lat.shape[0], NOT_IN_MOSCOW, dtype=object)
+    district[found] = mo_gdf["NAME"].to_numpy()[first_polygon[found]]
+    return pd.DataFrame({"AO": ao, "district": district}, index=index)
\ No newline at end of file
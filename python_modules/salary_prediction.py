@@ -0,0 +1,199 @@
+import functools
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+
+from python_modules import dataset_store
+from python_modules import location_cache
+from python_modules import model_search
+from python_modules import pipeline
+from python_modules import streaming_stats
+
+MODELS_PATH = 'models'
+PREDICTION_COLUMN = "predicted_salary"
+BATCH_SIZE = 5000
+
+
+def save_model(model, transformer, directory, space):
+    """
+    Сохраняет обученную модель вместе с трансформером признаков, на котором она училась.
+    Модель пишется joblib без сжатия, чтобы при загрузке ее массивы отображались с диска (mmap).
+    :param model: Обученная модель, например run_search(...)["best"][название]["model"].
+    :param transformer: feature_matrix.FeatureTransformer.
+    :param directory: Директория модели.
+    :param space: Описание модели из model_search.SEARCH_SPACES (нужны task, numeric и dense).
+    :return: Путь до директории.
+    """
+    os.makedirs(directory, exist_ok=True)
+    joblib.dump(model, os.path.join(directory, "model.joblib"))
+    joblib.dump(transformer, os.path.join(directory, "transformer.joblib"))
+    meta = {"task": space["task"], "numeric": space.get("numeric", True), "dense": space.get("dense", False),
+            "estimator": type(model).__name__}
+    with open(os.path.join(directory, "meta.json"), "w", encoding='utf-8') as outfile:
+        json.dump(meta, outfile, ensure_ascii=False, indent=2)
+    return directory
+
+
+@functools.lru_cache(maxsize=None)
+def load_model(directory):
+    """
+    Загружает модель один раз на процесс. Массивы модели (узлы деревьев леса, обучающая матрица соседей)
+    отображаются из файла, а не читаются в промежуточную копию, так что большой лес загружается быстрее
+    и занимает меньше памяти.
+    :param directory: Директория из save_model.
+    :return: Кортеж (модель, трансформер, описание).
+    """
+    model = joblib.load(os.path.join(directory, "model.joblib"), mmap_mode="r")
+    # предсказание по микробатчам в одном потоке, без пула потоков на каждый вызов
+    if hasattr(model, "n_jobs"):
+        model.n_jobs = 1
+    transformer = joblib.load(os.path.join(directory, "transformer.joblib"))
+    with open(os.path.join(directory, "meta.json"), encoding='utf-8') as infile:
+        meta = json.load(infile)
+    return model, transformer, meta
+
+
+class PredictionStats:
+    """
+    Счетчики предсказаний: количество вакансий и батчей, время и задержки батчей (квантили по скетчу).
+    """
+
+    def __init__(self):
+        self.vacancies = 0
+        self.batches = 0
+        self.seconds = 0.0
+        self.latencies = streaming_stats.QuantileSketch(seed=0)
+        self.latency_max = 0.0
+
+    def record(self, size, latency):
+        """
+        Учитывает один батч.
+        :param size: Количество вакансий в батче.
+        :param latency: Время обработки батча в секундах.
+        :return: Ничего
+        """
+        self.vacancies += size
+        self.batches += 1
+        self.seconds += latency
+        self.latencies.update([latency])
+        self.latency_max = max(self.latency_max, latency)
+
+    def summary(self):
+        """
+        Сводка по счетчикам.
+        :return: Словарь с количеством вакансий и батчей, вакансиями в секунду и задержками батча в секундах.
+        """
+        p50, p95 = self.latencies.quantile([0.5, 0.95])
+        return {"vacancies": self.vacancies, "batches": self.batches, "seconds": self.seconds,
+                "vacancies_per_second": self.vacancies / self.seconds if self.seconds else 0.0,
+                "latency_p50": p50, "latency_p95": p95, "latency_max": self.latency_max}
+
+
+class SalaryPredictor:
+    """
+    Предсказание зарплаты по очищенным вакансиям: те же этапы pipeline и то же кодирование, что при обучении,
+    затем модель. Признаки местоположения берутся из кэша location_cache по уникальным координатам.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Директория из save_model.
+        """
+        self.model, self.transformer, self.meta = load_model(directory)
+        config = self.transformer.config
+        # фильтры отбрасывают строки, а предсказание нужно для каждой вакансии батча
+        self.stages = [getattr(pipeline, name) for name in config["stages"] if name not in config.get("filters", ())]
+        self.numeric_count = len(self.transformer.config["numeric"])
+        self.stats = PredictionStats()
+
+    def predict(self, df):
+        """
+        Предсказывает зарплату для одного батча вакансий.
+        :param df: DataFrame в виде dataset_store.load_vacancies (вложенные столбцы уже разобраны).
+        :return: Массив предсказаний в порядке строк: зарплата для регрессии, для классификации - верхняя
+        граница интервала model_search.SALARY_BIN.
+        """
+        start = time.perf_counter()
+        prepared = pipeline.run_stages(df, self.stages)
+        if len(prepared) != len(df):
+            raise ValueError(f"Этапы {[stage.__name__ for stage in self.stages]} изменили количество строк: "
+                             f"{len(df)} -> {len(prepared)}")
+        X = self.transformer.transform(prepared)
+        X = model_search.space_matrix(X, self.meta, self.numeric_count)
+        predictions = np.asarray(self.model.predict(X), dtype=float)
+        if self.meta["task"] == "classification":
+            predictions = predictions * model_search.SALARY_BIN
+        self.stats.record(len(df), time.perf_counter() - start)
+        return predictions
+
+    def predict_part(self, path, batch_size=BATCH_SIZE):
+        """
+        Предсказывает зарплату для всех вакансий одного файла хранилища микробатчами.
+        :param path: Путь до файла.
+        :param batch_size: Размер микробатча.
+        :return: Кортеж (DataFrame файла как он хранится, массив предсказаний).
+        """
+        raw = dataset_store.read_part(path)
+        df = raw.copy()
+        for col in dataset_store.NESTED_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].apply(lambda x: json.loads(x) if isinstance(x, str) else x)
+        predictions = np.empty(len(df))
+        for start in range(0, len(df), batch_size):
+            batch = df.iloc[start:start + batch_size].reset_index(drop=True)
+            predictions[start:start + batch_size] = self.predict(batch)
+        return raw, predictions
+
+
+def write_part(df, path):
+    """
+    Перезаписывает файл хранилища через временный файл, чтобы прерванная запись не портила данные.
+    :param df: DataFrame в виде, в котором он хранится.
+    :param path: Путь до файла.
+    :return: Ничего
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    if path.endswith(".parquet"):
+        # файлы parquet бывают только при установленном pyarrow, который импортирует dataset_store
+        dataset_store.pq.write_table(dataset_store.pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    else:
+        df.to_json(tmp_path, orient="records", lines=True, force_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def predict_store(model_directory, root=dataset_store.DATASETS_PATH, output_root=None, column=PREDICTION_COLUMN,
+                  batch_size=BATCH_SIZE, industries=None, areas=None, overwrite=False):
+    """
+    Предсказывает зарплату для вакансий хранилища и записывает ее столбцом column в те же файлы
+    (или в копию хранилища output_root с той же структурой партиций). Файлы, в которых столбец уже есть,
+    пропускаются, так что после нового сбора размечаются только новые файлы.
+    :param model_directory: Директория из save_model.
+    :param root: Корневая директория хранилища.
+    :param output_root: Куда писать файлы с предсказаниями, по умолчанию поверх исходных.
+    :param column: Название столбца с предсказанием.
+    :param batch_size: Размер микробатча.
+    :param industries: Названия отраслей, по умолчанию все.
+    :param areas: Идентификаторы регионов, по умолчанию все.
+    :param overwrite: Пересчитать предсказания и в файлах, где они уже есть.
+    :return: SalaryPredictor со счетчиками в stats.
+    """
+    predictor = SalaryPredictor(model_directory)
+    for path in dataset_store.list_parts(root, industries, areas):
+        target = path if output_root is None else os.path.join(output_root, os.path.relpath(path, root))
+        if not overwrite and os.path.exists(target) and \
+                column in dataset_store.read_part(target, [column]).columns:
+            continue
+        raw, predictions = predictor.predict_part(path, batch_size)
+        raw[column] = predictions
+        write_part(raw, target)
+    if "location_stage" in predictor.transformer.config["stages"]:
+        # новые координаты, посчитанные location_stage, сохраняются для следующих запусков
+        pipeline.get_location_cache().save(location_cache.CACHE_PATH, location_cache.sources_version(
+            pipeline.STATIONS_PATH, pipeline.DISTRICTS_PATH))
+    return predictor
@@ -0,0 +1,342 @@
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from python_modules import dataset_store
+from python_modules import location_cache
+from python_modules import pipeline
+from python_modules import preprocess
+
+STATS_PATH = 'cache/salary_stats.pkl'
+# группировки, по которым ведется статистика зарплат; группировка пропускается, если в данных нет ее столбцов
+GROUPINGS = [("industry",), ("industry", "schedule"), ("industry", "experience"), ("industry", "AO")]
+# размер скетча квантилей: ошибка ранга порядка 1.7 / k, то есть около процента при k=200
+SKETCH_SIZE = 200
+
+
+def moscow_or_remote(df):
+    """
+    Подготовка по умолчанию для SalaryStatistics.update_from_store: признаки местоположения (в том числе AO)
+    и, как в ноутбуке и feature_matrix.DEFAULT_CONFIG, только вакансии из Москвы или с удаленной работой.
+    :param df: Часть хранилища с числовым столбцом salary.
+    :return: Отфильтрованная часть.
+    """
+    return pipeline.run_stages(df, [pipeline.location_stage, pipeline.moscow_or_remote_stage])
+
+
+class RunningMoments:
+    """
+    Количество, среднее, дисперсия (алгоритм Уэлфорда), минимум и максимум, которые обновляются частями
+    и объединяются между собой без исходных значений.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def combine(self, count, mean, m2, minimum, maximum):
+        """
+        Добавляет к моментам моменты другой части данных (формула Чана для параллельного Уэлфорда).
+        :return: Ничего
+        """
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def update(self, values):
+        """
+        Добавляет значения, пропуски игнорируются.
+        :param values: Массив значений.
+        :return: Ничего
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.shape[0]:
+            mean = values.mean()
+            self.combine(values.shape[0], mean, ((values - mean) ** 2).sum(), values.min(), values.max())
+
+    def merge(self, other):
+        """
+        Добавляет моменты другого объекта.
+        :param other: RunningMoments.
+        :return: Ничего
+        """
+        self.combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    @property
+    def variance(self):
+        """
+        Несмещенная дисперсия.
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+
+class QuantileSketch:
+    """
+    Скетч квантилей KLL: уровни хранят отсортированные выборки, элемент уровня h весит 2 ** h.
+    Когда уровень переполняется, его элементы сортируются, и каждый второй с случайным сдвигом
+    переносится на уровень выше. Размер скетча не зависит от количества значений, а два скетча
+    объединяются поуровневой склейкой.
+    """
+
+    def __init__(self, k=SKETCH_SIZE, seed=None):
+        """
+        :param k: Емкость верхнего уровня, задает точность.
+        :param seed: Зерно генератора для воспроизводимости.
+        """
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level):
+        """
+        Емкость уровня: нижние уровни меньше верхнего в (3/2) ** расстояние раз.
+        :param level: Номер уровня.
+        :return: Количество элементов.
+        """
+        return max(2, int(self.k * (2 / 3) ** (len(self.levels) - 1 - level)))
+
+    def compress(self):
+        """
+        Сжимает переполненные уровни снизу вверх.
+        :return: Ничего
+        """
+        level = 0
+        while level < len(self.levels):
+            if self.levels[level].shape[0] >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[level])
+                # при нечетном количестве один элемент остается на уровне, чтобы вес не терялся
+                even = items.shape[0] - items.shape[0] % 2
+                promoted = items[self.rng.integers(2):even:2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.levels[level] = items[even:]
+            level += 1
+
+    def update(self, values):
+        """
+        Добавляет значения, пропуски игнорируются.
+        :param values: Массив значений.
+        :return: Ничего
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.shape[0]:
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self.count += values.shape[0]
+            self.compress()
+
+    def merge(self, other):
+        """
+        Добавляет значения другого скетча.
+        :param other: QuantileSketch.
+        :return: Ничего
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.compress()
+
+    def quantile(self, q):
+        """
+        Приближенные квантили.
+        :param q: Уровень квантиля от 0 до 1 или массив уровней.
+        :return: Значение или массив значений, nan для пустого скетча.
+        """
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(level.shape[0], 2 ** h, dtype=float)
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, cumulative = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        return items[np.minimum(positions, items.shape[0] - 1)]
+
+
+class GroupSketch:
+    """
+    Моменты и квантили зарплаты одной группы.
+    """
+
+    def __init__(self, k=SKETCH_SIZE):
+        """
+        :param k: Размер скетча квантилей.
+        """
+        self.moments = RunningMoments()
+        self.quantiles = QuantileSketch(k)
+
+    def update(self, values):
+        """
+        Добавляет зарплаты группы.
+        :param values: Массив значений.
+        :return: Ничего
+        """
+        self.moments.update(values)
+        self.quantiles.update(values)
+
+    def merge(self, other):
+        """
+        Добавляет статистику той же группы, собранную отдельно.
+        :param other: GroupSketch.
+        :return: Ничего
+        """
+        self.moments.merge(other.moments)
+        self.quantiles.merge(other.quantiles)
+
+
+class SalaryStatistics:
+    """
+    Статистика зарплат по группам GROUPINGS, которая обновляется по мере поступления вакансий
+    и сохраняется на диск. Вакансии одного файла хранилища учитываются один раз; повторно собранная
+    вакансия из нового файла учитывается еще раз, так как скетчи не умеют удалять значения.
+    """
+
+    def __init__(self, groupings=GROUPINGS, k=SKETCH_SIZE):
+        """
+        :param groupings: Кортежи столбцов, по которым группировать.
+        :param k: Размер скетча квантилей.
+        """
+        self.groupings = [tuple(grouping) for grouping in groupings]
+        self.k = k
+        # группировка -> {значения столбцов: GroupSketch}
+        self.groups = {grouping: {} for grouping in self.groupings}
+        # уже учтенные файлы хранилища
+        self.seen_parts = set()
+
+    def update(self, df, salary_column="salary"):
+        """
+        Добавляет вакансии: один groupby на группировку, скетч группы обновляется массивом ее зарплат.
+        :param df: DataFrame с числовой зарплатой и столбцами группировок.
+        :param salary_column: Столбец с зарплатой.
+        :return: Ничего
+        """
+        for grouping in self.groupings:
+            if not all(col in df.columns for col in grouping):
+                continue
+            sketches = self.groups[grouping]
+            for key, salaries in df.groupby(list(grouping), observed=True, sort=False)[salary_column]:
+                key = tuple(str(value) for value in key)
+                if key not in sketches:
+                    sketches[key] = GroupSketch(self.k)
+                sketches[key].update(salaries.to_numpy(dtype=float))
+
+    def merge(self, other):
+        """
+        Добавляет статистику, собранную отдельно, например в другом процессе.
+        :param other: SalaryStatistics с теми же группировками.
+        :return: Ничего
+        """
+        for grouping, sketches in other.groups.items():
+            own = self.groups.setdefault(grouping, {})
+            for key, sketch in sketches.items():
+                if key not in own:
+                    own[key] = GroupSketch(self.k)
+                own[key].merge(sketch)
+        self.seen_parts |= other.seen_parts
+
+    def update_from_store(self, root=dataset_store.DATASETS_PATH, prepare=moscow_or_remote):
+        """
+        Учитывает только файлы хранилища, которых еще не было, не перечитывая историю.
+        :param root: Корневая директория хранилища.
+        :param prepare: Функция DataFrame -> DataFrame, которая добавляет нужные столбцы и отбирает вакансии;
+        вызывается после подсчета зарплаты на руки. По умолчанию moscow_or_remote, чтобы outlier_bounds
+        считались по тем же вакансиям, что и в pipeline.remove_outliers; None - учитывать все вакансии.
+        :return: Количество новых файлов.
+        """
+        new_parts = [path for path in dataset_store.list_parts(root) if path not in self.seen_parts]
+        for path in new_parts:
+            df = dataset_store.read_part(path)
+            salary_columns = ["salary_from", "salary_to", "salary_gross", "salary_currency"]
+            if all(col in df.columns for col in salary_columns):
+                df["salary"] = preprocess.get_net_salary_vectorized(df[salary_columns])
+            else:
+                df["salary"] = preprocess.get_net_salary_vectorized(
+                    df["salary"].apply(lambda x: json.loads(x) if isinstance(x, str) else x))
+            if prepare is not None:
+                df = prepare(df)
+            self.update(df)
+            self.seen_parts.add(path)
+        if new_parts and prepare is moscow_or_remote:
+            # новые координаты, посчитанные location_stage, сохраняются для следующих запусков
+            pipeline.get_location_cache().save(location_cache.CACHE_PATH, location_cache.sources_version(
+                pipeline.STATIONS_PATH, pipeline.DISTRICTS_PATH))
+        return len(new_parts)
+
+    def outlier_bounds(self, industry, whis=1.5):
+        """
+        Границы выбросов как в pipeline.remove_outliers, но по скетчу, без всех зарплат отрасли.
+        Совпадают с ними, если статистика собрана update_from_store с подготовкой по умолчанию.
+        :param industry: Название отрасли.
+        :param whis: Во сколько межквартильных размахов отступать от квартилей.
+        :return: Кортеж (нижняя граница, верхняя граница) или (nan, nan), если отрасли нет.
+        """
+        sketch = self.groups[("industry",)].get((str(industry),))
+        if sketch is None:
+            return np.nan, np.nan
+        q25, q75 = sketch.quantiles.quantile([0.25, 0.75])
+        cut_off = (q75 - q25) * whis
+        return q25 - cut_off, q75 + cut_off
+
+    def summary(self, grouping=("industry",), quantiles=(0.25, 0.5, 0.75)):
+        """
+        Сводка по группам без обращения к исходным данным.
+        :param grouping: Одна из группировок.
+        :param quantiles: Уровни квантилей для столбцов q25, q50, ...
+        :return: DataFrame со столбцами группировки, count, mean, std, min, квантилями и max.
+        """
+        rows = []
+        for key, sketch in self.groups[tuple(grouping)].items():
+            moments = sketch.moments
+            row = dict(zip(grouping, key))
+            row.update({"count": moments.count, "mean": moments.mean, "std": np.sqrt(moments.variance),
+                        "min": moments.min})
+            for level, value in zip(quantiles, sketch.quantiles.quantile(list(quantiles))):
+                row[f"q{round(level * 100)}"] = value
+            row["max"] = moments.max
+            rows.append(row)
+        return pd.DataFrame(rows).sort_values(list(grouping)).reset_index(drop=True) if rows else pd.DataFrame()
+
+    def save(self, path=STATS_PATH):
+        """
+        Сохраняет статистику на диск.
+        :param path: Путь до файла.
+        :return: Ничего
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", "wb") as outfile:
+            pickle.dump(self, outfile)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path=STATS_PATH, groupings=GROUPINGS, k=SKETCH_SIZE):
+        """
+        Загружает сохраненную статистику или создает пустую.
+        :param path: Путь до файла.
+        :param groupings: Группировки для новой статистики.
+        :param k: Размер скетча для новой статистики.
+        :return: SalaryStatistics.
+        """
+        if os.path.exists(path):
+            with open(path, "rb") as infile:
+                return pickle.load(infile)
+        return cls(groupings, k)
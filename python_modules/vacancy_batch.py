@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+
+# строковые признаки с небольшим числом значений хранятся кодами в словаре значений
+CATEGORY_FIELDS = ["employment", "experience", "schedule", "employer_type", "vacancy_type", "professional_roles",
+                   "salary_currency"]
+# булевы признаки упаковываются в биты одного числа на вакансию
+FLAG_FIELDS = ["is_adv_vacancy", "accept_incomplete_resumes", "accept_temporary", "response_letter_required",
+               "has_test", "premium", "archived", "employer_trusted", "has_email", "salary_gross",
+               "has_working_time_modes", "has_working_time_intervals", "has_working_days", "has_department"]
+NUMERIC_FIELDS = {
+    "id": np.int64,
+    "lat": np.float64,
+    "lon": np.float64,
+    "salary_from": np.float64,
+    "salary_to": np.float64,
+    "industries_count": np.int32,
+    "vacancies_count": np.int32,
+    "phones_count": np.int16,
+}
+# списки, которые в ноутбуке нужны только как признак "не пусто"
+LIST_FIELDS = ["working_time_modes", "working_time_intervals", "working_days"]
+
+
+def vacancy_values(vac):
+    """
+    Приводит очищенную вакансию (результат clear_data) к плоскому виду VacancyBatch.
+    Вложенные списки заменяются признаком непустоты, из профессиональных ролей остается название первой,
+    зарплата раскладывается на поля salary_*.
+    :param vac: Словарь с данными о вакансии.
+    :return: Словарь {поле: значение} для всех полей батча.
+    """
+    salary = vac.get("salary") or {}
+    roles = vac.get("professional_roles") or []
+    values = {
+        "employment": vac.get("employment"),
+        "experience": vac.get("experience"),
+        "schedule": vac.get("schedule"),
+        "employer_type": vac.get("employer_type"),
+        "vacancy_type": vac.get("vacancy_type"),
+        "professional_roles": roles[0]["name"] if roles else None,
+        "salary_currency": salary.get("currency"),
+        "salary_gross": bool(salary.get("gross")),
+        "has_department": vac.get("department") is not None,
+        "id": int(vac["id"]) if vac.get("id") is not None else -1,
+        "lat": np.nan if vac.get("lat") is None else vac["lat"],
+        "lon": np.nan if vac.get("lon") is None else vac["lon"],
+        "salary_from": np.nan if salary.get("from") is None else salary["from"],
+        "salary_to": np.nan if salary.get("to") is None else salary["to"],
+        "industries_count": vac.get("industries_count", 1),
+        "vacancies_count": vac.get("vacancies_count", 1),
+        "phones_count": vac.get("phones_count", 0),
+    }
+    for field in LIST_FIELDS:
+        values[f"has_{field}"] = bool(vac.get(field))
+    for field in FLAG_FIELDS:
+        if field not in values:
+            values[field] = bool(vac.get(field))
+    return values
+
+
+class VacancyBatch:
+    """
+    Очищенные вакансии по столбцам: числа в массивах numpy, строки - кодами в словаре значений,
+    булевы признаки - битами одного uint16 на вакансию. Вакансия занимает несколько десятков байт
+    вместо нескольких килобайт у словаря со вложенными списками.
+    Массивы растут удвоением, так что вакансии можно добавлять по одной или частями.
+    """
+    __slots__ = ("size", "columns", "flags", "categories", "category_codes")
+
+    def __init__(self, capacity=1024):
+        """
+        :param capacity: Начальное количество вакансий, под которое выделяется память.
+        """
+        self.size = 0
+        self.columns = {field: np.empty(capacity, dtype=dtype) for field, dtype in NUMERIC_FIELDS.items()}
+        self.columns.update({field: np.empty(capacity, dtype=np.int32) for field in CATEGORY_FIELDS})
+        self.flags = np.zeros(capacity, dtype=np.uint16)
+        # значения категорий в порядке появления и обратный словарь значение -> код
+        self.categories = {field: [] for field in CATEGORY_FIELDS}
+        self.category_codes = {field: {} for field in CATEGORY_FIELDS}
+
+    @classmethod
+    def from_vacancies(cls, vacancies):
+        """
+        Собирает батч из списка очищенных вакансий.
+        :param vacancies: Список словарей (результат clear_data).
+        :return: VacancyBatch.
+        """
+        batch = cls(max(1, len(vacancies)))
+        batch.extend(vacancies)
+        return batch
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, capacity):
+        """
+        Увеличивает массивы, если в них меньше capacity мест.
+        :param capacity: Нужное количество вакансий.
+        :return: Ничего
+        """
+        if capacity <= len(self.flags):
+            return
+        capacity = max(capacity, 2 * len(self.flags))
+        for field, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[field] = grown
+        flags = np.zeros(capacity, dtype=np.uint16)
+        flags[:self.size] = self.flags[:self.size]
+        self.flags = flags
+
+    def encode(self, field, value):
+        """
+        Код значения категории, новое значение добавляется в словарь.
+        :param field: Поле из CATEGORY_FIELDS.
+        :param value: Строка или None.
+        :return: Код, -1 для None.
+        """
+        if value is None:
+            return -1
+        codes = self.category_codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.categories[field])
+            self.categories[field].append(value)
+        return code
+
+    def append(self, vac):
+        """
+        Добавляет одну очищенную вакансию.
+        :param vac: Словарь с данными о вакансии.
+        :return: Ничего
+        """
+        self.reserve(self.size + 1)
+        values = vacancy_values(vac)
+        idx = self.size
+        for field in NUMERIC_FIELDS:
+            self.columns[field][idx] = values[field]
+        for field in CATEGORY_FIELDS:
+            self.columns[field][idx] = self.encode(field, values[field])
+        bits = 0
+        for bit, field in enumerate(FLAG_FIELDS):
+            if values[field]:
+                bits |= 1 << bit
+        self.flags[idx] = bits
+        self.size += 1
+
+    def extend(self, vacancies):
+        """
+        Добавляет вакансии.
+        :param vacancies: Итерируемые словари с данными о вакансиях.
+        :return: Ничего
+        """
+        if hasattr(vacancies, "__len__"):
+            self.reserve(self.size + len(vacancies))
+        for vac in vacancies:
+            self.append(vac)
+
+    def flag(self, field):
+        """
+        Распаковывает один булев признак.
+        :param field: Поле из FLAG_FIELDS.
+        :return: Булев массив.
+        """
+        return (self.flags[:self.size] >> FLAG_FIELDS.index(field)) & 1 == 1
+
+    @property
+    def nbytes(self):
+        """
+        Память под данные батча без учета словарей категорий.
+        """
+        return sum(column.nbytes for column in self.columns.values()) + self.flags.nbytes
+
+    def to_dataframe(self):
+        """
+        DataFrame с категориальными столбцами для строк и булевыми для признаков.
+        Столбцы зарплаты называются так же, как в dataset_store, так что pipeline.net_salary_stage
+        считает зарплату без разбора словарей.
+        :return: DataFrame.
+        """
+        data = {}
+        for field in NUMERIC_FIELDS:
+            data[field] = self.columns[field][:self.size].copy()
+        for field in CATEGORY_FIELDS:
+            data[field] = pd.Categorical.from_codes(self.columns[field][:self.size], self.categories[field])
+        for field in FLAG_FIELDS:
+            data[field] = self.flag(field)
+        return pd.DataFrame(data)
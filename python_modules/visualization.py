@@ -1,5 +1,109 @@
+import functools
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from python_modules import preprocess
+
+
+# проекция, в которой рисуются карты Москвы
+MAP_EPSG = 3857
+# id геофрейма -> {epsg: перепроецированный геофрейм}. Геофреймы нельзя хэшировать, поэтому вместо
+# WeakKeyDictionary запись удаляется weakref.finalize при сборке геофрейма, до того как его id может достаться
+# другому объекту
+_projected_cache = {}
+
+
+def get_projected_districts(mo_gdf, epsg=MAP_EPSG):
+    """
+    Перепроецированные полигоны районов. Проекция считается один раз на геофрейм, дальше берется из кэша.
+    :param mo_gdf: Таблица с записями административных районов и их границами.
+    :param epsg: Код проекции.
+    :return: Геофрейм со столбцами ABBREV_AO, NAME и geometry в проекции epsg.
+    """
+    key = id(mo_gdf)
+    if key not in _projected_cache:
+        _projected_cache[key] = {}
+        weakref.finalize(mo_gdf, _projected_cache.pop, key, None)
+    by_epsg = _projected_cache[key]
+    if epsg not in by_epsg:
+        by_epsg[epsg] = mo_gdf[["ABBREV_AO", "NAME", "geometry"]].to_crs(epsg=epsg)
+    return by_epsg[epsg]
+
+
+def aggregate_salaries(given_datasets, by_district=False, mo_gdf=None):
+    """
+    Средняя и медианная зарплата и количество вакансий по (отрасль, административный округ)
+    или (отрасль, муниципальный район) для всех отраслей за один groupby. Названия районов в mo_gdf уникальны,
+    а округ вакансии может не совпадать с округом ее района (например, при другом геокодировании),
+    поэтому районы группируются без округа.
+    :param given_datasets: Датасеты вакансий, отдельный датасет отвечает за одну отрасль.
+    :param by_district: Группировать также по муниципальному району.
+    :param mo_gdf: Таблица районов. Нужна, только если by_district и в датасетах нет столбца district.
+    :return: DataFrame со столбцами industry, AO или district, mean, median, count.
+    """
+    keys = ["industry", "district"] if by_district else ["industry", "AO"]
+    frames = []
+    # пространственный индекс районов строится один раз на все датасеты
+    districts_index = None
+    for dataset in given_datasets:
+        frame = dataset[[col for col in keys + ["salary"] if col in dataset.columns]]
+        if by_district and "district" not in frame.columns:
+            if mo_gdf is None:
+                raise ValueError("Для группировки по районам нужен столбец district или mo_gdf")
+            if districts_index is None:
+                districts_index = preprocess.build_districts_index(mo_gdf)
+            frame = frame.assign(district=preprocess.find_AO_vectorized(dataset["lat"], dataset["lon"], mo_gdf,
+                                                                        districts_index,
+                                                                        with_district_name=True)["district"])
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=keys + ["mean", "median", "count"])
+    return (pd.concat(frames, ignore_index=True)
+            .groupby(keys, observed=True, sort=True)["salary"]
+            .agg(["mean", "median", "count"])
+            .reset_index())
+
+
+def salary_map_values(projected, aggregated, industry, by_district=False, statistic="mean"):
+    """
+    Значения для раскраски полигонов карты одной отрасли.
+    :param projected: Геофрейм из get_projected_districts.
+    :param aggregated: Результат aggregate_salaries.
+    :param industry: Название отрасли.
+    :param by_district: Раскрашивать по муниципальным районам, а не по округам.
+    :param statistic: mean, median или count.
+    :return: Массив значений в порядке строк projected, пропуски для районов без вакансий.
+    """
+    industry_rows = aggregated.loc[aggregated["industry"] == industry]
+    if by_district:
+        values = industry_rows.set_index("district")[statistic]
+        return projected["NAME"].map(values).to_numpy(dtype=float)
+    values = industry_rows.set_index("AO")[statistic]
+    return projected["ABBREV_AO"].map(values).to_numpy(dtype=float)
+
+
+def draw_salary_map(ax, projected, values, title, legend_label):
+    """
+    Рисует раскрашенную карту на переданных осях.
+    :param ax: Оси matplotlib.
+    :param projected: Геофрейм из get_projected_districts.
+    :param values: Значения в порядке строк projected.
+    :param title: Заголовок.
+    :param legend_label: Подпись шкалы.
+    :return: Ничего
+    """
+    projected.assign(value=values).plot(column="value", linewidth=0.5, cmap='plasma', legend=True, ax=ax,
+                                        legend_kwds={"label": legend_label},
+                                        missing_kwds={"color": "lightgrey"})
+    ax.set_title(title)
+    ax.set_xticks([])
+    ax.set_yticks([])
 
 
 def visualize_avg_salary_in_moscow(given_datasets, mo_gdf):
@@ -9,34 +113,84 @@ def visualize_avg_salary_in_moscow(given_datasets, mo_gdf):
     :param mo_gdf: Таблица с записями административных районов и их границами.
     :return: None
     """
+    aggregated = aggregate_salaries(given_datasets)
+    projected = get_projected_districts(mo_gdf)
     for dataset in given_datasets:
-        adm_districts_avg_salaries = {
-            "ЦАО": 0,
-            "ЮАО": 0,
-            "ЮВАО": 0,
-            "САО": 0,
-            "ЗАО": 0,
-            "СВАО": 0,
-            "ВАО": 0,
-            "Новомосковский": 0,
-            "ЮЗАО": 0,
-            "СЗАО": 0,
-            "ЗелАО": 0,
-            "Троицкий": 0,
-            "Не в Москве": 0
-        }
-        for ao in adm_districts_avg_salaries.keys():
-            adm_districts_avg_salaries[ao] = dataset.loc[dataset["AO"] == ao, "salary"].mean()
-        df_to_salary = mo_gdf[["ABBREV_AO", "geometry"]]
-        df_to_salary["avg_salary"] = pd.Series(df_to_salary["ABBREV_AO"].apply(lambda x: adm_districts_avg_salaries[x]))
-        salaries = df_to_salary.to_crs(epsg='3857')  #непосредственно преобразование проекции
+        industry = dataset["industry"].iloc[0]
         fig, ax = plt.subplots(figsize=(15, 15))
-        salaries.plot(column='avg_salary', linewidth=0.5, cmap='plasma', legend=True, ax=ax)
-        plt.title(f'Зарплаты по районам Москвы для {dataset["industry"][0]}')
-        plt.xticks([])
-        plt.yticks([])
-        cbar = ax.get_figure().get_axes()[1]
-        cbar.set_ylabel('Средняя зарплата')
+        draw_salary_map(ax, projected, salary_map_values(projected, aggregated, industry),
+                        f'Зарплаты по районам Москвы для {industry}', 'Средняя зарплата')
+
+
+_worker_projected = None
+
+
+def _init_render_worker(projected):
+    """
+    Передает перепроецированные полигоны в процесс пула один раз, а не с каждой картой.
+    :param projected: Геофрейм из get_projected_districts.
+    :return: Ничего
+    """
+    global _worker_projected
+    _worker_projected = projected
+
+
+def render_salary_map(path, values, title, legend_label, figsize=(10, 10), dpi=100, projected=None):
+    """
+    Рисует одну карту сразу в файл. Используется Figure без pyplot, так что фигуры не копятся
+    в памяти и функция безопасна для процессов пула.
+    :param path: Путь до файла, формат определяется расширением.
+    :param values: Значения в порядке строк projected.
+    :param title: Заголовок.
+    :param legend_label: Подпись шкалы.
+    :param figsize: Размер рисунка в дюймах.
+    :param dpi: Разрешение.
+    :param projected: Геофрейм из get_projected_districts, в процессе пула берется переданный при его создании.
+    :return: Путь до файла.
+    """
+    if projected is None:
+        projected = _worker_projected
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    draw_salary_map(fig.add_subplot(), projected, values, title, legend_label)
+    fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    return path
+
+
+def render_salary_maps(given_datasets, mo_gdf, output_dir, by_district=False, statistic="mean", processes=None,
+                       file_format="png", figsize=(10, 10), dpi=100):
+    """
+    Пакетно рисует карты зарплат всех отраслей в файлы: зарплаты агрегируются одним groupby,
+    полигоны перепроецируются один раз, карты рисуются в пуле процессов.
+    :param given_datasets: Датасеты вакансий, отдельный датасет отвечает за одну отрасль.
+    :param mo_gdf: Таблица с записями административных районов и их границами.
+    :param output_dir: Директория для карт.
+    :param by_district: Раскрашивать по муниципальным районам, а не по округам.
+    :param statistic: mean, median или count.
+    :param processes: Количество процессов; 0 или 1 - рисовать в текущем процессе, None - по числу ядер.
+    :param file_format: Формат файлов, например png или svg.
+    :param figsize: Размер рисунка в дюймах.
+    :param dpi: Разрешение.
+    :return: Словарь {отрасль: путь до файла}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    aggregated = aggregate_salaries(given_datasets, by_district, mo_gdf)
+    projected = get_projected_districts(mo_gdf)
+    legend_label = {"mean": "Средняя зарплата", "median": "Медианная зарплата", "count": "Количество вакансий"}
+    tasks = []
+    for industry in aggregated["industry"].unique():
+        file_name = "".join(ch if ch.isalnum() else "_" for ch in str(industry))
+        tasks.append((os.path.join(output_dir, f"{file_name}.{file_format}"),
+                      salary_map_values(projected, aggregated, industry, by_district, statistic),
+                      f'Зарплаты по районам Москвы для {industry}', legend_label[statistic]))
+    if processes is not None and processes <= 1:
+        paths = [render_salary_map(*task, figsize=figsize, dpi=dpi, projected=projected) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_render_worker,
+                                 initargs=(projected,)) as pool:
+            paths = list(pool.map(functools.partial(render_salary_map, figsize=figsize, dpi=dpi),
+                                  *zip(*tasks))) if tasks else []
+    return dict(zip(aggregated["industry"].unique(), paths))
 
 
 def plot_yreal_ypred(y_test, y_train, y_test_hat, y_train_hat):
@@ -0,0 +1,201 @@
+import argparse
+import datetime
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import parser
+from python_modules import async_fetcher
+from python_modules import crawl_state
+from python_modules import dataset_store
+from python_modules import http_client
+from python_modules import industries
+
+# настройки по умолчанию, любую из них можно переопределить json-файлом или аргументом командной строки
+DEFAULT_CONFIG = {
+    # идентификаторы регионов https://github.com/hhru/api/blob/master/docs/areas.md
+    "areas": ["1"],
+    # количество отраслей с наибольшим числом вакансий в каждом регионе
+    "k": 3,
+    # за сколько последних дней собирать вакансии
+    "days": 55,
+    # выбирать среди подотраслей, а не среди отраслей верхнего уровня
+    "sub_industries": False,
+    # количество процессов, по умолчанию по числу ядер
+    "processes": None,
+    # одновременных запросов внутри одного процесса
+    "concurrency": 8,
+    # суммарный бюджет запросов в секунду на все процессы
+    "requests_per_second": 10,
+    "datasets_path": dataset_store.DATASETS_PATH,
+    "state_path": crawl_state.STATE_PATH,
+}
+
+
+def load_config(config_path=None, **overrides):
+    """
+    Собирает настройки сбора: значения по умолчанию, затем json-файл, затем явно переданные значения.
+    :param config_path: Путь до json-файла с настройками или None.
+    :param overrides: Настройки, которые важнее файла. Значения None пропускаются.
+    :return: Словарь настроек.
+    """
+    config = dict(DEFAULT_CONFIG)
+    if config_path is not None:
+        with open(config_path, encoding='utf-8') as infile:
+            config.update(json.load(infile))
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Неизвестные настройки: {', '.join(sorted(unknown))}")
+    config["areas"] = [str(area_id) for area_id in config["areas"]]
+    return config
+
+
+def init_worker(budget):
+    """
+    Подключает общий бюджет запросов к клиенту API процесса.
+    :param budget: http_client.RequestBudget.
+    :return: Ничего
+    """
+    http_client.get_client().budget = budget
+
+
+def plan_area(area_id, from_date, until_date, config):
+    """
+    Задание планировщика: выбрать топ-K отраслей региона и разбить их новые промежутки на части.
+    :param area_id: Регион.
+    :param from_date: Самая ранняя дата, с которой вести поиск.
+    :param until_date: Заканчивая датой.
+    :param config: Настройки сбора.
+    :return: Список кортежей (идентификатор_отрасли, название_отрасли, начало, конец, [(начало части, конец части)]).
+    """
+    top_industries = industries.get_top_k_industries(config["k"], area_id, from_date, until_date,
+                                                     config["sub_industries"], concurrency=config["concurrency"],
+                                                     requests_per_second=config["requests_per_second"])
+    names = {industry_id: name for _, industry_id, name in top_industries}
+    state = crawl_state.open_state(config["state_path"])
+    try:
+        plan = parser.plan_new_windows(area_id, list(names), from_date, until_date, state, config["concurrency"],
+                                       config["requests_per_second"])
+    finally:
+        state.close()
+    return [(industry_id, names[industry_id], start_date, end_date,
+             [(start_part, end_part) for start_part, end_part, _ in parts])
+            for industry_id, (start_date, end_date, parts) in plan.items()]
+
+
+def fetch_part(area_id, industry_id, industry_name, start_part, end_part, config):
+    """
+    Задание планировщика: скачать одну часть промежутка, очистить вакансии и записать их в партицию региона.
+    :param area_id: Регион.
+    :param industry_id: Отрасль.
+    :param industry_name: Название отрасли для хранилища.
+    :param start_part: Начало части.
+    :param end_part: Конец части.
+    :param config: Настройки сбора.
+    :return: Количество записанных вакансий или None, если не все страницы скачались.
+    """
+    state = crawl_state.open_state(config["state_path"])
+    try:
+        async_fetcher.collect_windows(area_id, [(industry_id, start_part, end_part)], config["concurrency"],
+                                      config["requests_per_second"], state=state, load_items=False)
+        if not async_fetcher.is_window_complete(state, area_id, industry_id, start_part, end_part):
+            return None
+        vacancies = parser.clear_data(crawl_state.load_items(state, area_id, industry_id, start_part, end_part))
+    finally:
+        state.close()
+    dataset_store.write_vacancies(vacancies, industry_name, config["datasets_path"], area=area_id)
+    return len(vacancies)
+
+
+def run_crawl(config, until_date=None):
+    """
+    Собирает вакансии по всем регионам из настроек в пуле процессов.
+    Задания (регион) планируют части, задания (регион, отрасль, часть) скачивают их; части региона начинают
+    скачиваться, как только он спланирован, не дожидаясь остальных регионов. Все процессы делят один
+    бюджет запросов, так что суммарная частота не превышает requests_per_second.
+    Промежуток отрасли отмечается собранным, только когда все его части записаны, иначе он докачивается
+    при следующем запуске.
+    :param config: Настройки из load_config.
+    :param until_date: Конец промежутка, по умолчанию начало сегодняшнего дня.
+    :return: Словарь {регион: {"vacancies": записано вакансий, "failed_parts": частей с ошибками}}.
+    """
+    if until_date is None:
+        until_date = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    from_date = until_date - datetime.timedelta(days=config["days"])
+    os.makedirs(config["datasets_path"], exist_ok=True)
+    summary = {area_id: {"vacancies": 0, "failed_parts": 0} for area_id in config["areas"]}
+    # (регион, отрасль) -> [начало, конец, осталось частей, были ли ошибки]
+    windows = {}
+    budget = http_client.RequestBudget(config["requests_per_second"])
+    state = crawl_state.open_state(config["state_path"])
+    with ProcessPoolExecutor(max_workers=config["processes"], initializer=init_worker,
+                             initargs=(budget,)) as pool:
+        futures = {pool.submit(plan_area, area_id, from_date, until_date, config): ("plan", area_id)
+                   for area_id in config["areas"]}
+        while futures:
+            # wait, в отличие от нового as_completed на каждой итерации, не обходит заново все ожидающие задания
+            # ради одного готового и сразу отдает все завершившиеся
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Задание {job} завершилось ошибкой: {e!r}")
+                    result = None
+
+                if job[0] == "plan":
+                    area_id = job[1]
+                    if result is None:
+                        summary[area_id]["failed_parts"] += 1
+                        continue
+                    for industry_id, industry_name, start_date, end_date, parts in result:
+                        windows[area_id, industry_id] = [start_date, end_date, len(parts), False]
+                        for start_part, end_part in parts:
+                            futures[pool.submit(fetch_part, area_id, industry_id, industry_name, start_part, end_part,
+                                                config)] = ("fetch", area_id, industry_id)
+                    print(f"Регион {area_id}: {len(result)} отраслей с новыми днями")
+                    continue
+
+                _, area_id, industry_id = job
+                window = windows[area_id, industry_id]
+                window[2] -= 1
+                if result is None:
+                    window[3] = True
+                    summary[area_id]["failed_parts"] += 1
+                else:
+                    summary[area_id]["vacancies"] += result
+                if window[2] == 0 and not window[3]:
+                    crawl_state.mark_window_finished(state, area_id, industry_id, window[0], window[1])
+    state.close()
+    return summary
+
+
+def main(argv=None):
+    """
+    Точка входа: python scheduler.py --areas 1 2 3 --k 3 --requests-per-second 10
+    :param argv: Аргументы командной строки, по умолчанию sys.argv.
+    :return: Ничего
+    """
+    arg_parser = argparse.ArgumentParser(description="Сбор вакансий hh.ru по нескольким регионам")
+    arg_parser.add_argument("--config", help="json-файл с настройками, см. DEFAULT_CONFIG")
+    arg_parser.add_argument("--areas", nargs="+", help="идентификаторы регионов")
+    arg_parser.add_argument("--k", type=int, help="количество отраслей в каждом регионе")
+    arg_parser.add_argument("--days", type=int, help="за сколько последних дней собирать вакансии")
+    arg_parser.add_argument("--sub-industries", action="store_true", default=None,
+                            help="выбирать среди подотраслей")
+    arg_parser.add_argument("--processes", type=int, help="количество процессов")
+    arg_parser.add_argument("--concurrency", type=int, help="одновременных запросов в одном процессе")
+    arg_parser.add_argument("--requests-per-second", type=float, help="общий бюджет запросов в секунду")
+    args = arg_parser.parse_args(argv)
+    config = load_config(args.config, areas=args.areas, k=args.k, days=args.days,
+                         sub_industries=args.sub_industries, processes=args.processes,
+                         concurrency=args.concurrency, requests_per_second=args.requests_per_second)
+    summary = run_crawl(config)
+    for area_id, stats in summary.items():
+        print(f"Регион {area_id}: записано вакансий {stats['vacancies']}, частей с ошибками {stats['failed_parts']}")
+
+
+if __name__ == '__main__':
+    main()